@@ -1,3 +1,35 @@
-from .clean import clean
-from .deploy import deploy
-from .plugin import show
\ No newline at end of file
+import sys as _sys
+import types as _types
+
+
+'''data-deploy: deploy data on clusters. Public functions are imported on first access, so importing this package (e.g. to run the CLI) stays cheap.'''
+
+_exports = {
+    'clean': 'data_deploy.clean',
+    'deploy': 'data_deploy.deploy',
+    'plan': 'data_deploy.deploy',
+    'show': 'data_deploy.plugin',
+}
+
+
+def __getattr__(name):
+    if name in _exports:
+        import importlib
+        value = getattr(importlib.import_module(_exports[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError('module {} has no attribute {}'.format(__name__, name))
+
+
+def __dir__():
+    return sorted(set(globals().keys()) | set(_exports.keys()))
+
+
+class _Package(_types.ModuleType):
+    def __setattr__(self, name, value):
+        # Importing submodule "data_deploy.deploy" would bind it as attribute "deploy", hiding the function with the same name.
+        if name in _exports and isinstance(value, _types.ModuleType):
+            return
+        super().__setattr__(name, value)
+
+_sys.modules[__name__].__class__ = _Package
@@ -0,0 +1,136 @@
+import time
+
+import data_deploy.internal.benchmark.dataset as dataset
+import data_deploy.internal.benchmark.results as results
+from data_deploy.internal.benchmark.cluster import LocalCluster
+from data_deploy.internal.platform.registrar import Registrar
+from data_deploy.internal.platform.platform import register_plugins
+import data_deploy.internal.remoto.ssh_wrapper as ssh_wrapper
+import data_deploy.internal.util.fs as fs
+import data_deploy.internal.util.location as loc
+from data_deploy.internal.util.printer import *
+from data_deploy.shared.report import Report
+
+
+# Destination of benchmark data, relative to the root of every simulated node.
+_dest = 'bench-data'
+
+
+def _run_once(plugin, plugin_args, cluster, wrappers, path, num_files, copy_multiplier, link_multiplier):
+    '''Deploys a dataset once, and checks whether every node received all files.
+    Returns:
+        `(bool, float, Report)`: success, wall time in seconds, and the report of the deployment.'''
+    cluster.clear(_dest)
+    state, args, kwargs = plugin.parse(list(plugin_args))
+    if not state:
+        printe('Could not parse arguments for plugin {}: {}'.format(plugin.name, plugin_args))
+        return False, 0.0, Report(plugin.name)
+    report = Report(plugin.name)
+    kwargs.update({'connectionwrappers': wrappers, 'report': report})
+    start = time.time()
+    report.finish(plugin.execute(cluster.reservation, cluster.key_path, [path], _dest, True, copy_multiplier, link_multiplier, *args, **kwargs))
+    seconds = time.time()-start
+    expected = num_files*copy_multiplier*link_multiplier
+    complete = all(fs.isdir(cluster.root(node), _dest) and fs.du(cluster.root(node), _dest)[1] == expected for node in cluster.nodes)
+    if report and not complete:
+        printe('Plugin {} reported success, but not all nodes received {} files.'.format(plugin.name, expected))
+    return bool(report) and complete, seconds, report
+
+
+def _print_table(headers, rows):
+    widths = [max(len(str(x)) for x in column) for column in zip(headers, *rows)]
+    for row in [headers]+rows:
+        print('  '.join(str(x).ljust(width) for x, width in zip(row, widths)).rstrip())
+
+
+def _format(value, fmt='{:.2f}'):
+    return '-' if value == None else fmt.format(value)
+
+
+def _print_results(compared):
+    for name in sorted(set(x[0]['dataset'] for x in compared)):
+        subset = [x for x in compared if x[0]['dataset'] == name]
+        first = subset[0][0]
+        print('\nDataset "{}": {} files, {} bytes, {} nodes'.format(name, first['files'], first['bytes'], first['nodes']))
+        rows = []
+        for result, old, change, regressed in subset:
+            status = 'FAILED' if not result['success'] else ('REGRESSION' if regressed else 'ok')
+            rows.append([result['plugin'], '{}x{}'.format(result['copy_multiplier'], result['link_multiplier']), _format(result['seconds']), _format(result['mbps']), _format(result['node_seconds_median']), _format(result['node_seconds_max']),
+                         '-' if change == None else '{:+.1f}% vs {}'.format(change*100, old['label']), status])
+        _print_table(['plugin', 'copy x link', 'seconds', 'MB/s', 'node p50 (s)', 'node max (s)', 'change', 'status'], rows)
+
+
+def benchmark(plugins=None, datasets=None, num_nodes=4, multipliers=None, repeats=1, scale=1.0, plugin_args=None, label=None, port=2222, directory=None, store=True, silent=False):
+    '''Benchmarks deployment plugins on a cluster simulated on the local machine. Prints throughput and latency tables, compared against earlier stored results.
+    Args:
+        plugins (optional list(str)): Names of plugins to benchmark. If not set, benchmarks all registered plugins.
+        datasets (optional list(str)): Names of synthetic datasets to deploy. If not set, uses all datasets. See `data_deploy.internal.benchmark.dataset.names()`.
+        num_nodes (optional int): Amount of nodes to simulate.
+        multipliers (optional list(tuple(int, int))): `(copy_multiplier, link_multiplier)` pairs to benchmark every plugin with. Defaults to `[(1, 1)]`.
+        repeats (optional int): Amount of times to run every configuration. We report the median.
+        scale (optional float): Factor to make datasets smaller or larger.
+        plugin_args (optional dict(str, list(str))): Arguments to parse with a plugin, per plugin name.
+        label (optional str): Label to store results with. Defaults to the git revision of data-deploy.
+        port (optional int): Port for the simulated nodes.
+        directory (optional str): Directory to store datasets and the simulated cluster in. Defaults to the local benchmark directory.
+        store (optional bool): If set, appends results to the local results file.
+        silent (optional bool): If set, only prints the result tables.
+
+    Returns:
+        list of `dict` results on success, `False` if we could not set up the benchmark.'''
+    registrar = Registrar()
+    register_plugins(registrar)
+    plugins = plugins or registrar.names
+    unknown = [x for x in plugins if not x in registrar]
+    if any(unknown):
+        printe('Could not find plugins: {}'.format(', '.join(unknown)))
+        return False
+    datasets = datasets or dataset.names()
+    multipliers = multipliers or [(1, 1)]
+    plugin_args = plugin_args or dict()
+    label = label or results.default_label()
+    directory = directory or loc.benchmark_dir()
+
+    generated = dict()
+    for name in datasets:
+        if not silent:
+            print('Preparing dataset "{}"...'.format(name))
+        generated[name] = dataset.generate(name, fs.join(directory, 'datasets'), scale=scale)
+
+    collected = []
+    with LocalCluster(num_nodes, fs.join(directory, 'cluster'), port=port) as cluster:
+        if not cluster.start():
+            return False
+        wrappers = ssh_wrapper.get_wrappers(cluster.nodes, lambda node: node.ip_public, ssh_params=cluster.ssh_params, silent=True)
+        try:
+            if not all(x and x.open for x in wrappers.values()):
+                printe('Could not connect to all simulated nodes.')
+                return False
+            for name in datasets:
+                path, size, num_files = generated[name]
+                for plugin_name in plugins:
+                    plugin = registrar.get(plugin_name)
+                    for copy_multiplier, link_multiplier in multipliers:
+                        if not silent:
+                            print('Benchmarking {} on "{}" with multipliers {}x{}...'.format(plugin_name, name, copy_multiplier, link_multiplier))
+                        runs = [_run_once(plugin, plugin_args.get(plugin_name, []), cluster, wrappers, path, num_files, copy_multiplier, link_multiplier) for _ in range(repeats)]
+                        seconds = results.median([x[1] for x in runs])
+                        transfer = runs[-1][2].to_dict()['stages'].get('transfer', {'nodes': {}})
+                        node_seconds = [x['seconds'] for x in transfer['nodes'].values()]
+                        collected.append({
+                            'label': label, 'time': time.time(), 'plugin': plugin_name, 'dataset': name, 'nodes': num_nodes,
+                            'copy_multiplier': copy_multiplier, 'link_multiplier': link_multiplier, 'bytes': size, 'files': num_files,
+                            'success': all(x[0] for x in runs), 'seconds': seconds, 'mbps': size*num_nodes/seconds/(1000*1000) if seconds else None,
+                            'node_seconds_median': results.median(node_seconds), 'node_seconds_max': max(node_seconds) if node_seconds else None,
+                            'stages': {k: v['seconds'] for k, v in runs[-1][2].to_dict()['stages'].items()},
+                        })
+            cluster.clear(_dest)
+        finally:
+            ssh_wrapper.close_wrappers(wrappers)
+
+    _print_results(results.compare(collected, results.load()))
+    if store:
+        results.store(collected)
+        if not silent:
+            print('\nStored results with label "{}" in {}'.format(label, results.results_path()))
+    return collected
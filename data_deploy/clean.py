@@ -1,12 +1,14 @@
-import concurrent.futures
 import os
 
 import remoto
 
 import data_deploy.internal.defaults.deploy as defaults
+import data_deploy.shared.trash as trash
 from data_deploy.internal.platform.registrar import Registrar
 from data_deploy.internal.platform.platform import register_plugins
+from data_deploy.internal.remoto.agent import get_agent
 from data_deploy.internal.remoto.ssh_wrapper import get_wrapper, get_wrappers, close_wrappers
+import data_deploy.internal.util.engine as _engine
 from data_deploy.internal.util.printer import *
 
 def _clean_dest(dest):
@@ -28,19 +30,29 @@ def _merge_kwargs(x, y):
     return z
 
 
-def _clean_internal(connectionwrappers, paths, sudo):
-    with concurrent.futures.ThreadPoolExecutor(max_workers=len(connectionwrappers)) as executor:
-        futures_rm = [executor.submit(remoto.process.check, connectionwrapper.connection, '{}rm -rf {}'.format('sudo ' if sudo else '', path), shell=True) for connectionwrapper in connectionwrappers.values() for path in paths]
-        return all(x.result()[2] == 0 for x in futures_rm)
+async def _clean_node(engine, connection, paths, sudo, instant):
+    if sudo: # The remote agent runs as the connecting user, so we need a separate command here.
+        results = await engine.map(lambda path: engine.call(remoto.process.check, connection, 'sudo rm -rf {}'.format(path), shell=True), paths)
+        return all(x[2] == 0 for x in results)
+    ops = trash.trash_ops(paths) if instant else [('rm', path) for path in paths]
+    return await engine.call(lambda: get_agent(connection).check(ops))
 
 
-def clean(reservation, key_path=None, connectionwrappers=None, paths=[], sudo=False, silent=False):
+def _clean_internal(connectionwrappers, paths, sudo, instant=False):
+    engine = _engine.default()
+    async def clean_all():
+        return all(await engine.map(lambda wrapper: _clean_node(engine, wrapper.connection, paths, sudo, instant), connectionwrappers.values()))
+    return engine.run(clean_all())
+
+
+def clean(reservation, key_path=None, connectionwrappers=None, paths=[], sudo=False, instant=False, silent=False):
     '''Deploy data using the CLI. Loads plugin with given `plugin` name, parses args, executes.
     Args:
         key_path (optional str): If set, uses given key to connect to remote nodes.
         connectionwrappers (optional dict(metareserve.Node, RemotoSSHWrapper)): If set, uses given connections, instead of building new ones.
         paths (optional list): Remote data paths to remove.
         sudo (optional bool): If set, uses sudo to clean remote paths.
+        instant (optional bool): If set, moves remote paths to a trash directory and returns immediately. The trash is deleted in the background, in parallel. Not supported with `sudo`.
         silent (optional bool): If set, does not print so much.
 
     Returns:
@@ -61,7 +73,9 @@ def clean(reservation, key_path=None, connectionwrappers=None, paths=[], sudo=Fa
             close_wrappers(connectionwrappers)
         return True
 
-    retval = _clean_internal(connectionwrappers, [_clean_dest(x) for x in paths], sudo)
+    if instant and sudo:
+        printw('Instant cleaning is not supported with sudo. Removing paths directly.')
+    retval = _clean_internal(connectionwrappers, [_clean_dest(x) for x in paths], sudo, instant=instant)
     if local_connections:
         close_wrappers(connectionwrappers)
     if not silent:
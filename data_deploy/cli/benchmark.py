@@ -0,0 +1,45 @@
+import data_deploy.internal.benchmark.dataset as dataset
+
+
+'''CLI module to benchmark deployment plugins on a cluster simulated on the local machine.'''
+
+def _multiplier(string):
+    copy_multiplier, link_multiplier = (int(x) for x in string.lower().split('x'))
+    if copy_multiplier < 1 or link_multiplier < 1:
+        raise ValueError(string)
+    return copy_multiplier, link_multiplier
+
+
+def subparser(subparsers):
+    '''Register subparser modules'''
+    benchmarkparser = subparsers.add_parser('benchmark', help='benchmark deployment plugins on a simulated local cluster.')
+    benchmarkparser.add_argument('--plugins', metavar='name', nargs='+', default=None, help='Plugins to benchmark (default=all plugins).')
+    benchmarkparser.add_argument('--datasets', metavar='name', nargs='+', choices=dataset.names(), default=None, help='Synthetic datasets to deploy (default=all). Options: {}.'.format(', '.join(dataset.names())))
+    benchmarkparser.add_argument('--nodes', metavar='amount', dest='num_nodes', type=int, default=4, help='Amount of nodes to simulate (default=4). Every node is a sshd process on its own loopback address.')
+    benchmarkparser.add_argument('--multipliers', metavar='CxL', nargs='+', type=_multiplier, default=[(1, 1)], help='Copy and link multiplier pairs to benchmark every plugin with, e.g. "1x1 2x1 1x4" (default=1x1).')
+    benchmarkparser.add_argument('--repeats', metavar='amount', type=int, default=1, help='Amount of times to run every configuration. We report the median (default=1).')
+    benchmarkparser.add_argument('--scale', metavar='factor', type=float, default=1.0, help='Factor to make datasets smaller or larger (default=1.0).')
+    benchmarkparser.add_argument('--label', metavar='label', type=str, default=None, help='Label to store results with, e.g. a version (default=git revision). Results are compared against the latest results with another label.')
+    benchmarkparser.add_argument('--port', metavar='port', type=int, default=2222, help='Port for simulated nodes to listen on (default=2222).')
+    benchmarkparser.add_argument('--startup', help='If set, benchmarks CLI startup instead: runs cheap commands (e.g. "-h", "plugin") in fresh interpreters, and fails if their median wall time passes the budget, or if they import heavy modules (e.g. remoto).', action='store_true')
+    benchmarkparser.add_argument('--budget', metavar='ms', type=float, default=150, help='Startup budget per command for --startup, in milliseconds (default=150).')
+    benchmarkparser.add_argument('--no-store', dest='store', help='If set, does not store results.', action='store_false')
+    benchmarkparser.add_argument('--silent', help='If set, only result tables are shown.', action='store_true')
+    return [benchmarkparser]
+
+
+def deploy_args_set(args):
+    '''Indicates whether we will handle command parse output in this module.
+    `deploy()` function will be called if set.
+
+    Returns:
+        `True` if we found arguments used by this subsubparser, `False` otherwise.'''
+    return args.command == 'benchmark'
+
+
+def deploy(parsers, args):
+    if args.startup:
+        import data_deploy.internal.benchmark.startup as startup
+        return startup.measure(runs=max(5, args.repeats), budget=args.budget/1000, silent=args.silent)
+    from data_deploy.benchmark import benchmark as _benchmark
+    return _benchmark(plugins=args.plugins, datasets=args.datasets, num_nodes=args.num_nodes, multipliers=args.multipliers, repeats=args.repeats, scale=args.scale, label=args.label, port=args.port, store=args.store, silent=args.silent)
@@ -1,5 +1,3 @@
-from data_deploy.clean import clean
-import data_deploy.cli.util as _cli_util
 import data_deploy.internal.defaults.deploy as defaults
 
 
@@ -10,6 +8,7 @@ def subparser(subparsers):
     cleanparser = subparsers.add_parser('clean', help='Clean data on a cluster.')
     cleanparser.add_argument('--paths', metavar='paths', nargs='+', default=[defaults.remote_dir()], help='Remote paths to remove  (default={}). Wildcards are forwarded. Pointed locations can be files or directories. Separate locations using spaces.'.format(defaults.remote_dir()))
     cleanparser.add_argument('--sudo', help='If set, uses sudo to clean.', action='store_true')
+    cleanparser.add_argument('--instant', help='If set, moves paths to a trash directory and returns immediately. Nodes delete the trash in the background, in parallel. Not supported with --sudo.', action='store_true')
     cleanparser.add_argument('--silent', help='If set, less boot output is shown.', action='store_true')
     return [cleanparser]
 
@@ -24,5 +23,7 @@ def deploy_args_set(args):
 
 
 def deploy(parsers, args):
+    from data_deploy.clean import clean
+    import data_deploy.cli.util as _cli_util
     reservation = _cli_util.read_reservation_cli()
-    return clean(reservation, key_path=args.key_path, paths=args.paths, sudo=args.sudo, silent=args.silent) if reservation else False
\ No newline at end of file
+    return clean(reservation, key_path=args.key_path, paths=args.paths, sudo=args.sudo, instant=args.instant, silent=args.silent) if reservation else False
\ No newline at end of file
@@ -1,4 +1,3 @@
-from data_deploy.deploy import deploy_cli
 import data_deploy.internal.defaults.deploy as defaults
 
 
@@ -11,9 +10,13 @@ def subparser(subparsers):
     deployparser.add_argument('--dest', metavar='path', type=str, default=defaults.remote_dir(), help='Destination path on host (default={}). Any non-existing directories on the remote will be created.'.format(defaults.remote_dir()))
     deployparser.add_argument('--copy-multiplier', metavar='amount', dest='copy_multiplier', type=int, default=1, help='Copy multiplier (default=1). Every file will be copied "amount"-1 times on the remote, to make the data look "amount" times larger. This multiplier is applied first.')
     deployparser.add_argument('--link-multiplier', metavar='amount', dest='link_multiplier', type=int, default=1, help='Link multiplier (default=1). Every file will receive "amount"-1 hardlinks on the remote, to make the data look "amount" times larger. This multiplier is applied second. Note that we first apply the copy multiplier, meaning: the link multiplier is applied on copies of files, i.e. the dataset inflation stacks.')
+    deployparser.add_argument('--resume', help='If set, resumes an earlier, failed or interrupted deployment with the same plugin, nodes, paths and destination: Only unfinished work is redone. Requires plugin support (e.g. "star", "star_remote").', action='store_true')
+    deployparser.add_argument('--retries', metavar='amount', type=int, default=defaults.retries(), help='Amount of times to retry a failed transfer, with exponential backoff (default={}). Requires plugin support.'.format(defaults.retries()))
 
+    deployparser.add_argument('--report', metavar='path', dest='report_path', type=str, default=None, help='If set, writes a JSON report with timings, bytes and files per stage and per node to given path.')
+    deployparser.add_argument('--plan', help='If set, does not deploy, but prints a plan: bytes and files every node receives and stores (including multipliers), free space on every node, and estimated durations from earlier deployments. Transfers nothing.', action='store_true')
     deployparser.add_argument('--silent', help='If set, less boot output is shown.', action='store_true')
-    deployparser.add_argument('plugin', metavar='name', type=str, help='Plugin to use for deployment. Use "data-deploy plugin" to list available plugins.')
+    deployparser.add_argument('plugin', metavar='name', type=str, help='Plugin to use for deployment. Use "data-deploy plugin" to list available plugins. Use "auto" to probe the network and pick the plugin with the lowest predicted completion time.')
     deployparser.add_argument('args', metavar='args', nargs='*', help='Arguments for the plugin. Use "data-deploy <plugin_name> -- -h" to see possible arguments.')
     return [deployparser]
 
@@ -28,4 +31,5 @@ def deploy_args_set(args):
 
 
 def deploy(parsers, args):
-    return deploy_cli(key_path=args.key_path, paths=args.paths, dest=args.dest, silent=args.silent, copy_multiplier=args.copy_multiplier, link_multiplier=args.link_multiplier, plugin=args.plugin, args=args.args)
\ No newline at end of file
+    from data_deploy.deploy import deploy_cli
+    return deploy_cli(key_path=args.key_path, paths=args.paths, dest=args.dest, silent=args.silent, copy_multiplier=args.copy_multiplier, link_multiplier=args.link_multiplier, plugin=args.plugin, args=args.args, resume=args.resume, retries=args.retries, report_path=args.report_path, plan=args.plan)
\ No newline at end of file
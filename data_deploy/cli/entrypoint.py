@@ -12,10 +12,11 @@ import data_deploy
 
 
 def _get_modules():
+    import data_deploy.cli.benchmark as benchmark
     import data_deploy.cli.clean as clean
     import data_deploy.cli.deploy as deploy
     import data_deploy.cli.plugin as plugin
-    return [deploy, clean, plugin]
+    return [deploy, clean, plugin, benchmark]
 
 
 def generic_args(parser):
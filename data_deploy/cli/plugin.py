@@ -1,8 +1,3 @@
-import data_deploy.plugin as plugin
-
-from data_deploy.internal.util.printer import *
-
-
 '''CLI module to show plugins for this tool.'''
 
 def subparser(subparsers):
@@ -20,4 +15,5 @@ def deploy_args_set(args):
     return args.command == 'plugin'
 
 def deploy(parsers, args):
+    import data_deploy.plugin as plugin
     return plugin.show()
\ No newline at end of file
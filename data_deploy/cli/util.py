@@ -1,8 +1,8 @@
-from metareserve import Reservation as _Reservation
-from rados_deploy.internal.util.printer import *
+from data_deploy.internal.util.printer import *
 
 def read_reservation_cli():
     '''Read `metareserve.Reservation` from user input.'''
+    from metareserve import Reservation as _Reservation
     print('Paste Reservation string here. Use <enter> twice to finish.')
     lines = []
     while True:
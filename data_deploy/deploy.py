@@ -2,9 +2,22 @@ import os
 
 import data_deploy.cli.util as _cli_util
 import data_deploy.internal.defaults.deploy as defaults
+import data_deploy.internal.planning.history as history
+import data_deploy.internal.planning.plan as _plan
+import data_deploy.internal.planning.probe as probe
+import data_deploy.internal.planning.scan as scan
+import data_deploy.internal.planning.selection as selection
 from data_deploy.internal.platform.registrar import Registrar
 from data_deploy.internal.platform.platform import register_plugins
+import data_deploy.internal.remoto.ssh_wrapper as ssh_wrapper
+import data_deploy.internal.util.engine as engine
+import data_deploy.internal.util.fs as fs
 from data_deploy.internal.util.printer import *
+from data_deploy.shared.report import Report
+
+
+# Name to pass as plugin to pick a plugin automatically.
+auto_plugin = 'auto'
 
 
 def _clean_dest(dest):
@@ -20,7 +33,68 @@ def _clean_dest(dest):
     return dest
 
 
-def deploy_cli(key_path=None, paths=[], dest=defaults.remote_dir(), silent=False, copy_multiplier=1, link_multiplier=1, plugin=None, args=None):
+def _merge_kwargs(x, y):
+    z = x.copy()
+    z.update(y)
+    return z
+
+
+def _connect(reservation, key_path, silent, report=None):
+    '''Connects to all nodes, with the same ssh options plugins use.'''
+    ssh_kwargs = {'IdentitiesOnly': 'yes', 'StrictHostKeyChecking': 'no'}
+    if key_path:
+        ssh_kwargs['IdentityFile'] = key_path
+    return ssh_wrapper.get_wrappers(reservation.nodes, lambda node: node.ip_public, ssh_params=lambda node: _merge_kwargs(ssh_kwargs, {'User': node.extra_info['user']}), silent=silent, report=report)
+
+
+def _execute_auto(registrar, reservation, key_path, paths, dest, silent, copy_multiplier, link_multiplier, **kwargs):
+    '''Probes the network, predicts the completion time of every plugin with a cost model, and executes the plugin with the lowest prediction.
+    The chosen plugin and all predictions are always printed, for review.'''
+    report = kwargs.get('report')
+    wrappers = _connect(reservation, key_path, silent, report=report)
+    try:
+        if not all(x and x.open for x in wrappers.values()):
+            printe('Could not connect to all nodes.')
+            return False
+        network = probe.measure(wrappers, silent=silent)
+        if not network:
+            return False
+        sizes = [fs.du(path) for path in paths]
+        size, num_files = sum(x[0] for x in sizes), sum(x[1] for x in sizes)
+        predictions = selection.predict(registrar, network, size, num_files, len(wrappers), silent=silent)
+        if not any(x[3] != None for x in predictions):
+            printe('No plugin has a cost model, so we cannot pick one automatically.')
+            return False
+        plugin, args, plugin_kwargs, seconds = predictions[0]
+        print('Predicted completion times for {} bytes in {} files to {} nodes ({}):\n{}'.format(size, num_files, len(wrappers), network, selection.format_predictions(predictions)))
+        print('Picked plugin "{}" (predicted {:.2f}s).'.format(plugin.name, seconds))
+        if report != None:
+            report.plugin = plugin.name
+        plugin_kwargs.update(kwargs)
+        plugin_kwargs['connectionwrappers'] = wrappers
+        return plugin.execute(reservation, key_path, paths, dest, silent, copy_multiplier, link_multiplier, *args, **plugin_kwargs)
+    finally:
+        ssh_wrapper.close_wrappers(wrappers)
+
+
+def _plan_internal(registrar, reservation, key_path, paths, dest, copy_multiplier, link_multiplier, plugin, silent, rescan=False):
+    scanned = scan.scan(paths, rescan=rescan)
+    wrappers = _connect(reservation, key_path, silent)
+    try:
+        if not all(x and x.open for x in wrappers.values()):
+            printe('Could not connect to all nodes.')
+            return False
+        planned = _plan.build(engine.default().executor, wrappers, scanned, dest, copy_multiplier, link_multiplier, registrar.names if plugin == auto_plugin else [plugin])
+    finally:
+        ssh_wrapper.close_wrappers(wrappers)
+    print(_plan.format(planned))
+    if not _plan.ok(planned):
+        printw('Not all nodes have enough free space for this deployment.')
+        return False
+    return True
+
+
+def deploy_cli(key_path=None, paths=[], dest=defaults.remote_dir(), silent=False, copy_multiplier=1, link_multiplier=1, plugin=None, args=None, resume=False, retries=defaults.retries(), report_path=None, plan=False):
     '''Deploy data using the CLI. Loads plugin with given `plugin` name, parses args, executes.
     Args:
         key_path (optional str): If set, uses given key to connect to remote nodes.
@@ -28,22 +102,32 @@ def deploy_cli(key_path=None, paths=[], dest=defaults.remote_dir(), silent=False
         silent (optional bool): If set, does not print so much.
         copy_multiplier (optional int): If set to a value X, makes the dataset X times larger by adding X-1 copies for every file. Applied first.
         link_multiplier (optional int): If set to a value X, makes the dataset X times larger by adding X-1 hardlinks for every file. Applied second.
-        plugin (optinal str): Plugin name to load.
-        args (optional list(str)): Arguments to parse with plugin.
+        plugin (optinal str): Plugin name to load. If "auto", probes the network and picks the plugin with the lowest predicted completion time, using its default arguments.
+        args (optional list(str)): Arguments to parse with plugin. Not used with plugin "auto".
+        resume (optional bool): If set, resumes an earlier deployment with the same plugin, nodes, paths and destination, redoing only unfinished work. Requires plugin support.
+        retries (optional int): Amount of times to retry failed transfers. Requires plugin support.
+        report_path (optional str): If set, writes the deployment report as JSON to this path.
+        plan (optional bool): If set, only prints a plan of the deployment, without transferring anything. See `plan()`.
 
     Returns:
-        `True` on success, `False` on failure.'''
+        `Report` of the deployment, evaluating to `True` on success. `False` if we could not start the deployment.
+        If `plan` is set, returns `True` if all nodes have enough free space, `False` otherwise.'''
     registrar = Registrar()
     register_plugins(registrar)
     if not silent:
         print('Found {} plugins.'.format(len(registrar)))
 
-    if not plugin in registrar.names:
+    if plugin == auto_plugin:
+        if args:
+            printw('Plugin "{}" picks a plugin with default arguments. Ignoring arguments: {}'.format(auto_plugin, args))
+        state, args, kwargs = True, [], dict()
+    elif not plugin in registrar:
         printe('Could not find a plugin named "{}"'.format(plugin))
         return False
-    plugin = registrar.get(plugin)
-    print('Plugin fetched: {}'.format(plugin.path))
-    state, args, kwargs = plugin.parse(args)
+    else:
+        plugin = registrar.get(plugin)
+        print('Plugin fetched: {}'.format(plugin.path))
+        state, args, kwargs = plugin.parse(args)
     if not state:
         printe('Could not parse provided arguments: {}'.format(args))
         return False
@@ -54,7 +138,22 @@ def deploy_cli(key_path=None, paths=[], dest=defaults.remote_dir(), silent=False
         printw('No paths to data given.')
         return False
     dest = _clean_dest(dest)
-    return plugin.execute(reservation, key_path, paths, dest, silent, copy_multiplier, link_multiplier, *args, **kwargs)
+    if plan:
+        return _plan_internal(registrar, reservation, key_path, paths, dest, copy_multiplier, link_multiplier, auto_plugin if plugin == auto_plugin else plugin.name, silent)
+    report = Report(auto_plugin if plugin == auto_plugin else plugin.name)
+    kwargs.update({'resume': resume, 'retries': retries, 'report': report})
+    if plugin == auto_plugin:
+        report.finish(_execute_auto(registrar, reservation, key_path, paths, dest, silent, copy_multiplier, link_multiplier, **kwargs))
+    else:
+        report.finish(plugin.execute(reservation, key_path, paths, dest, silent, copy_multiplier, link_multiplier, *args, **kwargs))
+    history.record(report)
+    if not silent:
+        print(report.summary())
+    if report_path:
+        report.write(report_path)
+        if not silent:
+            print('Wrote deployment report to {}'.format(report_path))
+    return report
 
 
 def deploy(reservation, key_path=None, paths=[], dest=defaults.remote_dir(), silent=False, copy_multiplier=1, link_multiplier=1, plugin=None, *args, **kwargs):
@@ -65,19 +164,19 @@ def deploy(reservation, key_path=None, paths=[], dest=defaults.remote_dir(), sil
         silent (optional bool): If set, does not print so much.
         copy_multiplier (optional int): If set to a value X, makes the dataset X times larger by adding X-1 copies for every file. Applied first.
         link_multiplier (optional int): If set to a value X, makes the dataset X times larger by adding X-1 hardlinks for every file. Applied second.
-        plugin (optinal str): Plugin name to load.
-        args (optional list(str)): Arguments to pass to plugin.
-        kwargs (optional dict(str, any)): Keyword arguments to pass to plugin.
+        plugin (optinal str): Plugin name to load. If "auto", probes the network and picks the plugin with the lowest predicted completion time.
+        args (optional list(str)): Arguments to pass to plugin. Not used with plugin "auto".
+        kwargs (optional dict(str, any)): Keyword arguments to pass to plugin. Plugins supporting it accept `resume` (bool) to resume an earlier deployment, and `retries` (int) to set the amount of retries for failed transfers.
 
     Returns:
-        `True` on success, `False` on failure.'''
+        `Report` of the deployment, with timings, bytes and files per stage and per node. It evaluates to `True` on success. `False` if we could not start the deployment.'''
     if plugin == None:
         raise ValueError('Caller must specify plugin to use to deploy data.')
     registrar = Registrar()
     register_plugins(registrar)
     print('Found {} plugins.'.format(len(registrar)))
 
-    if not plugin in registrar.names:
+    if plugin != auto_plugin and not plugin in registrar:
         printe('Could not find a plugin named "{}"'.format(plugin))
         return False
 
@@ -86,5 +185,37 @@ def deploy(reservation, key_path=None, paths=[], dest=defaults.remote_dir(), sil
         return False
     dest = _clean_dest(dest)
     print('Cleaned dest: {}'.format(dest))
-    plugin = registrar.get(plugin)
-    return plugin.execute(reservation, key_path, paths, dest, silent, copy_multiplier, link_multiplier, *args, **kwargs)
\ No newline at end of file
+    report = Report(plugin)
+    kwargs['report'] = report
+    if plugin == auto_plugin:
+        report.finish(_execute_auto(registrar, reservation, key_path, paths, dest, silent, copy_multiplier, link_multiplier, **kwargs))
+    else:
+        report.finish(registrar.get(plugin).execute(reservation, key_path, paths, dest, silent, copy_multiplier, link_multiplier, *args, **kwargs))
+    history.record(report)
+    return report
+
+
+def plan(reservation, key_path=None, paths=[], dest=defaults.remote_dir(), copy_multiplier=1, link_multiplier=1, plugin=None, rescan=False, silent=False):
+    '''Plans a deployment without transferring anything. Scans `paths` locally (in parallel, with cached results) and prints the bytes and files every node receives and stores, including inflation by multipliers.
+    Also checks free space on the filesystem of `dest` on every node, and estimates durations from throughput recorded in earlier deployments.
+    Args:
+        key_path (optional str): If set, uses given key to connect to remote nodes.
+        paths (optional list): Data sources to plan transporting to remote nodes.
+        dest (optional str): Destination path on the remote nodes.
+        copy_multiplier (optional int): Copy multiplier to plan for.
+        link_multiplier (optional int): Link multiplier to plan for.
+        plugin (optional str): Plugin to estimate the duration for. If "auto" or not set, estimates for all plugins.
+        rescan (optional bool): If set, ignores cached scan results. Needed to notice files modified in place, because we cache per directory.
+        silent (optional bool): If set, does not print so much.
+
+    Returns:
+        `True` if all nodes have enough free space, `False` otherwise.'''
+    registrar = Registrar()
+    register_plugins(registrar)
+    if plugin != None and plugin != auto_plugin and not plugin in registrar:
+        printe('Could not find a plugin named "{}"'.format(plugin))
+        return False
+    if (not paths) or not any(paths):
+        printw('No paths to data given.')
+        return False
+    return _plan_internal(registrar, reservation, key_path, paths, _clean_dest(dest), copy_multiplier, link_multiplier, plugin or auto_plugin, silent, rescan=rescan)
\ No newline at end of file
@@ -0,0 +1,197 @@
+import argparse
+import concurrent.futures
+import json
+import os
+import shlex
+import subprocess
+import time
+
+import remoto
+
+import data_deploy.shared.destination
+import data_deploy.shared.multiplier
+from data_deploy.shared.report import Report
+import data_deploy.internal.remoto.modules.chain_relay as chain_relay
+import data_deploy.internal.remoto.ssh_wrapper as ssh_wrapper
+import data_deploy.internal.util.engine as engine
+import data_deploy.internal.util.fs as fs
+from data_deploy.internal.util.printer import *
+
+
+'''Deploys data using chain replication, like HDFS write pipelines. Nodes are arranged in one or more chains.
+The local machine streams files in fixed-size chunks to the first node of every chain. Every node stores each chunk and immediately forwards it to the next node, while later chunks are still arriving.
+Total deployment time is close to the transfer time for one node, plus a small per-hop delay, regardless of the amount of nodes.'''
+
+# Location of the relay program on the remotes, relative to the remote home directory.
+_relay_path = '.data-deploy-chain-relay.py'
+
+
+def _merge_kwargs(x, y):
+    z = x.copy()
+    z.update(y)
+    return z
+
+
+def _build_chains(reservation, num_chains):
+    '''Splits nodes in `num_chains` chains of (nearly) equal length. Nodes with adjacent ips are placed in the same chain.'''
+    ordered = sorted(reservation.nodes, key=lambda x: x.ip_public)
+    num_chains = max(1, min(num_chains, len(ordered)))
+    size, remainder = divmod(len(ordered), num_chains)
+    chains = []
+    start = 0
+    for idx in range(num_chains):
+        end = start + size + (1 if idx < remainder else 0)
+        chains.append(ordered[start:end])
+        start = end
+    return chains
+
+
+def _install_relay(connection):
+    '''Writes the relay program on a remote.'''
+    with open(chain_relay.__file__, 'r') as f:
+        source = f.read()
+    cmd = ['python3', '-c', 'import sys; open(sys.argv[1], "w").write(sys.argv[2])', _relay_path, source]
+    return remoto.process.check(connection, cmd)[2] == 0
+
+
+def _entries(path):
+    '''Generates `(header, absolute_path)` for a local path and everything below it. Symlinks are followed. For directories, `absolute_path` is `None`.'''
+    path = os.path.abspath(path)
+    base = fs.basename(path)
+    if fs.isfile(path):
+        stat = os.stat(path)
+        yield {'path': base, 'size': stat.st_size, 'mode': stat.st_mode & 0o7777, 'mtime': stat.st_mtime}, path
+        return
+    for root, dirs, files in os.walk(path, followlinks=True):
+        rel_root = base if root == path else fs.join(base, os.path.relpath(root, path))
+        yield {'dir': rel_root, 'mode': os.stat(root).st_mode & 0o7777}, None
+        for name in files:
+            full = fs.join(root, name)
+            try:
+                stat = os.stat(full)
+            except FileNotFoundError as e: # Dangling symlink.
+                continue
+            yield {'path': fs.join(rel_root, name), 'size': stat.st_size, 'mode': stat.st_mode & 0o7777, 'mtime': stat.st_mtime}, full
+
+
+def _stream_chain(wrappers, chain, paths, dest, chunk_size):
+    '''Streams all data into a chain of nodes.
+    Returns:
+        `True` on success, `False` on failure.'''
+    head = chain[0]
+    # Quoted twice: once for the local shell, once for the remote shell.
+    cmd = 'ssh -F {} {} python3 {} {} {} {}'.format(wrappers[head].ssh_config_path, head.ip_public, _relay_path, dest, chunk_size, shlex.quote(shlex.quote(ssh_wrapper.multiplex_options())))
+    if len(chain) > 1:
+        cmd += ' '+','.join(x.hostname for x in chain[1:])
+    process = subprocess.Popen(cmd, shell=True, stdin=subprocess.PIPE)
+    try:
+        for path in paths:
+            for header, full in _entries(path):
+                process.stdin.write((json.dumps(header)+'\n').encode())
+                if not full:
+                    continue
+                remaining = header['size']
+                with open(full, 'rb') as f:
+                    while remaining > 0:
+                        chunk = f.read(min(chunk_size, remaining))
+                        if not chunk:
+                            raise EOFError('File {} shrunk while sending.'.format(full))
+                        process.stdin.write(chunk)
+                        remaining -= len(chunk)
+        process.stdin.close()
+    except (BrokenPipeError, EOFError) as e:
+        printe('Could not stream data into chain starting at {}: {}'.format(head, e))
+        process.kill()
+        process.wait()
+        return False
+    return process.wait() == 0
+
+
+def _stream_chain_timed(report, wrappers, chain, paths, dest, chunk_size, size, num_files):
+    '''Streams all data into a chain of nodes, and records the transfer for every node in the chain. All nodes receive data at the same time, so they share the wall time.'''
+    start = time.time()
+    result = _stream_chain(wrappers, chain, paths, dest, chunk_size)
+    end = time.time()
+    for node in chain:
+        report.record('transfer', node, start, end, bytes=size, files=num_files, success=result)
+    return result
+
+
+def _execute_internal(wrappers, reservation, paths, dest, silent, copy_multiplier, link_multiplier, chunk_size, num_chains, report=None):
+    if report == None:
+        report = Report('chain')
+    chains = _build_chains(reservation, num_chains)
+    sizes = [fs.du(path) for path in paths]
+    size, num_files = sum(x[0] for x in sizes), sum(x[1] for x in sizes)
+    if not silent:
+        print('Transferring data using {} chain(s) of up to {} nodes, with chunks of {} bytes...'.format(len(chains), max(len(x) for x in chains), chunk_size))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=engine.default().threads(len(wrappers))) as executor:
+        if not data_deploy.shared.destination.prepare(executor, wrappers, dest, silent=silent, report=report):
+            return False
+        futures_install = [executor.submit(_install_relay, x.connection) for x in wrappers.values()]
+        if not all(x.result() for x in futures_install):
+            printe('Could not install chain relay on all nodes.')
+            return False
+
+        futures_stream = [executor.submit(_stream_chain_timed, report, wrappers, chain, paths, dest, chunk_size, size, num_files) for chain in chains]
+        if not all(x.result() for x in futures_stream):
+            printe('Could not transfer data to all chains.')
+            return False
+
+        paths_remote = [fs.join(dest, fs.basename(path)) for path in paths]
+        if not data_deploy.shared.multiplier.apply(executor, wrappers, paths_remote, copy_multiplier, link_multiplier, silent=silent, report=report):
+            return False
+    return True
+
+
+def description():
+    return "Deploys data using chain replication: Files are streamed in chunks through a chain of nodes, every node forwarding chunks while later chunks are still arriving. Works well for few, very large files."
+
+
+def origin():
+    return "Default implementation."
+
+
+def parse(args):
+    parser = argparse.ArgumentParser(prog='...')
+    parser.add_argument('--chunk-size', metavar='MiB', dest='chunk_size', type=int, default=4, help='Size of the chunks to forward, in MiB (default=4).')
+    parser.add_argument('--chains', metavar='amount', dest='num_chains', type=int, default=1, help='Amount of parallel chains to split nodes in (default=1).')
+    args = parser.parse_args(args)
+    if args.chunk_size < 1 or args.num_chains < 1:
+        return False, [], {}
+    return True, [], {'chunk_size': args.chunk_size*1024*1024, 'num_chains': args.num_chains}
+
+
+def estimate(network, size, num_files, num_nodes, *args, **kwargs):
+    '''Predicts the completion time in seconds. Chains share the local uplink, and every hop adds the delay of one chunk.'''
+    chunk_size = kwargs.get('chunk_size') or 4*1024*1024
+    num_chains = max(1, min(kwargs.get('num_chains') or 1, num_nodes))
+    length = -(-num_nodes // num_chains)
+    bandwidth = min(network.local_bandwidth/num_chains, network.node_bandwidth)
+    return size/bandwidth + (length-1)*(chunk_size/network.node_bandwidth + network.node_latency) + num_files*network.per_file + 4*network.local_latency
+
+
+def execute(reservation, key_path, paths, dest, silent, copy_multiplier, link_multiplier, *args, **kwargs):
+    connectionwrappers = kwargs.get('connectionwrappers')
+    report = kwargs.get('report')
+    chunk_size = kwargs.get('chunk_size') or 4*1024*1024
+    num_chains = kwargs.get('num_chains') or 1
+
+    use_local_connections = connectionwrappers == None
+    if use_local_connections: # We did not get any connections, so we must make them
+        ssh_kwargs = {'IdentitiesOnly': 'yes', 'StrictHostKeyChecking': 'no'}
+        if key_path:
+            ssh_kwargs['IdentityFile'] = key_path
+        connectionwrappers = ssh_wrapper.get_wrappers(reservation.nodes, lambda node: node.ip_public, ssh_params=lambda node: _merge_kwargs(ssh_kwargs, {'User': node.extra_info['user']}), silent=silent, report=report)
+    else:
+        if len(connectionwrappers) != len(reservation):
+            raise ValueError('Provided connections do not contain all nodes: reservation length={}, connections amount={}'.format(len(connectionwrappers), len(reservation)))
+    if not all(x.open for x in connectionwrappers.values()):
+        printe('Not all provided connections are open.')
+        return False
+
+    retval = _execute_internal(connectionwrappers, reservation, paths, dest, silent, copy_multiplier, link_multiplier, chunk_size, num_chains, report=report)
+    if use_local_connections:
+        ssh_wrapper.close_wrappers(connectionwrappers)
+    return retval
\ No newline at end of file
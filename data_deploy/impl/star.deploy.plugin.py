@@ -1,21 +1,26 @@
 import argparse
 import concurrent.futures
-import subprocess
 
-import remoto
-
-
-import data_deploy.shared.copy
-import data_deploy.shared.link
+import data_deploy.shared.destination
+import data_deploy.shared.manifest as manifest
+import data_deploy.shared.multiplier
+import data_deploy.shared.staging as staging
+import data_deploy.shared.store as store
+from data_deploy.shared.report import Report
 import data_deploy.internal.defaults.deploy as defaults
 import data_deploy.internal.remoto.ssh_wrapper as ssh_wrapper
+from data_deploy.internal.transfer.compression import CompressionPolicy
+from data_deploy.internal.transfer.journal import Journal
+from data_deploy.internal.transfer.scheduler import TransferScheduler, disk_of
+import data_deploy.internal.transfer.transport as transport
+import data_deploy.internal.util.engine as engine
 import data_deploy.internal.util.fs as fs
-import data_deploy.internal.util.location as loc
 from data_deploy.internal.util.printer import *
 
 
 '''Deploys data by sending all data from the local machine to all remotes in parallel.
-Works well if bandwidth and local->remote connections don't bottleneck.'''
+Works well if bandwidth and local->remote connections don't bottleneck.
+With staging, data is deployed incrementally into a staging directory, which replaces the destination on all nodes only after all nodes received everything (see `data_deploy.shared.staging`).'''
 
 def _merge_kwargs(x, y):
     z = x.copy()
@@ -23,41 +28,62 @@ def _merge_kwargs(x, y):
     return z
 
 
-def _execute_internal(wrappers, reservation, key_path, paths, dest, silent, copy_multiplier, link_multiplier):
+def _execute_internal(wrappers, reservation, key_path, paths, dest, silent, copy_multiplier, link_multiplier, incremental=False, max_streams=16, max_streams_per_node=2, max_reads_per_disk=8, transport_name=transport.default(), compress=False, tar_threshold=transport.default_tar_threshold, file_streams=4, journal=None, retries=0, stage=False, store_dir=None, report=None):
+    final_dest = dest
+    if stage or store_dir: # Staging directories are seeded with the previous version, and stores are keyed by the content hashes in manifests.
+        incremental = True
+    if stage:
+        dest = staging.staging_dir(final_dest)
     if not silent:
-        print('Transferring data...')
-
-    with concurrent.futures.ThreadPoolExecutor(max_workers=len(wrappers)) as executor:
-        futures_mkdir = [executor.submit(remoto.process.check, x.connection, 'mkdir -p {}'.format(dest), shell=True) for x in wrappers.values()]
-        if not all(x.result()[2] == 0 for x in futures_mkdir):
-            printe('Could not create data destination directory for all nodes.')
-            return False
-        futures_rm = [executor.submit(remoto.process.check, x.connection, 'rm -rf {}/*'.format(dest), shell=True) for x in wrappers.values()]
-        if not all(x.result()[2] == 0 for x in futures_rm):
-            printe('Could not remove old data from destination directory for all nodes.')
-            return False
-
-        fun = lambda path, node, wrapper: subprocess.call('rsync -e "ssh -F {}" -q -aHAXL --inplace {} {}:{}'.format(wrapper.ssh_config_path, path, node.ip_public, fs.join(dest, fs.basename(path))), shell=True) == 0
-        futures_rsync = []
-        for path in paths:
-            futures_rsync += [executor.submit(fun, path, node, wrapper) for node, wrapper in wrappers.items()]
-        if not all(x.result() for x in futures_rsync):
-            printe('Could not tranfer data to some nodes.')
+        print('Transferring data{} using {}{}{}...'.format(' into staging directories' if stage else (' incrementally' if incremental else ''), transport_name, ' with adaptive compression' if compress else '', ', reusing files from node-local stores' if store_dir else ''))
+    compression = CompressionPolicy() if compress else None
+    if journal == None:
+        journal = Journal('star', [x.ip_public for x in wrappers.keys()], paths, dest)
+    if report == None:
+        report = Report('star')
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=engine.default().threads(len(wrappers))) as executor:
+        # When resuming, data sent earlier must be kept.
+        if stage:
+            # Nodes which swapped in an earlier, interrupted deployment already have the new version.
+            unswapped = {node: wrapper for node, wrapper in wrappers.items() if not journal.done(node.ip_public, 'swap')}
+            if not staging.prepare(executor, unswapped, final_dest, fresh=len(journal) == 0, silent=silent, report=report):
+                return False
+        elif not data_deploy.shared.destination.prepare(executor, wrappers, dest, clean=not (incremental or len(journal) > 0), silent=silent, report=report):
             return False
 
-        paths_remote = [fs.join(dest, fs.basename(path)) for path in paths]
-
-        copies_amount = max(1, copy_multiplier) - 1
-        links_amount = max(1, link_multiplier) - 1
-        if copies_amount > 0:
-            futures_copy = [executor.submit(data_deploy.shared.copy.copy_single, connection, path, copies_amount, silent=False) for connection in wrappers.values() for path in paths_remote]
-            if not all(x.result() for x in futures_copy):
+        scheduler = TransferScheduler(max_total=max_streams, max_per_node=max_streams_per_node, max_per_disk=max_reads_per_disk, retries=retries)
+        if incremental:
+            local_manifest, sources = manifest.scan(paths, silent=silent)
+            total_size = sum(x[0] for x in local_manifest.values())
+            transporter = transport.resolve(transport_name, total_size, len(local_manifest), tar_threshold=tar_threshold)
+            for node, wrapper in wrappers.items():
+                scheduler.add(journal.run, node, total_size, None, node.ip_public, 'manifest', manifest.deploy, wrapper, node.ip_public, local_manifest, sources, dest, transport=transporter, compression=compression, options=transport.options(transporter, streams=file_streams), unlink=stage, store=store_dir, silent=silent, report=report, node=node)
+            if not all(scheduler.run()):
+                printe('Could not incrementally transfer data to some nodes.')
                 return False
-
-        if links_amount > 0:
-            futures_link = [executor.submit(data_deploy.shared.link.link, connection, expression=data_deploy.shared.copy.copy_expression(dest_file, copies_amount), num_links=links_amount, silent=False) for connection in wrappers.values() for path in paths_remote]
-            if not all(x.result() for x in futures_link):
+        else:
+            for path in paths:
+                size, num_files = fs.du(path)
+                disk = disk_of(path)
+                transporter = transport.resolve(transport_name, size, num_files, tar_threshold=tar_threshold)
+                for node, wrapper in wrappers.items():
+                    if journal.done(node.ip_public, path):
+                        continue
+                    scheduler.add(report.timed, node, size, disk, 'transfer', node, journal.run, node.ip_public, path, transporter.transfer, wrapper, node.ip_public, path, dest, bytes=size, files=num_files, compression=compression, silent=silent, **transport.options(transporter, streams=file_streams))
+            if not silent:
+                print('Scheduling {} transfers (max {} concurrent, {} per node, {} reads per disk, {} retries).'.format(len(scheduler), max_streams, max_streams_per_node, max_reads_per_disk, retries))
+            if not all(scheduler.run()):
+                printe('Could not tranfer data to some nodes.')
                 return False
+        if compression:
+            compression.save()
+
+        paths_remote = [fs.join(dest, fs.basename(path)) for path in paths]
+        if not journal.run('*', 'multiplier', data_deploy.shared.multiplier.apply, executor, wrappers, paths_remote, copy_multiplier, link_multiplier, silent=silent, report=report, prune=incremental):
+            return False
+        if stage and not staging.swap(executor, unswapped, final_dest, silent=silent, report=report, done=lambda node: journal.mark(node.ip_public, 'swap')):
+            return False
     return True
 
 
@@ -71,20 +97,51 @@ def origin():
 
 def parse(args):
     parser = argparse.ArgumentParser(prog='...')
-    # We have no extra arguments to add here.
+    parser.add_argument('--incremental', help='If set, only sends missing or changed files and removes stale ones, using a manifest stored on every node. Otherwise, removes all old data first.', action='store_true')
+    parser.add_argument('--transport', metavar='name', type=str, choices=transport.names(), default=transport.default(), help='Transport to send data with (default={}). Options: {}. "native" streams over the existing connection, instead of starting rsync for every transfer. "tar" packs data in a stream, which is fast for many small files. "auto" picks "tar" for paths with a small average file size, "rsync" otherwise.'.format(transport.default(), ', '.join(transport.names())))
+    parser.add_argument('--tar-threshold', metavar='KiB', dest='tar_threshold', type=int, default=transport.default_tar_threshold//1024, help='Average file size below which the "auto" transport uses tar streams, in KiB (default={}).'.format(transport.default_tar_threshold//1024))
+    parser.add_argument('--max-streams', metavar='amount', dest='max_streams', type=int, default=16, help='Maximal amount of concurrent transfers (default=16).')
+    parser.add_argument('--max-streams-per-node', metavar='amount', dest='max_streams_per_node', type=int, default=2, help='Maximal amount of concurrent transfers to a single node (default=2).')
+    parser.add_argument('--max-reads-per-disk', metavar='amount', dest='max_reads_per_disk', type=int, default=8, help='Maximal amount of concurrent transfers reading from a single local disk (default=8).')
+    parser.add_argument('--file-streams', metavar='amount', dest='file_streams', type=int, default=4, help='Amount of parallel streams to send every large file with, when using the "multistream" transport (default=4). "auto" picks "multistream" for paths with a large average file size.')
+    parser.add_argument('--stage', help='If set, deploys incrementally into a staging directory next to the destination, seeded with hardlinks to the previous version. When all nodes received all data, the staging directory replaces the destination with an atomic rename. Until then, the previous version stays complete and readable.', action='store_true')
+    parser.add_argument('--store', metavar='path', dest='store_dir', nargs='?', const=store.default_dir, default=None, help='If set, keeps a content-addressed store on every node (default path={}, relative to the remote home). Files a node already holds in its store are copied from it instead of sent, as reflinks where supported. Implies --incremental.'.format(store.default_dir))
+    parser.add_argument('--compress', help='If set, compresses data adaptively: Picks a compression level for every file, based on its sampled compressibility, the measured link speed and the CPU cost. Results are remembered to improve later deploys.', action='store_true')
     args = parser.parse_args(args)
-    return True, [], {}
+    if args.max_streams < 1 or args.max_streams_per_node < 1 or args.max_reads_per_disk < 1 or args.tar_threshold < 0 or args.file_streams < 1:
+        return False, [], {}
+    return True, [], {'incremental': args.incremental, 'max_streams': args.max_streams, 'max_streams_per_node': args.max_streams_per_node, 'max_reads_per_disk': args.max_reads_per_disk, 'transport_name': args.transport, 'stage': args.stage, 'store_dir': args.store_dir, 'compress': args.compress, 'tar_threshold': args.tar_threshold*1024, 'file_streams': args.file_streams}
+
+
+def estimate(network, size, num_files, num_nodes, *args, **kwargs):
+    '''Predicts the completion time in seconds. All nodes share the local uplink. Files are handled by all nodes in parallel.'''
+    return num_nodes*size/network.local_bandwidth + num_files*network.per_file + 4*network.local_latency
 
 
 def execute(reservation, key_path, paths, dest, silent, copy_multiplier, link_multiplier, *args, **kwargs):
     connectionwrappers = kwargs.get('connectionwrappers')
+    incremental = kwargs.get('incremental') or False
+    max_streams = kwargs.get('max_streams') or 16
+    max_streams_per_node = kwargs.get('max_streams_per_node') or 2
+    max_reads_per_disk = kwargs.get('max_reads_per_disk') or 8
+    transport_name = kwargs.get('transport_name') or transport.default()
+    compress = kwargs.get('compress') or False
+    stage = kwargs.get('stage') or False
+    store_dir = kwargs.get('store_dir')
+    tar_threshold = kwargs.get('tar_threshold')
+    tar_threshold = transport.default_tar_threshold if tar_threshold == None else tar_threshold
+    file_streams = kwargs.get('file_streams') or 4
+    resume = kwargs.get('resume') or False
+    retries = kwargs.get('retries')
+    retries = defaults.retries() if retries == None else retries
+    report = kwargs.get('report')
 
     use_local_connections = connectionwrappers == None
     if use_local_connections: # We did not get any connections, so we must make them
         ssh_kwargs = {'IdentitiesOnly': 'yes', 'StrictHostKeyChecking': 'no'}
         if key_path:
             ssh_kwargs['IdentityFile'] = key_path
-        connectionwrappers = ssh_wrapper.get_wrappers(reservation.nodes, lambda node: node.ip_public, ssh_params=lambda node: _merge_kwargs(ssh_kwargs, {'User': node.extra_info['user']}), parallel=True, silent=silent)
+        connectionwrappers = ssh_wrapper.get_wrappers(reservation.nodes, lambda node: node.ip_public, ssh_params=lambda node: _merge_kwargs(ssh_kwargs, {'User': node.extra_info['user']}), parallel=True, silent=silent, report=report)
     else: # We received connections, need to check if they are valid.
         if len(connectionwrappers) != len(reservation):
             raise ValueError('Provided connections do not contain all nodes: reservation length={}, connections amount={}'.format(len(connectionwrappers), len(reservation)))
@@ -93,7 +150,11 @@ def execute(reservation, key_path, paths, dest, silent, copy_multiplier, link_mu
         return False
 
 
-    retval = _execute_internal(connectionwrappers, reservation, key_path, paths, dest, silent, copy_multiplier, link_multiplier)
-    if not use_local_connections:
+    journal = Journal('star', [x.ip_public for x in reservation.nodes], paths, dest, resume=resume)
+    if resume and not silent:
+        print('Resuming deployment: {} units of work completed earlier.'.format(len(journal)))
+    retval = _execute_internal(connectionwrappers, reservation, key_path, paths, dest, silent, copy_multiplier, link_multiplier, incremental=incremental, max_streams=max_streams, max_streams_per_node=max_streams_per_node, max_reads_per_disk=max_reads_per_disk, transport_name=transport_name, compress=compress, tar_threshold=tar_threshold, file_streams=file_streams, journal=journal, retries=retries, stage=stage, store_dir=store_dir, report=report)
+    journal.close(retval)
+    if use_local_connections:
         ssh_wrapper.close_wrappers(connectionwrappers)
     return retval
\ No newline at end of file
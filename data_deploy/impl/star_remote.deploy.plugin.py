@@ -1,20 +1,28 @@
 import argparse
 import concurrent.futures
-import subprocess
 
 import remoto
 
-import data_deploy.shared.copy
-import data_deploy.shared.link
+import data_deploy.shared.destination
+import data_deploy.shared.manifest as manifest
+import data_deploy.shared.multiplier
+import data_deploy.shared.topology as topology
+from data_deploy.shared.report import Report
 import data_deploy.internal.defaults.deploy as defaults
 import data_deploy.internal.remoto.ssh_wrapper as ssh_wrapper
+from data_deploy.internal.transfer.compression import CompressionPolicy
+from data_deploy.internal.transfer.journal import Journal
+from data_deploy.internal.transfer.scheduler import retry
+import data_deploy.internal.transfer.tarstream as tarstream
+import data_deploy.internal.transfer.transport as transport
+import data_deploy.internal.util.engine as engine
 import data_deploy.internal.util.fs as fs
-import data_deploy.internal.util.location as loc
 from data_deploy.internal.util.printer import *
 
 
 '''Deploys data by sending all data from the local machine to one remote (the 'admin') in parallel. The admin then sends all data in parallel to all other nodes.
-Works well if local->local connections don't bottleneck.'''
+Works well if local->local connections don't bottleneck.
+For reservations spanning multiple racks or subnets, nodes can be grouped by topology. The admin then sends data only to one relay per group, and every relay sends it to the rest of its group.'''
 
 def _merge_kwargs(x, y):
     z = x.copy()
@@ -40,74 +48,127 @@ def _pick_admin(reservation, admin=None):
         return tmp[0], tmp[1:]
 
 
-def _execute_internal(wrappers, admin_node, reservation, paths, dest, silent, copy_multiplier, link_multiplier):
-    if not silent:
-        print('Transferring data...'.format(copy_multiplier, link_multiplier))
-
-    with concurrent.futures.ThreadPoolExecutor(max_workers=len(wrappers)) as executor:
-        if not remoto.process.check(wrappers[admin_node].connection, 'mkdir -p {}'.format(dest), shell=True)[2] == 0:
-            printe('Could not create data destination directory on admin node.')
-            return False
-        if not remoto.process.check(wrappers[admin_node].connection, 'rm -rf {}/*'.format(dest), shell=True)[2] == 0:
-            printe('Could not remove old data from destination directory on admin node.')
-            return False
-
-        fun = lambda path, node, wrapper: subprocess.call('rsync -e "ssh -F {}" -q -aHAXL --inplace {} {}:{}'.format(wrapper.ssh_config_path, path, node.ip_public, fs.join(dest, fs.basename(path))), shell=True) == 0
-        futures_rsync = [executor.submit(fun, path, admin_node, wrappers[admin_node]) for path in paths]
-        if not all(x.result() for x in futures_rsync):
-            if not silent:
-                printe('Could not transfer data to admin node.')
-            return False
-        star_nodes = [x for x in reservation.nodes if x != admin_node]
-        paths_remote = [fs.join(dest, fs.basename(path)) for path in paths]
-        star_cmd = '''python3 -c "
+def _star_cmd(star_nodes, paths_remote, incremental, transporters, retries):
+    '''Returns a command for a relay node, sending all data to given nodes in parallel.'''
+    return '''python3 -c "
 import concurrent.futures
+import os
 import subprocess
+import sys
+import time
 hostnames = [{0}]
-sourcedir = '{1}'
-paths_remote = [{2}]
-with concurrent.futures.ThreadPoolExecutor(max_workers=len(hostnames)) as executor:
-    futures_mkdir = [executor.submit(subprocess.call, 'ssh {{}} \\'mkdir -p {{}}\\''.format(x, sourcedir), shell=True) for x in hostnames]
-    if not all(x.result() == 0 for x in futures_mkdir):
-        print('Could not create data destination directory for all nodes.')
-        exit(1)
-    futures_rm = [executor.submit(subprocess.call, 'ssh {{}} \\'rm -rf {{}}/*\\''.format(x, sourcedir), shell=True) for x in hostnames]
-    if not all(x.result() == 0 for x in futures_rm):
-        print('Could not remove old data from destination directory for all nodes.')
-        exit(1)
-    futures_rsync = [executor.submit(subprocess.call, 'rsync -q -aHAX --inplace {{}} {{}}:{{}}'.format(path, hostname, path), shell=True) for hostname in hostnames for path in paths_remote]
-    if not all(x.result() == 0 for x in futures_rsync):
+paths_remote = [{1}]
+incremental = {2}
+use_tar = [{4}]
+retries = {5}
+if incremental:
+    # rsync only sends changed files. Files generated by multipliers are excluded, which also protects them from deletion. Obsolete ones are pruned when applying the multipliers.
+    rsync_cmd = 'rsync -e \\"ssh {3}\\" -q -aHAX --inplace --delete --exclude=\\'*.copy.[0-9]*\\' --exclude=\\'*.link.[0-9]*\\' {{0}} {{1}}:{{2}}/'
+else:
+    rsync_cmd = 'rsync -e \\"ssh {3}\\" -q -aHAX --inplace {{0}} {{1}}:{{2}}/'
+# Paths with many small files are packed in a tar stream instead, unpacked on the fly by the receiving node. With pipefail, errors of the packing tar fail the pipeline too.
+tar_cmd = 'set -o pipefail; tar -C {{2}} -cf - {{3}} | ssh {3} {{1}} \\"tar -C {{2}} -xpf -\\"'
+def send(hostname):
+    for path, tar in zip(paths_remote, use_tar):
+        cmd = (tar_cmd if tar else rsync_cmd).format(path, hostname, os.path.dirname(path) or '.', os.path.basename(path))
+        attempt = 0
+        while subprocess.call(cmd, shell=True, executable='/bin/bash') != 0:
+            attempt += 1
+            if attempt > retries:
+                return False
+            time.sleep(min(60, 2**(attempt-1)))
+    # Reports completed nodes, so the local machine can journal them.
+    print('done '+hostname)
+    sys.stdout.flush()
+    return True
+# All rsync calls to a node share one master connection.
+with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, len(hostnames))) as executor:
+    if not all(executor.map(send, hostnames)):
         print('Could not transfer data to some nodes.')
         exit(1)
 exit(0)
     "
-    '''.format(
-        ','.join("'{}'".format(x.hostname) for x in star_nodes),
-        dest,
-        ','.join("'{}'".format(x) for x in paths_remote))
-
-        out, error, exitcode = remoto.process.check(wrappers[admin_node].connection, star_cmd, shell=True)
-        if exitcode != 0:
-            if not silent:
-                printe('Could not transfer data from admin to all other nodes. Exitcode={}.\nOut={}\nError={}'.format(exitcode, out, error))
+'''.format(
+    ','.join("'{}'".format(x.hostname) for x in star_nodes),
+    ','.join("'{}'".format(x) for x in paths_remote),
+    incremental,
+    ssh_wrapper.multiplex_options(),
+    ','.join(str(x == tarstream) for x in transporters),
+    retries)
+
+
+def _relay(wrappers, relay_node, targets, paths_remote, incremental, transporters, total_size, journal, retries, silent, report):
+    '''Sends all data from a relay node to given nodes, skipping nodes which received all data earlier. Needs a single round trip to the relay node.
+    Returns:
+        `True` on success, `False` on failure.'''
+    star_nodes = [x for x in targets if not journal.done(x.ip_public, 'relay')]
+    if not any(star_nodes):
+        return True
+    star_cmd = _star_cmd(star_nodes, paths_remote, incremental, transporters, retries)
+    with report.measure('relay', relay_node, bytes=total_size*len(star_nodes)) as values:
+        out, error, exitcode = remoto.process.check(wrappers[relay_node].connection, star_cmd, shell=True)
+        values['success'] = exitcode == 0
+    nodes_by_hostname = {x.hostname: x for x in star_nodes}
+    for line in out:
+        if line.startswith('done ') and line[5:] in nodes_by_hostname:
+            journal.mark(nodes_by_hostname[line[5:]].ip_public, 'relay')
+    if exitcode != 0:
+        if not silent:
+            printe('Could not transfer data from relay {} to all its nodes. Exitcode={}.\nOut={}\nError={}'.format(relay_node, exitcode, out, error))
+        return False
+    return True
+
+
+def _execute_internal(wrappers, admin_node, reservation, paths, dest, silent, copy_multiplier, link_multiplier, incremental=False, transport_name=transport.default(), compress=False, tar_threshold=transport.default_tar_threshold, file_streams=4, group_by='none', group_key=None, subnet_prefix=24, journal=None, retries=0, report=None):
+    if not silent:
+        print('Transferring data{} using {}{}...'.format(' incrementally' if incremental else '', transport_name, ' with adaptive compression' if compress else ''))
+    compression = CompressionPolicy() if compress else None
+    if journal == None:
+        journal = Journal('star_remote', [x.ip_public for x in wrappers.keys()], paths, dest)
+    if report == None:
+        report = Report('star_remote')
+
+    # The admin measures round trip times, as it sends all data between groups.
+    groups = topology.group(reservation.nodes, method=group_by, key=group_key, prefix=subnet_prefix, probe=wrappers[admin_node].connection, silent=silent)
+    if groups == None:
+        return False
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=engine.default().threads(len(wrappers))) as executor:
+        # When resuming, data sent earlier must be kept.
+        if not data_deploy.shared.destination.prepare(executor, wrappers, dest, clean=not (incremental or len(journal) > 0), silent=silent, report=report):
             return False
 
-        copies_amount = max(1, copy_multiplier) - 1
-        links_amount = max(1, link_multiplier) - 1
-        if copies_amount > 0:
-            futures_copy = {node: executor.submit(data_deploy.shared.copy.copy_single, wrapper.connection, path, copies_amount, silent=False) for node, wrapper in wrappers.items() for path in paths_remote}
-            for k,v in futures_copy.items():
-                if not v.result():
-                    if not silent:
-                        printe('Could not create copies on node: {}'.format(k))
-                    return False
-        if links_amount > 0:
-            futures_link = {node: executor.submit(data_deploy.shared.link.link, wrapper.connection, expression=data_deploy.shared.copy.copy_expression(path, copies_amount), num_links=links_amount, silent=False) for node, wrapper in wrappers.items() for path in paths_remote}
-            for k,v in futures_link.items():
-                if not v.result():
-                    if not silent:
-                        printe('Could not create links on all nodes.')
-                    return False
+        transporters = [None for path in paths]
+        if incremental:
+            local_manifest, sources = manifest.scan(paths, silent=silent)
+            total_size = sum(x[0] for x in local_manifest.values())
+            transporter = transport.resolve(transport_name, total_size, len(local_manifest), tar_threshold=tar_threshold)
+            if not journal.run(admin_node.ip_public, 'manifest', retry, manifest.deploy, wrappers[admin_node], admin_node.ip_public, local_manifest, sources, dest, transport=transporter, compression=compression, options=transport.options(transporter, streams=file_streams), retries=retries, silent=silent, report=report, node=admin_node):
+                if not silent:
+                    printe('Could not incrementally transfer data to admin node.')
+                return False
+        else:
+            sizes = [fs.du(path) for path in paths]
+            total_size = sum(x[0] for x in sizes)
+            transporters = [transport.resolve(transport_name, size, num_files, tar_threshold=tar_threshold) for size, num_files in sizes]
+            futures_rsync = [executor.submit(report.timed, 'transfer', admin_node, journal.run, admin_node.ip_public, path, retry, transporter.transfer, wrappers[admin_node], admin_node.ip_public, path, dest, bytes=size, files=num_files, compression=compression, retries=retries, silent=silent, **transport.options(transporter, streams=file_streams)) for path, transporter, (size, num_files) in zip(paths, transporters, sizes)]
+            if not all(x.result() for x in futures_rsync):
+                if not silent:
+                    printe('Could not transfer data to admin node.')
+                return False
+        if compression:
+            compression.save()
+        paths_remote = [fs.join(dest, fs.basename(path)) for path in paths]
+        plan = topology.pick_relays(groups, admin_node)
+        # Data crosses links between groups once: The admin sends to the other relays first, after which all relays send to their own groups in parallel.
+        if not _relay(wrappers, admin_node, [relay for relay, members in plan[1:]], paths_remote, incremental, transporters, total_size, journal, retries, silent, report):
+            return False
+        futures_relay = [executor.submit(_relay, wrappers, relay, members, paths_remote, incremental, transporters, total_size, journal, retries, silent, report) for relay, members in plan]
+        if not all(x.result() for x in futures_relay):
+            return False
+
+        if not journal.run('*', 'multiplier', data_deploy.shared.multiplier.apply, executor, wrappers, paths_remote, copy_multiplier, link_multiplier, silent=silent, report=report, prune=incremental):
+            return False
     return True
 
 
@@ -122,13 +183,46 @@ def origin():
 def parse(args):
     parser = argparse.ArgumentParser(prog='...')
     parser.add_argument('--admin', metavar='id', dest='admin_id', type=int, default=None, help='ID of the node that will be the primary or admin node.')
+    parser.add_argument('--incremental', help='If set, only sends missing or changed files and removes stale ones. Otherwise, removes all old data first.', action='store_true')
+    parser.add_argument('--transport', metavar='name', type=str, choices=transport.names(), default=transport.default(), help='Transport to send data to the admin with (default={}). Options: {}. With "auto", paths with a small average file size are sent as tar streams, also from the admin to other nodes.'.format(transport.default(), ', '.join(transport.names())))
+    parser.add_argument('--tar-threshold', metavar='KiB', dest='tar_threshold', type=int, default=transport.default_tar_threshold//1024, help='Average file size below which the "auto" transport uses tar streams, in KiB (default={}).'.format(transport.default_tar_threshold//1024))
+    parser.add_argument('--file-streams', metavar='amount', dest='file_streams', type=int, default=4, help='Amount of parallel streams to send every large file with, when using the "multistream" transport (default=4). "auto" picks "multistream" for paths with a large average file size.')
+    parser.add_argument('--group-by', metavar='method', dest='group_by', type=str, choices=topology.methods, default='none', help='Groups nodes by topology, and relays data through one node per group, so data crosses links between groups once (default=none). Options: {}. "key" groups by a reservation metadata key (see --group-key), "subnet" by ip prefix (see --subnet-prefix), "rtt" by round trip times measured from the admin.'.format(', '.join(topology.methods)))
+    parser.add_argument('--group-key', metavar='key', dest='group_key', type=str, default=None, help='Node metadata ("extra_info") key to group nodes by, e.g. "rack". Implies "--group-by key".')
+    parser.add_argument('--subnet-prefix', metavar='bits', dest='subnet_prefix', type=int, default=24, help='Prefix length of subnets to group nodes by, when using "--group-by subnet" (default=24).')
+    parser.add_argument('--compress', help='If set, compresses data sent to the admin adaptively: Picks a compression level for every file, based on its sampled compressibility, the measured link speed and the CPU cost. Results are remembered to improve later deploys.', action='store_true')
     args = parser.parse_args(args)
-    return True, [], {'admin_id': args.admin_id}
+    if args.tar_threshold < 0 or args.file_streams < 1 or args.subnet_prefix < 0:
+        return False, [], {}
+    if args.group_key:
+        args.group_by = 'key'
+    elif args.group_by == 'key':
+        return False, [], {}
+    return True, [], {'admin_id': args.admin_id, 'incremental': args.incremental, 'transport_name': args.transport, 'compress': args.compress, 'tar_threshold': args.tar_threshold*1024, 'file_streams': args.file_streams, 'group_by': args.group_by, 'group_key': args.group_key, 'subnet_prefix': args.subnet_prefix}
+
+
+def estimate(network, size, num_files, num_nodes, *args, **kwargs):
+    '''Predicts the completion time in seconds. Data crosses the local uplink once, after which all other nodes share the uplink of the admin.'''
+    return size/network.local_bandwidth + (num_nodes-1)*size/network.node_bandwidth + 2*num_files*network.per_file + 4*network.local_latency + 2*network.node_latency
 
 
 def execute(reservation, key_path, paths, dest, silent, copy_multiplier, link_multiplier, *args, **kwargs):
     connectionwrappers = kwargs.get('connectionwrappers')
     admin_id = kwargs.get('admin_id')
+    incremental = kwargs.get('incremental') or False
+    transport_name = kwargs.get('transport_name') or transport.default()
+    compress = kwargs.get('compress') or False
+    tar_threshold = kwargs.get('tar_threshold')
+    tar_threshold = transport.default_tar_threshold if tar_threshold == None else tar_threshold
+    file_streams = kwargs.get('file_streams') or 4
+    group_by = kwargs.get('group_by') or 'none'
+    group_key = kwargs.get('group_key')
+    subnet_prefix = kwargs.get('subnet_prefix')
+    subnet_prefix = 24 if subnet_prefix == None else subnet_prefix
+    resume = kwargs.get('resume') or False
+    retries = kwargs.get('retries')
+    retries = defaults.retries() if retries == None else retries
+    report = kwargs.get('report')
 
     admin_node, _ = _pick_admin(reservation, admin=admin_id)
     use_local_connections = connectionwrappers == None
@@ -136,7 +230,7 @@ def execute(reservation, key_path, paths, dest, silent, copy_multiplier, link_mu
         ssh_kwargs = {'IdentitiesOnly': 'yes', 'StrictHostKeyChecking': 'no'}
         if key_path:
             ssh_kwargs['IdentityFile'] = key_path
-        connectionwrappers = ssh_wrapper.get_wrappers(reservation.nodes, lambda node: node.ip_public, ssh_params=lambda node: _merge_kwargs(ssh_kwargs, {'User': node.extra_info['user']}), silent=silent)
+        connectionwrappers = ssh_wrapper.get_wrappers(reservation.nodes, lambda node: node.ip_public, ssh_params=lambda node: _merge_kwargs(ssh_kwargs, {'User': node.extra_info['user']}), silent=silent, report=report)
     else:
         if len(connectionwrappers) != len(reservation):
             raise ValueError('Provided connections do not contain all nodes: reservation length={}, connections amount={}'.format(len(connectionwrappers), len(reservation)))
@@ -144,7 +238,11 @@ def execute(reservation, key_path, paths, dest, silent, copy_multiplier, link_mu
         printe('Not all provided connections are open.')
         return False
 
-    retval = _execute_internal(connectionwrappers, admin_node, reservation, paths, dest, silent, copy_multiplier, link_multiplier)
-    if not use_local_connections:
+    journal = Journal('star_remote', [x.ip_public for x in reservation.nodes], paths, dest, resume=resume)
+    if resume and not silent:
+        print('Resuming deployment: {} units of work completed earlier.'.format(len(journal)))
+    retval = _execute_internal(connectionwrappers, admin_node, reservation, paths, dest, silent, copy_multiplier, link_multiplier, incremental=incremental, transport_name=transport_name, compress=compress, tar_threshold=tar_threshold, file_streams=file_streams, group_by=group_by, group_key=group_key, subnet_prefix=subnet_prefix, journal=journal, retries=retries, report=report)
+    journal.close(retval)
+    if use_local_connections:
         ssh_wrapper.close_wrappers(connectionwrappers)
     return retval
\ No newline at end of file
@@ -0,0 +1,220 @@
+import argparse
+import json
+import os
+import subprocess
+import tempfile
+import time
+
+import remoto
+
+import data_deploy.shared.destination
+import data_deploy.shared.multiplier
+from data_deploy.shared.report import Report
+import data_deploy.internal.remoto.modules.swarm_peer as swarm_peer
+import data_deploy.internal.remoto.ssh_wrapper as ssh_wrapper
+from data_deploy.internal.transfer.swarm import SwarmScheduler
+import data_deploy.internal.util.fs as fs
+from data_deploy.internal.util.printer import *
+
+
+'''Deploys data using a peer-assisted swarm, like BitTorrent. Data is split in fixed-size chunks.
+The local machine sends every chunk to only one (or a few) nodes. Nodes fetch all other chunks from each other, rarest chunk first, so the aggregate bandwidth of all nodes is used.
+Every node has its own pace: A slow node only delays itself, and nodes prefer fast peers as source.'''
+
+# Locations of the peer program and the dataset spec on the remotes, relative to the remote home directory.
+_peer_path = '.data-deploy-swarm-peer.py'
+_spec_path = '.data-deploy-swarm-spec.json'
+
+
+def _merge_kwargs(x, y):
+    z = x.copy()
+    z.update(y)
+    return z
+
+
+def _build_spec(paths, chunk_size):
+    '''Describes local paths as a dataset of chunks, as read by the peer program. Symlinks are followed.
+    Returns:
+        `dict` spec, list of absolute local paths for every file in the spec.'''
+    dirs, files, sources = [], [], []
+    for path in paths:
+        path = os.path.abspath(path)
+        base = fs.basename(path)
+        if fs.isfile(path):
+            stat = os.stat(path)
+            files.append([base, stat.st_size, stat.st_mode & 0o7777, stat.st_mtime])
+            sources.append(path)
+            continue
+        for root, subdirs, names in os.walk(path, followlinks=True):
+            rel_root = base if root == path else fs.join(base, os.path.relpath(root, path))
+            dirs.append([rel_root, os.stat(root).st_mode & 0o7777])
+            for name in names:
+                full = fs.join(root, name)
+                try:
+                    stat = os.stat(full)
+                except FileNotFoundError as e: # Dangling symlink.
+                    continue
+                files.append([fs.join(rel_root, name), stat.st_size, stat.st_mode & 0o7777, stat.st_mtime])
+                sources.append(full)
+
+    chunks, current, filled = [], [], 0
+    for idx, (rel, size, mode, mtime) in enumerate(files):
+        offset = 0
+        while offset < size:
+            length = min(size-offset, chunk_size-filled)
+            current.append([idx, offset, length])
+            offset += length
+            filled += length
+            if filled == chunk_size:
+                chunks.append(current)
+                current, filled = [], 0
+    if any(current):
+        chunks.append(current)
+    return {'dirs': dirs, 'files': files, 'chunks': chunks}, sources
+
+
+async def _install(engine, wrapper, node, tmpdir, dest):
+    '''Copies the peer program and spec to a node, and preallocates all files.'''
+    if await engine.process('rsync -e "ssh -F {}" -q {}/ {}:'.format(wrapper.ssh_config_path, tmpdir, node.ip_public)) != 0:
+        return False
+    return (await engine.call(remoto.process.check, wrapper.connection, ['python3', _peer_path, 'init', dest, _spec_path]))[2] == 0
+
+
+def _seed(wrapper, node, spec, sources, dest, chunk):
+    '''Sends a chunk from the local machine to a node.
+    Returns:
+        `True` on success, `False` on failure.'''
+    cmd = 'ssh -F {} {} python3 {} recv {} {} {}'.format(wrapper.ssh_config_path, node.ip_public, _peer_path, dest, _spec_path, chunk)
+    process = subprocess.Popen(cmd, shell=True, stdin=subprocess.PIPE)
+    try:
+        for idx, offset, length in spec['chunks'][chunk]:
+            with open(sources[idx], 'rb') as f:
+                f.seek(offset)
+                while length > 0:
+                    data = f.read(min(length, 1024*1024))
+                    if not data:
+                        raise EOFError('File {} shrunk while sending.'.format(sources[idx]))
+                    process.stdin.write(data)
+                    length -= len(data)
+        process.stdin.close()
+    except (BrokenPipeError, EOFError) as e:
+        printe('Could not send chunk {} to node {}: {}'.format(chunk, node, e))
+        process.kill()
+        process.wait()
+        return False
+    return process.wait() == 0
+
+
+async def _fetch(engine, wrapper, source, dest, chunk):
+    '''Makes a node fetch a chunk from another node. Needs a single round trip to the receiving node.'''
+    cmd = 'ssh {} -o StrictHostKeyChecking=no {} python3 {} send {} {} {} | python3 {} recv {} {} {}'.format(
+        ssh_wrapper.multiplex_options(), source.hostname, _peer_path, dest, _spec_path, chunk, _peer_path, dest, _spec_path, chunk)
+    return (await engine.call(remoto.process.check, wrapper.connection, cmd, shell=True))[2] == 0
+
+
+async def _finish(engine, wrapper, dest):
+    '''Sets file metadata on a node, and removes the peer program and spec.'''
+    cmd = 'python3 {0} finish {1} {2} && rm -f {0} {2}'.format(_peer_path, dest, _spec_path)
+    return (await engine.call(remoto.process.check, wrapper.connection, cmd, shell=True))[2] == 0
+
+
+async def _execute_internal(engine, wrappers, reservation, paths, dest, silent, copy_multiplier, link_multiplier, chunk_size, seeds, max_uploads, max_downloads, max_local, report=None):
+    if report == None:
+        report = Report('swarm')
+    spec, sources = _build_spec(paths, chunk_size)
+    size, num_files = sum(x[1] for x in spec['files']), len(spec['files'])
+    if not silent:
+        print('Transferring data using a swarm: {} chunks of up to {} bytes, seeded to {} node(s) each...'.format(len(spec['chunks']), chunk_size, seeds))
+
+    if not await data_deploy.shared.destination.prepare_async(engine, wrappers, dest, silent=silent, report=report):
+        return False
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with open(swarm_peer.__file__, 'r') as f:
+            source = f.read()
+        with open(fs.join(tmpdir, _peer_path), 'w') as f:
+            f.write(source)
+        with open(fs.join(tmpdir, _spec_path), 'w') as f:
+            json.dump(spec, f)
+        if not all(await engine.map(lambda node: _install(engine, wrappers[node], node, tmpdir, dest), wrappers.keys())):
+            printe('Could not install swarm peer on all nodes.')
+            return False
+
+    scheduler = SwarmScheduler(wrappers.keys(), len(spec['chunks']), seeds=seeds, max_local=max_local, max_uploads=max_uploads, max_downloads=max_downloads)
+    start = time.time()
+    success = await scheduler.run(
+        lambda receiver, chunk: engine.call(_seed, wrappers[receiver], receiver, spec, sources, dest, chunk),
+        lambda receiver, source, chunk: _fetch(engine, wrappers[receiver], source, dest, chunk),
+        silent=silent)
+    end = time.time()
+    for node in wrappers.keys():
+        report.record('transfer', node, scheduler.started.get(node, start), scheduler.finished.get(node, end), bytes=size, files=num_files, success=scheduler.complete(node))
+    if not success:
+        printe('Could not transfer data to all nodes.')
+        return False
+
+    if not all(await engine.map(lambda node: _finish(engine, wrappers[node], dest), wrappers.keys())):
+        printe('Could not finish deployment on all nodes.')
+        return False
+
+    paths_remote = [fs.join(dest, fs.basename(path)) for path in paths]
+    return await data_deploy.shared.multiplier.apply_async(engine, wrappers, paths_remote, copy_multiplier, link_multiplier, silent=silent, report=report)
+
+
+def description():
+    return "Deploys data using a peer-assisted swarm: The local machine seeds every chunk to few nodes, after which nodes fetch missing chunks from each other, rarest first. Works well for large reservations and large datasets, and tolerates slow nodes."
+
+
+def origin():
+    return "Default implementation."
+
+
+def parse(args):
+    parser = argparse.ArgumentParser(prog='...')
+    parser.add_argument('--chunk-size', metavar='MiB', dest='chunk_size', type=int, default=64, help='Size of the chunks to exchange, in MiB (default=64).')
+    parser.add_argument('--seeds', metavar='amount', type=int, default=1, help='Amount of nodes the local machine sends every chunk to (default=1).')
+    parser.add_argument('--uploads', metavar='amount', dest='max_uploads', type=int, default=2, help='Maximal amount of chunks a node sends at the same time (default=2).')
+    parser.add_argument('--downloads', metavar='amount', dest='max_downloads', type=int, default=2, help='Maximal amount of chunks a node fetches at the same time (default=2).')
+    parser.add_argument('--local-streams', metavar='amount', dest='max_local', type=int, default=4, help='Maximal amount of chunks the local machine sends at the same time (default=4).')
+    args = parser.parse_args(args)
+    if min(args.chunk_size, args.seeds, args.max_uploads, args.max_downloads, args.max_local) < 1:
+        return False, [], {}
+    return True, [], {'chunk_size': args.chunk_size*1024*1024, 'seeds': args.seeds, 'max_uploads': args.max_uploads, 'max_downloads': args.max_downloads, 'max_local': args.max_local}
+
+
+def estimate(network, size, num_files, num_nodes, *args, **kwargs):
+    '''Predicts the completion time in seconds. The local uplink sends everything `seeds` times, while every node downloads everything once from its peers.'''
+    chunk_size = kwargs.get('chunk_size') or 64*1024*1024
+    seeds = min(kwargs.get('seeds') or 1, num_nodes)
+    max_downloads = kwargs.get('max_downloads') or 2
+    num_chunks = -(-size // chunk_size)
+    return max(seeds*size/network.local_bandwidth, size/network.node_bandwidth) + num_chunks*network.node_latency/max_downloads + num_files*network.per_file + 4*network.local_latency
+
+
+async def execute(reservation, key_path, paths, dest, silent, copy_multiplier, link_multiplier, *args, **kwargs):
+    connectionwrappers = kwargs.get('connectionwrappers')
+    report = kwargs.get('report')
+    chunk_size = kwargs.get('chunk_size') or 64*1024*1024
+    seeds = kwargs.get('seeds') or 1
+    max_uploads = kwargs.get('max_uploads') or 2
+    max_downloads = kwargs.get('max_downloads') or 2
+    max_local = kwargs.get('max_local') or 4
+    engine = kwargs.get('engine')
+
+    use_local_connections = connectionwrappers == None
+    if use_local_connections: # We did not get any connections, so we must make them
+        ssh_kwargs = {'IdentitiesOnly': 'yes', 'StrictHostKeyChecking': 'no'}
+        if key_path:
+            ssh_kwargs['IdentityFile'] = key_path
+        connectionwrappers = await ssh_wrapper.get_wrappers_async(engine, reservation.nodes, lambda node: node.ip_public, ssh_params=lambda node: _merge_kwargs(ssh_kwargs, {'User': node.extra_info['user']}), silent=silent, report=report)
+    else:
+        if len(connectionwrappers) != len(reservation):
+            raise ValueError('Provided connections do not contain all nodes: reservation length={}, connections amount={}'.format(len(connectionwrappers), len(reservation)))
+    if not all(x.open for x in connectionwrappers.values()):
+        printe('Not all provided connections are open.')
+        return False
+
+    retval = await _execute_internal(engine, connectionwrappers, reservation, paths, dest, silent, copy_multiplier, link_multiplier, chunk_size, seeds, max_uploads, max_downloads, max_local, report=report)
+    if use_local_connections:
+        await ssh_wrapper.close_wrappers_async(engine, connectionwrappers)
+    return retval
@@ -0,0 +1,124 @@
+import argparse
+
+import remoto
+
+import data_deploy.shared.destination
+import data_deploy.shared.multiplier
+from data_deploy.shared.report import Report
+import data_deploy.internal.remoto.ssh_wrapper as ssh_wrapper
+import data_deploy.internal.util.fs as fs
+from data_deploy.internal.util.printer import *
+
+
+'''Deploys data using a k-ary broadcast tree. The local machine sends all data to the first `fanout` nodes.
+Every node forwards the data to its own `fanout` children as soon as it has received everything, so total deployment time grows with log(N) instead of N.
+Works well for large reservations, where any single uplink would bottleneck.
+Runs on the orchestration engine: every transfer is a coroutine, so large trees need no thread per node.'''
+
+def _merge_kwargs(x, y):
+    z = x.copy()
+    z.update(y)
+    return z
+
+
+def _build_tree(reservation, fanout):
+    '''Arranges nodes in a k-ary tree. The local machine is the (virtual) root.
+    Args:
+        reservation (`metareserve.Reservation`): Reservation object containing nodes to arrange.
+        fanout (int): Maximal amount of children per node.
+
+    Returns:
+        list of nodes receiving data from the local machine, dict mapping every node to its list of children.'''
+    ordered = sorted(reservation.nodes, key=lambda x: x.ip_public)
+    children = {node: ordered[(idx+1)*fanout:(idx+2)*fanout] for idx, node in enumerate(ordered)}
+    return ordered[:fanout], children
+
+
+async def _send_local(engine, wrapper, node, paths, dest):
+    return await engine.process('rsync -e "ssh -F {}" -q -aHAXL --inplace {} {}:{}/'.format(wrapper.ssh_config_path, ' '.join(paths), node.ip_public, dest)) == 0
+
+
+async def _send_forward(engine, wrapper, child, paths_remote, dest):
+    return (await engine.call(remoto.process.check, wrapper.connection, 'rsync -e "ssh {}" -q -aHAX --inplace {} {}:{}/'.format(ssh_wrapper.multiplex_options(), ' '.join(paths_remote), child.hostname, dest), shell=True))[2] == 0
+
+
+async def _deliver(engine, wrappers, children, node, send, paths_remote, dest, report, size, num_files):
+    '''Awaits delivery of all data to a node. As soon as the node has all data, it starts forwarding to its children.
+    Returns:
+        `True` if the node and all its descendants received all data, `False` otherwise.'''
+    if not await report.timed_async('transfer', node, send, bytes=size, files=num_files):
+        printe('Could not transfer data to node: {}'.format(node))
+        return False
+    return all(await engine.map(lambda child: _deliver(engine, wrappers, children, child, _send_forward(engine, wrappers[node], child, paths_remote, dest), paths_remote, dest, report, size, num_files), children[node]))
+
+
+async def _execute_internal(engine, wrappers, reservation, paths, dest, silent, copy_multiplier, link_multiplier, fanout, report=None):
+    if report == None:
+        report = Report('tree')
+    roots, children = _build_tree(reservation, fanout)
+    sizes = [fs.du(path) for path in paths]
+    size, num_files = sum(x[0] for x in sizes), sum(x[1] for x in sizes)
+    if not silent:
+        print('Transferring data using a broadcast tree with fanout {}...'.format(fanout))
+
+    if not await data_deploy.shared.destination.prepare_async(engine, wrappers, dest, silent=silent, report=report):
+        return False
+
+    paths_remote = [fs.join(dest, fs.basename(path)) for path in paths]
+    if not all(await engine.map(lambda node: _deliver(engine, wrappers, children, node, _send_local(engine, wrappers[node], node, paths, dest), paths_remote, dest, report, size, num_files), roots)):
+        return False
+
+    return await data_deploy.shared.multiplier.apply_async(engine, wrappers, paths_remote, copy_multiplier, link_multiplier, silent=silent, report=report)
+
+
+def description():
+    return "Deploys data using a k-ary broadcast tree: Every node forwards data to its children as soon as it has received it. Works well for large reservations, where any single uplink would bottleneck."
+
+
+def origin():
+    return "Default implementation."
+
+
+def parse(args):
+    parser = argparse.ArgumentParser(prog='...')
+    parser.add_argument('--fanout', metavar='amount', type=int, default=2, help='Amount of nodes every node (and the local machine) forwards data to (default=2).')
+    args = parser.parse_args(args)
+    if args.fanout < 1:
+        return False, [], {}
+    return True, [], {'fanout': args.fanout}
+
+
+def estimate(network, size, num_files, num_nodes, *args, **kwargs):
+    '''Predicts the completion time in seconds. Every level of the tree waits for the level above, and every sender shares its uplink with its children.'''
+    fanout = kwargs.get('fanout') or 2
+    levels, reached = 0, 0
+    while reached < num_nodes:
+        levels += 1
+        reached += fanout**levels
+    first = min(fanout, num_nodes)*size/network.local_bandwidth + 2*network.local_latency
+    return first + (levels-1)*(fanout*size/network.node_bandwidth + network.node_latency) + levels*num_files*network.per_file
+
+
+async def execute(reservation, key_path, paths, dest, silent, copy_multiplier, link_multiplier, *args, **kwargs):
+    connectionwrappers = kwargs.get('connectionwrappers')
+    report = kwargs.get('report')
+    fanout = kwargs.get('fanout') or 2
+    engine = kwargs.get('engine')
+
+    use_local_connections = connectionwrappers == None
+    if use_local_connections: # We did not get any connections, so we must make them
+        ssh_kwargs = {'IdentitiesOnly': 'yes', 'StrictHostKeyChecking': 'no'}
+        if key_path:
+            ssh_kwargs['IdentityFile'] = key_path
+        connectionwrappers = await ssh_wrapper.get_wrappers_async(engine, reservation.nodes, lambda node: node.ip_public, ssh_params=lambda node: _merge_kwargs(ssh_kwargs, {'User': node.extra_info['user']}), silent=silent, report=report)
+    else:
+        if len(connectionwrappers) != len(reservation):
+            raise ValueError('Provided connections do not contain all nodes: reservation length={}, connections amount={}'.format(len(connectionwrappers), len(reservation)))
+    if not all(x.open for x in connectionwrappers.values()):
+        printe('Not all provided connections are open.')
+        return False
+
+    retval = await _execute_internal(engine, connectionwrappers, reservation, paths, dest, silent, copy_multiplier, link_multiplier, fanout, report=report)
+    if use_local_connections:
+        await ssh_wrapper.close_wrappers_async(engine, connectionwrappers)
+    return retval
\ No newline at end of file
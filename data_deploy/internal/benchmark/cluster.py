@@ -0,0 +1,145 @@
+import getpass
+import os
+import shutil
+import socket
+import subprocess
+import time
+
+import metareserve
+
+import data_deploy.internal.util.fs as fs
+from data_deploy.internal.util.printer import *
+
+
+'''Simulated cluster on the local machine, for benchmarks. Every node is a sshd process listening on its own loopback address (127.0.1.x), with its own root directory acting as home directory.
+Nodes reach each other by hostname ("dd-bench-<idx>"), using a ssh wrapper placed first on the `PATH` of every ssh session, which points ssh to a cluster-wide ssh config.
+The sshd processes run as the current user, so no root privileges are needed. Requires sshd and ssh-keygen to be installed. Distinct loopback addresses are only available on Linux.'''
+
+# Options for every ssh connection inside the cluster.
+_ssh_options = {'IdentitiesOnly': 'yes', 'StrictHostKeyChecking': 'no', 'UserKnownHostsFile': '/dev/null', 'LogLevel': 'ERROR'}
+
+
+def _find_sshd():
+    return shutil.which('sshd') or next((x for x in ['/usr/sbin/sshd', '/usr/local/sbin/sshd'] if os.path.isfile(x)), None)
+
+
+def _wait_listening(address, port, timeout):
+    deadline = time.time()+timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection((address, port), timeout=1):
+                return True
+        except OSError as e:
+            time.sleep(0.1)
+    return False
+
+
+class LocalCluster(object):
+    '''Starts and stops a simulated cluster. Supports a "with" clause, which stops the cluster on exit.'''
+    def __init__(self, num_nodes, directory, port=2222, subnet='127.0.1'):
+        '''Args:
+            num_nodes (int): Amount of nodes to simulate.
+            directory (str): Directory to store keys, configs and node roots in.
+            port (optional int): Port every sshd listens on, on its own address.
+            subnet (optional str): First 3 bytes of the loopback addresses to give nodes.'''
+        self.directory = directory
+        self.port = port
+        self.key_path = fs.join(directory, 'id_ed25519')
+        self._user = getpass.getuser()
+        self._processes = []
+        self.nodes = [metareserve.Node(node_id=idx, node_name='dd-bench-{}'.format(idx), hostname='dd-bench-{}'.format(idx), ip_local='{}.{}'.format(subnet, idx+1), ip_public='{}.{}'.format(subnet, idx+1), port=port, extra_info={'user': self._user}) for idx in range(num_nodes)]
+        self.reservation = metareserve.Reservation(self.nodes)
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+        return False
+
+
+    def root(self, node):
+        '''Returns the local path to the root (home) directory of a node.'''
+        return fs.join(self.directory, 'nodes', str(node.node_id))
+
+
+    def ssh_params(self, node):
+        '''Returns ssh config options to connect to a node from the local machine, for use with `ssh_wrapper.get_wrappers`.'''
+        params = {'User': self._user, 'Port': self.port, 'IdentityFile': self.key_path}
+        params.update(_ssh_options)
+        return params
+
+
+    def _write_configs(self):
+        bin_dir = fs.join(self.directory, 'bin')
+        config_path = fs.join(self.directory, 'ssh_config')
+        fs.mkdir(bin_dir, exist_ok=True)
+        with open(config_path, 'w') as f:
+            for node in self.nodes:
+                f.write('Host {}\n    HostName {}\n    Port {}\n    User {}\n    IdentityFile {}\n'.format(node.hostname, node.ip_public, self.port, self._user, self.key_path))
+                f.write(''.join('    {} {}\n'.format(k, v) for k, v in _ssh_options.items()))
+        wrapper_path = fs.join(bin_dir, 'ssh')
+        with open(wrapper_path, 'w') as f:
+            f.write('#!/bin/sh\nexec {} -F {} "$@"\n'.format(shutil.which('ssh'), config_path))
+        os.chmod(wrapper_path, 0o755)
+
+        for node in self.nodes:
+            root = self.root(node)
+            fs.mkdir(root, exist_ok=True)
+            with open(fs.join(self.directory, 'nodes', '{}.sshd_config'.format(node.node_id)), 'w') as f:
+                f.write('\n'.join([
+                    'ListenAddress {}:{}'.format(node.ip_public, self.port),
+                    'HostKey {}'.format(fs.join(self.directory, 'host_key')),
+                    'PidFile {}'.format(fs.join(self.directory, 'nodes', '{}.pid'.format(node.node_id))),
+                    'AuthorizedKeysFile {}.pub'.format(self.key_path),
+                    'PasswordAuthentication no',
+                    'StrictModes no',
+                    'UsePAM no',
+                    'SetEnv HOME={} PATH={}:{}'.format(root, bin_dir, os.environ.get('PATH', '/usr/bin:/bin')),
+                    'ForceCommand cd "$HOME" && exec /bin/sh -c "$SSH_ORIGINAL_COMMAND"',
+                ])+'\n')
+
+
+    def start(self, timeout=10):
+        '''Starts all nodes.
+        Returns:
+            `True` on success, `False` on failure.'''
+        sshd = _find_sshd()
+        if not sshd:
+            printe('Could not find sshd, which is needed to simulate a cluster.')
+            return False
+        fs.mkdir(fs.join(self.directory, 'nodes'), exist_ok=True)
+        for path in [self.key_path, fs.join(self.directory, 'host_key')]:
+            if not fs.isfile(path) and subprocess.call(['ssh-keygen', '-q', '-t', 'ed25519', '-N', '', '-f', path]) != 0:
+                printe('Could not generate ssh key {}'.format(path))
+                return False
+        self._write_configs()
+        for node in self.nodes:
+            config_path = fs.join(self.directory, 'nodes', '{}.sshd_config'.format(node.node_id))
+            with open(fs.join(self.directory, 'nodes', '{}.log'.format(node.node_id)), 'w') as log:
+                self._processes.append(subprocess.Popen([sshd, '-D', '-e', '-f', config_path], stdout=log, stderr=log))
+        if not all(_wait_listening(node.ip_public, self.port, timeout) for node in self.nodes):
+            printe('Not all simulated nodes started. See logs in {}'.format(fs.join(self.directory, 'nodes')))
+            self.stop()
+            return False
+        return True
+
+
+    def clear(self, dest):
+        '''Removes `dest` (relative to node roots) from all nodes.'''
+        for node in self.nodes:
+            fs.rm(self.root(node), dest, ignore_errors=True)
+
+
+    def stop(self):
+        '''Stops all nodes.'''
+        for process in self._processes:
+            process.terminate()
+        for process in self._processes:
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired as e:
+                process.kill()
+        self._processes = []
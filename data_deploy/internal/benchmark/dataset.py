@@ -0,0 +1,82 @@
+import json
+import os
+
+import data_deploy.internal.util.fs as fs
+
+
+'''Synthetic datasets for benchmarks. Every file is unique, and half of its content is random while the other half compresses well, so neither deduplication nor compression gives unrealistic results.
+Datasets are generated once and reused, as long as their specification did not change.'''
+
+# Maps dataset name to a list of `(amount of files, file size in bytes)` groups, at scale 1.
+kinds = {
+    'small': [(20000, 4*1024)],
+    'large': [(4, 256*1024*1024)],
+    'mixed': [(5000, 16*1024), (200, 1024*1024), (2, 128*1024*1024)],
+}
+
+# Amount of files to place in one directory.
+_files_per_dir = 1000
+
+
+def names():
+    '''Returns names of all available datasets.'''
+    return list(kinds.keys())
+
+
+def _spec(kind, scale):
+    '''Returns the `(amount of files, file size)` groups for a dataset at given scale. Amounts are scaled for many small files, sizes are scaled for few large files.'''
+    spec = []
+    for amount, size in kinds[kind]:
+        if amount >= 100:
+            spec.append([max(1, int(amount*scale)), size])
+        else:
+            spec.append([amount, max(1, int(size*scale))])
+    return spec
+
+
+def _write_file(path, index, size, blocksize=1024*1024):
+    with open(path, 'wb') as f:
+        header = '{}\n'.format(index).encode()
+        f.write(header[:size])
+        remaining = size - min(size, len(header))
+        while remaining > 0:
+            block = min(blocksize, remaining)
+            f.write(os.urandom(block//2))
+            f.write(b'\0'*(block-block//2))
+            remaining -= block
+
+
+def generate(kind, directory, scale=1.0):
+    '''Generates a dataset, unless it already exists with the same specification.
+    Args:
+        kind (str): Name of the dataset. See `names()`.
+        directory (str): Directory to store datasets in. The dataset is stored in `directory/kind`.
+        scale (optional float): Factor to make the dataset smaller or larger.
+
+    Returns:
+        `(str, int, int)`: Path to the dataset, its total size in bytes, and its amount of files.'''
+    if not kind in kinds:
+        raise ValueError('Unknown dataset "{}". Options: {}'.format(kind, ', '.join(names())))
+    path = fs.join(directory, kind)
+    spec = _spec(kind, scale)
+    marker = fs.join(directory, '.{}.json'.format(kind))
+    try:
+        with open(marker, 'r') as f:
+            if json.load(f) == spec:
+                return (path, *fs.du(path))
+    except (OSError, ValueError) as e:
+        pass
+
+    if fs.exists(path):
+        fs.rm(path, ignore_errors=True)
+    index = 0
+    for group, (amount, size) in enumerate(spec):
+        for idx in range(amount):
+            subdir = fs.join(path, 'group{}'.format(group), 'dir{}'.format(idx//_files_per_dir))
+            if idx % _files_per_dir == 0:
+                fs.mkdir(subdir, exist_ok=True)
+            _write_file(fs.join(subdir, 'file{}'.format(idx)), index, size)
+            index += 1
+    with open(marker, 'w') as f:
+        json.dump(spec, f)
+    return (path, *fs.du(path))
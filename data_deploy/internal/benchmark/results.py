@@ -0,0 +1,84 @@
+import json
+import os
+import statistics
+import subprocess
+
+import data_deploy.internal.util.fs as fs
+import data_deploy.internal.util.location as loc
+
+
+'''Storage of benchmark results. Every result is one line of JSON in a results file, tagged with a label (by default, the git revision of data-deploy).
+Results of the current label are compared with the most recent results of any other label, so regressions between versions are visible.'''
+
+# Fields identifying a benchmark configuration. Results of different labels are compared when these fields match.
+key_fields = ['plugin', 'dataset', 'nodes', 'copy_multiplier', 'link_multiplier']
+
+
+def results_path():
+    return fs.join(loc.benchmark_dir(), 'results.jsonl')
+
+
+def default_label():
+    '''Returns the git revision of this installation, or "unknown".'''
+    try:
+        out = subprocess.check_output(['git', '-C', loc.root(), 'describe', '--always', '--dirty'], stderr=subprocess.DEVNULL)
+        return out.decode().strip() or 'unknown'
+    except (OSError, subprocess.CalledProcessError) as e:
+        return 'unknown'
+
+
+def key(result):
+    return tuple(result[x] for x in key_fields)
+
+
+def load(path=None):
+    '''Returns all stored results, oldest first.'''
+    results = []
+    try:
+        with open(path or results_path(), 'r') as f:
+            for line in f:
+                try:
+                    results.append(json.loads(line))
+                except ValueError as e:
+                    pass
+    except FileNotFoundError as e:
+        pass
+    return results
+
+
+def store(results, path=None):
+    '''Appends results to the results file.'''
+    path = path or results_path()
+    fs.mkdir(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a') as f:
+        for result in results:
+            f.write(json.dumps(result)+'\n')
+
+
+def compare(results, history, tolerance=0.1):
+    '''Compares results against the most recent result with the same configuration, but a different label.
+    Args:
+        results (list(dict)): Results to compare.
+        history (list(dict)): Earlier results, oldest first.
+        tolerance (optional float): Relative slowdown allowed before a result counts as a regression.
+
+    Returns:
+        list of `(result, earlier result or None, relative change in seconds or None, regressed)`.'''
+    previous = dict()
+    for old in history:
+        if old.get('success') and all(old['label'] != x['label'] for x in results if key(x) == key(old)):
+            previous[key(old)] = old
+    compared = []
+    for result in results:
+        old = previous.get(key(result))
+        if old == None or not result['success']:
+            compared.append((result, old, None, not result['success']))
+            continue
+        change = (result['seconds']-old['seconds'])/old['seconds'] if old['seconds'] > 0 else 0.0
+        compared.append((result, old, change, change > tolerance))
+    return compared
+
+
+def median(values):
+    values = [x for x in values if x != None]
+    return statistics.median(values) if values else None
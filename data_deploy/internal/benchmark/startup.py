@@ -0,0 +1,61 @@
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import data_deploy.internal.util.location as loc
+from data_deploy.internal.util.printer import *
+
+
+'''Startup benchmark. Runs CLI commands in fresh interpreters, measuring their wall time and which heavy modules they import.
+Commands which do not talk to nodes must stay cheap, because job scripts call the CLI very often.'''
+
+# CLI commands to measure, as argument lists.
+default_commands = [['-h'], ['plugin'], ['deploy', '-h'], ['clean', '-h'], ['benchmark', '-h']]
+
+# Maximal median wall time per command, in seconds.
+default_budget = 0.15
+
+# Modules which must not be imported by the commands we measure.
+heavy_modules = ['remoto', 'execnet', 'metareserve', 'concurrent.futures', 'logging', 'ssl', 'urllib.request', 'zipfile']
+
+
+def _entrypoint():
+    return os.path.join(loc.root(), 'data_deploy', 'cli', 'entrypoint.py')
+
+
+def _run(args, importtime=False):
+    '''Runs the CLI once. Returns wall time in seconds, and the names of imported modules if `importtime` is set.'''
+    cmd = [sys.executable]+(['-X', 'importtime'] if importtime else [])+[_entrypoint()]+list(args)
+    start = time.time()
+    process = subprocess.run(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    seconds = time.time()-start
+    modules = set(line.split('|')[-1].strip() for line in process.stderr.decode(errors='replace').splitlines() if line.startswith('import time:')) if importtime else set()
+    return seconds, modules
+
+
+def measure(commands=None, runs=5, budget=default_budget, silent=False):
+    '''Measures cold-start time of CLI commands.
+    Args:
+        commands (optional list(list(str))): CLI commands to measure. Defaults to commands which do not talk to nodes.
+        runs (optional int): Amount of runs per command. We compare the median to the budget.
+        budget (optional float): Maximal median wall time per command, in seconds.
+        silent (optional bool): If set, only prints failures.
+
+    Returns:
+        `True` if all commands stay within budget and import no heavy modules, `False` otherwise.'''
+    ok = True
+    for args in commands or default_commands:
+        _run(args) # Warms up the filesystem cache and bytecode caches, so we measure interpreter work, not disk reads.
+        seconds = statistics.median(_run(args)[0] for _ in range(max(1, runs)))
+        heavy = sorted(x for x in _run(args, importtime=True)[1] if x in heavy_modules)
+        within = seconds <= budget and not any(heavy)
+        ok = ok and within
+        if not within or not silent:
+            line = 'data-deploy {}: {:.1f}ms (budget {:.1f}ms){}'.format(' '.join(args), seconds*1000, budget*1000, ', imports heavy modules: {}'.format(', '.join(heavy)) if any(heavy) else '')
+            if within:
+                print(line)
+            else:
+                printe(line)
+    return ok
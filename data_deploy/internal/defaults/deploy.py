@@ -4,4 +4,5 @@ def remote_dir():
 
 
 def retries():
-    5
\ No newline at end of file
+    '''Default amount of times to retry a failed transfer.'''
+    return 5
@@ -0,0 +1,91 @@
+import json
+import os
+import threading
+import time
+
+import data_deploy.internal.util.fs as fs
+import data_deploy.internal.util.location as loc
+
+
+'''Throughput history. After every successful deployment, we record per plugin how fast data was delivered to nodes, and how fast the multipliers inflated it.
+Values are exponential moving averages, so they follow recent deployments. They are stored in the local cache and used to estimate durations of planned deployments.'''
+
+# Weight of new measurements in the exponential moving averages we store.
+_alpha = 0.5
+
+# Stages in which data is delivered to nodes.
+_delivery_stages = ['transfer', 'relay']
+
+# Stages which do not deliver data, but take time after delivery.
+_multiplier_stages = ['copy_multiplier', 'link_multiplier']
+
+_lock = threading.Lock()
+
+
+def _history_path():
+    return fs.join(loc.cache_dir(), 'throughput.json')
+
+
+def _ewma(old, new):
+    return new if old == None else (1-_alpha)*old + _alpha*new
+
+
+def load():
+    '''Returns `dict(str, dict)`, mapping plugin names to their recorded rates: "throughput" (delivered bytes/s, over all nodes), "copy_throughput" (copied bytes/s, over all nodes), "link_rate" (links/s, over all nodes) and "updated" (time of last record).'''
+    try:
+        with open(_history_path(), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        return dict()
+
+
+def record(report):
+    '''Records the rates achieved in a successful deployment. Reports of failed deployments are ignored.
+    Args:
+        report (Report): Report of the deployment.'''
+    if not report or not report.plugin:
+        return
+    measured = report.to_dict()
+    stages = measured['stages']
+    delivered = sum(stages[x]['bytes'] for x in _delivery_stages if x in stages)
+    delivery_seconds = measured['seconds'] - sum(stages[x]['seconds'] for x in _multiplier_stages if x in stages)
+    with _lock:
+        history = load()
+        entry = history.setdefault(report.plugin, dict())
+        if delivered > 0 and delivery_seconds > 0:
+            entry['throughput'] = _ewma(entry.get('throughput'), delivered/delivery_seconds)
+        if 'copy_multiplier' in stages and stages['copy_multiplier']['seconds'] > 0:
+            entry['copy_throughput'] = _ewma(entry.get('copy_throughput'), stages['copy_multiplier']['bytes']/stages['copy_multiplier']['seconds'])
+        if 'link_multiplier' in stages and stages['link_multiplier']['seconds'] > 0:
+            entry['link_rate'] = _ewma(entry.get('link_rate'), stages['link_multiplier']['files']/stages['link_multiplier']['seconds'])
+        entry['updated'] = time.time()
+        fs.mkdir(loc.cache_dir(), exist_ok=True)
+        with open(_history_path()+'.tmp', 'w') as f:
+            json.dump(history, f)
+        os.replace(_history_path()+'.tmp', _history_path())
+
+
+def estimate(entry, size, num_files, num_nodes, copy_multiplier=1, link_multiplier=1):
+    '''Estimates the duration of a deployment from recorded rates.
+    Args:
+        entry (dict): Recorded rates for a plugin, as returned by `load()`.
+        size (int): Size of data to deploy, in bytes.
+        num_files (int): Amount of files to deploy.
+        num_nodes (int): Amount of nodes to deploy to.
+        copy_multiplier (optional int): Copy multiplier to apply.
+        link_multiplier (optional int): Link multiplier to apply.
+
+    Returns:
+        Estimated seconds, or `None` if we have no recorded rate for a needed stage.'''
+    if not entry.get('throughput'):
+        return None
+    seconds = size*num_nodes/entry['throughput']
+    if copy_multiplier > 1:
+        if not entry.get('copy_throughput'):
+            return None
+        seconds += size*(copy_multiplier-1)*num_nodes/entry['copy_throughput']
+    if link_multiplier > 1:
+        if not entry.get('link_rate'):
+            return None
+        seconds += num_files*copy_multiplier*(link_multiplier-1)*num_nodes/entry['link_rate']
+    return seconds
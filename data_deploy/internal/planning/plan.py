@@ -0,0 +1,66 @@
+import data_deploy.internal.planning.history as history
+from data_deploy.internal.remoto.agent import get_agent
+
+
+'''Dry-run deployment plans. A plan lists the bytes and files every node receives and stores, checks free space on every node, and estimates durations from recorded throughput.
+Making a plan transfers no data: we only query free space on the nodes.'''
+
+
+def _format_bytes(amount):
+    for unit in ['B', 'KiB', 'MiB', 'GiB', 'TiB']:
+        if amount < 1024 or unit == 'TiB':
+            return '{:.1f} {}'.format(amount, unit) if unit != 'B' else '{} B'.format(amount)
+        amount /= 1024
+
+
+def _space(wrapper, dest):
+    ok, results = get_agent(wrapper.connection).run([('space', dest)], silent=True)
+    return results[0][0][1] if ok else None
+
+
+def build(executor, wrappers, scanned, dest, copy_multiplier, link_multiplier, plugins):
+    '''Builds a plan.
+    Args:
+        executor (concurrent.futures.Executor): Executor to query nodes with.
+        wrappers (dict(metareserve.Node, RemotoSSHWrapper)): Connections to nodes to deploy to.
+        scanned (list(tuple(str, int, int))): Local paths with their size in bytes and amount of files, as returned by `scan.scan()`.
+        dest (str): Remote destination directory.
+        copy_multiplier (int): Copy multiplier to apply.
+        link_multiplier (int): Link multiplier to apply.
+        plugins (list(str)): Names of plugins to estimate durations for.
+
+    Returns:
+        `dict` plan, with keys "size", "files", "nodes" (mapping node addresses to expectations and free space) and "estimates" (mapping plugin names to estimated seconds, or `None` without recorded throughput).'''
+    copy_multiplier, link_multiplier = max(1, copy_multiplier), max(1, link_multiplier)
+    size, num_files = sum(x[1] for x in scanned), sum(x[2] for x in scanned)
+    stored = size*copy_multiplier
+    futures_space = {node: executor.submit(_space, wrapper, dest) for node, wrapper in wrappers.items()}
+    nodes = dict()
+    for node, future in sorted(futures_space.items(), key=lambda x: x[0].ip_public):
+        space = future.result()
+        nodes[node.ip_public] = {
+            'transfer_bytes': size, 'stored_bytes': stored, 'files': num_files*copy_multiplier*link_multiplier,
+            'free': space[0] if space else None, 'total': space[1] if space else None, 'fits': (stored <= space[0]) if space else None
+        }
+    recorded = history.load()
+    estimates = {name: history.estimate(recorded.get(name, dict()), size, num_files, len(wrappers), copy_multiplier, link_multiplier) for name in plugins}
+    return {'size': size, 'files': num_files, 'copy_multiplier': copy_multiplier, 'link_multiplier': link_multiplier, 'nodes': nodes, 'estimates': estimates}
+
+
+def ok(plan):
+    '''Returns `True` if every node has enough free space for the plan, `False` otherwise (also if we could not query free space).'''
+    return all(x['fits'] for x in plan['nodes'].values())
+
+
+def format(plan):
+    '''Returns a human-readable representation of a plan.'''
+    lines = ['Plan: {} in {} files, with copy multiplier {} and link multiplier {}.'.format(_format_bytes(plan['size']), plan['files'], plan['copy_multiplier'], plan['link_multiplier'])]
+    for address, node in plan['nodes'].items():
+        if node['free'] == None:
+            space = 'could not query free space'
+        else:
+            space = '{} free of {}{}'.format(_format_bytes(node['free']), _format_bytes(node['total']), '' if node['fits'] else ' (NOT ENOUGH SPACE)')
+        lines.append('    {}: receives {}, stores {} in {} files, {}.'.format(address, _format_bytes(node['transfer_bytes']), _format_bytes(node['stored_bytes']), node['files'], space))
+    for name, seconds in sorted(plan['estimates'].items(), key=lambda x: (x[1] == None, x[1] or 0.0)):
+        lines.append('    Estimated duration with {}: {}'.format(name, 'unknown (no recorded throughput yet)' if seconds == None else '{:.1f}s'.format(seconds)))
+    return '\n'.join(lines)
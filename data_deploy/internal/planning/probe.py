@@ -0,0 +1,93 @@
+import statistics
+import subprocess
+import time
+
+import remoto
+
+import data_deploy.internal.remoto.ssh_wrapper as ssh_wrapper
+from data_deploy.internal.util.printer import *
+
+
+'''Short network probes, feeding the cost models of plugins. We measure latency and bandwidth from the local machine to one node, and between a few pairs of nodes.
+Probes send zeroes, which ssh does not compress unless configured to.'''
+
+# Seconds of overhead per file, per hop (file creation, metadata, per-file protocol messages). Not measured, because it depends mostly on the remote filesystem.
+default_per_file = 0.0002
+
+
+class Network(object):
+    '''Measured network properties. Bandwidths are in bytes/s, latencies are round trip times in seconds.'''
+    def __init__(self, local_bandwidth, local_latency, node_bandwidth, node_latency, per_file=default_per_file):
+        self.local_bandwidth = local_bandwidth
+        self.local_latency = local_latency
+        self.node_bandwidth = node_bandwidth
+        self.node_latency = node_latency
+        self.per_file = per_file
+
+
+    def to_dict(self):
+        return {'local_bandwidth': self.local_bandwidth, 'local_latency': self.local_latency, 'node_bandwidth': self.node_bandwidth, 'node_latency': self.node_latency, 'per_file': self.per_file}
+
+
+    def __str__(self):
+        return 'local->node: {:.1f} MB/s, {:.1f} ms. node->node: {:.1f} MB/s, {:.1f} ms.'.format(self.local_bandwidth/(1000*1000), self.local_latency*1000, self.node_bandwidth/(1000*1000), self.node_latency*1000)
+
+
+def _timed(func, *args, **kwargs):
+    start = time.time()
+    result = func(*args, **kwargs)
+    return result, time.time()-start
+
+
+def _local_latency(wrapper, samples):
+    return statistics.median(_timed(remoto.process.check, wrapper.connection, ['true'])[1] for _ in range(samples))
+
+
+def _local_bandwidth(wrapper, hostname, amount, latency):
+    cmd = 'head -c {} /dev/zero | ssh -F {} {} "cat > /dev/null"'.format(amount, wrapper.ssh_config_path, hostname)
+    returncode, seconds = _timed(subprocess.call, cmd, shell=True, stderr=subprocess.DEVNULL)
+    return amount/max(seconds-latency, 1e-6) if returncode == 0 else None
+
+
+def _pair(wrapper, local_latency, target, amount, samples):
+    '''Measures latency and bandwidth from the node behind `wrapper` to `target`. Times are measured locally, so we subtract the local round trip.'''
+    ssh_cmd = 'ssh {} {}'.format(ssh_wrapper.multiplex_options(), target.hostname)
+    if remoto.process.check(wrapper.connection, '{} true'.format(ssh_cmd), shell=True)[2] != 0: # Also sets up the master connection, so later calls do not pay for it.
+        return None, None
+    latency = statistics.median(max(_timed(remoto.process.check, wrapper.connection, '{} true'.format(ssh_cmd), shell=True)[1]-local_latency, 0.0) for _ in range(samples))
+    result, seconds = _timed(remoto.process.check, wrapper.connection, 'head -c {} /dev/zero | {} "cat > /dev/null"'.format(amount, ssh_cmd), shell=True)
+    return latency, (amount/max(seconds-local_latency-latency, 1e-6) if result[2] == 0 else None)
+
+
+def measure(wrappers, amount=32*1024*1024, num_pairs=2, samples=3, silent=False):
+    '''Probes the network.
+    Args:
+        wrappers (dict(metareserve.Node, RemotoSSHWrapper)): Connections to nodes. Probes use up to `2*num_pairs` nodes.
+        amount (optional int): Amount of bytes to send per bandwidth probe.
+        num_pairs (optional int): Amount of node pairs to probe. If there is only 1 node, we assume node->node equals local->node.
+        samples (optional int): Amount of samples per latency probe. We take the median.
+        silent (optional bool): If set, never prints. Otherwise, prints results and errors.
+
+    Returns:
+        `Network` on success, `None` on failure.'''
+    nodes = sorted(wrappers.keys(), key=lambda x: x.ip_public)
+    first = nodes[0]
+    local_latency = _local_latency(wrappers[first], samples)
+    local_bandwidth = _local_bandwidth(wrappers[first], first.ip_public, amount, local_latency)
+    if local_bandwidth == None:
+        if not silent:
+            printe('Could not probe bandwidth to {}'.format(first.ip_public))
+        return None
+
+    pairs = [(nodes[idx], nodes[idx+1]) for idx in range(0, min(len(nodes)-1, 2*num_pairs), 2)]
+    measured = [_pair(wrappers[source], local_latency, target, amount, samples) for source, target in pairs]
+    measured = [x for x in measured if x[1] != None]
+    if any(pairs) and not any(measured):
+        if not silent:
+            printw('Could not probe node->node connections. Assuming they equal local->node connections.')
+    node_latency = statistics.median(x[0] for x in measured) if any(measured) else local_latency
+    node_bandwidth = min(x[1] for x in measured) if any(measured) else local_bandwidth
+    network = Network(local_bandwidth, local_latency, node_bandwidth, node_latency)
+    if not silent:
+        print('Probed network: {}'.format(network))
+    return network
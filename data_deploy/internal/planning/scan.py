@@ -0,0 +1,94 @@
+import concurrent.futures
+import json
+import os
+
+import data_deploy.internal.util.fs as fs
+import data_deploy.internal.util.location as loc
+
+
+'''Fast scans of local datasets, for planning. Directories are scanned in parallel, and the totals of every directory are cached, keyed by its path and modification time.
+A directory's modification time changes when entries are added, removed or renamed, but not when a file inside it is modified in place. Use `rescan` to also pick up such changes.
+Symlinks are followed, like `rsync -L` does.'''
+
+
+def _cache_path():
+    return fs.join(loc.cache_dir(), 'scan.json')
+
+
+def _load_cache():
+    try:
+        with open(_cache_path(), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        return dict()
+
+
+def _store_cache(cache):
+    fs.mkdir(loc.cache_dir(), exist_ok=True)
+    with open(_cache_path()+'.tmp', 'w') as f:
+        json.dump(cache, f)
+    os.replace(_cache_path()+'.tmp', _cache_path())
+
+
+def _scan_dir(path, cache):
+    '''Scans entries directly inside a directory, or takes them from the cache if the directory did not change.
+    Returns:
+        `(str, (int, int), list)`: the path, the identity `(st_dev, st_ino)` of the directory, and the cache entry `[mtime_ns, amount of files, bytes, subdirectory names]`.'''
+    stat = os.stat(path)
+    cached = cache.get(path)
+    if cached and cached[0] == stat.st_mtime_ns:
+        return path, (stat.st_dev, stat.st_ino), cached
+    num_files, size, subdirs = 0, 0, []
+    with os.scandir(path) as it:
+        for entry in it:
+            try:
+                if entry.is_dir(follow_symlinks=True):
+                    subdirs.append(entry.name)
+                else:
+                    size += entry.stat(follow_symlinks=True).st_size
+                    num_files += 1
+            except FileNotFoundError as e: # Dangling symlink.
+                pass
+    return path, (stat.st_dev, stat.st_ino), [stat.st_mtime_ns, num_files, size, subdirs]
+
+
+def scan(paths, threads=None, rescan=False):
+    '''Computes total sizes and file amounts for local paths.
+    Args:
+        paths (iterable(str)): Local files or directories to scan.
+        threads (optional int): Amount of threads to scan with. Defaults to 4 threads per cpu, because scanning waits mostly on the filesystem.
+        rescan (optional bool): If set, ignores cached results.
+
+    Returns:
+        list of `(str, int, int)`: absolute path, total size in bytes and amount of files, for every path.'''
+    cache = dict() if rescan else _load_cache()
+    scanned = dict()
+    results = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=threads or 4*(os.cpu_count() or 1)) as executor:
+        for path in paths:
+            path = os.path.abspath(path)
+            if not fs.isdir(path):
+                results.append((path, os.path.getsize(path), 1))
+                continue
+            size, num_files = 0, 0
+            visited = set()
+            pending = {executor.submit(_scan_dir, path, cache)}
+            while pending:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    dirpath, identity, entry = future.result()
+                    if identity in visited: # Symlink loop, or a directory reachable through multiple symlinks.
+                        continue
+                    visited.add(identity)
+                    scanned[dirpath] = entry
+                    num_files += entry[1]
+                    size += entry[2]
+                    pending.update(executor.submit(_scan_dir, fs.join(dirpath, name), cache) for name in entry[3])
+            results.append((path, size, num_files))
+
+    # Drops cached directories which no longer exist below scanned paths.
+    roots = tuple(x[0]+os.sep for x in results)
+    cache = {k: v for k, v in cache.items() if k in scanned or not k.startswith(roots)}
+    cache.update(scanned)
+    _store_cache(cache)
+    return results
@@ -0,0 +1,40 @@
+from data_deploy.internal.util.printer import *
+
+
+'''Automatic plugin selection. Every plugin implementing the optional `estimate()` function predicts its own completion time from a probed `Network`, the dataset size and the amount of nodes.
+We pick the plugin with the lowest prediction. Copy and link multipliers run on the nodes and cost the same for every plugin, so they are not part of predictions.'''
+
+
+def predict(registrar, network, size, num_files, num_nodes, silent=False):
+    '''Predicts the completion time of every registered plugin, using its default arguments.
+    Args:
+        registrar (Registrar): Registrar containing plugins.
+        network (Network): Probed network properties.
+        size (int): Total size of data to deploy, in bytes.
+        num_files (int): Total amount of files to deploy.
+        num_nodes (int): Amount of nodes to deploy to.
+        silent (optional bool): If set, never prints. Otherwise, prints plugins which could not make a prediction.
+
+    Returns:
+        list of `(plugin, args, kwargs, seconds)`, sorted by predicted time. `seconds` is `None` for plugins without a cost model, which are sorted last.'''
+    predictions = []
+    for plugin in registrar.plugins:
+        try:
+            state, args, kwargs = plugin.parse([])
+            if not state:
+                continue
+            seconds = plugin.estimate(network, size, num_files, num_nodes, *args, **kwargs)
+        except (Exception, SystemExit) as e: # argparse exits on bad arguments.
+            if not silent:
+                printw('Could not predict completion time for plugin "{}": {}'.format(plugin.name, e))
+            continue
+        predictions.append((plugin, args, kwargs, seconds))
+    return sorted(predictions, key=lambda x: (x[3] == None, x[3] or 0.0))
+
+
+def format_predictions(predictions):
+    '''Returns a human-readable table of predictions, marking the chosen (first) plugin.'''
+    lines = []
+    for idx, (plugin, args, kwargs, seconds) in enumerate(predictions):
+        lines.append('{} {:<16} {}'.format('*' if idx == 0 and seconds != None else ' ', plugin.name, 'no cost model' if seconds == None else '{:.2f}s'.format(seconds)))
+    return '\n'.join(lines)
@@ -0,0 +1,98 @@
+import json
+import os
+
+import data_deploy.internal.util.fs as fs
+import data_deploy.internal.util.location as loc
+
+
+'''Persistent index of plugins, stored in the local cache. For every plugin directory, we store its modification time and the plugins found in it.
+For every plugin, we store its modification time and its metadata (description and origin), read from its source without importing it.
+Only directories and plugins which changed since the last run are read again, so finding and describing plugins never imports them.'''
+
+
+def _index_path():
+    return fs.join(loc.cache_dir(), 'plugins.json')
+
+
+def _literal_return(tree, name):
+    '''Returns the string a module-level function returns, if its body is a single `return` of a string literal. Returns `None` otherwise.'''
+    import ast
+    for node in tree.body:
+        if isinstance(node, ast.FunctionDef) and node.name == name:
+            body = [x for x in node.body if not (isinstance(x, ast.Expr) and isinstance(x.value, ast.Constant))] # Skips docstrings.
+            if len(body) == 1 and isinstance(body[0], ast.Return) and isinstance(body[0].value, ast.Constant) and isinstance(body[0].value.value, str):
+                return body[0].value.value
+    return None
+
+
+def read_metadata(path):
+    '''Reads metadata of a plugin from its source, without importing it.
+    Returns:
+        `dict` with keys "description" and "origin". Values are `None` if they are not string literals, in which case the plugin must be imported to get them.'''
+    import ast # Late import: only needed when the index changed.
+    try:
+        with open(path, 'r') as f:
+            tree = ast.parse(f.read(), filename=path)
+    except (OSError, SyntaxError, ValueError) as e:
+        return {'description': None, 'origin': None}
+    return {'description': _literal_return(tree, 'description'), 'origin': _literal_return(tree, 'origin')}
+
+
+class PluginIndex(object):
+    '''Index of plugin files and their metadata.'''
+    def __init__(self, extension):
+        '''Args:
+            extension (str): Filename extension of plugin files.'''
+        self._extension = extension
+        self._changed = False
+        try:
+            with open(_index_path(), 'r') as f:
+                self._index = json.load(f)
+            if self._index.get('extension') != extension:
+                raise ValueError('Index was built for other plugin files.')
+        except (OSError, ValueError) as e:
+            self._index = {'extension': extension, 'dirs': dict(), 'plugins': dict()}
+
+
+    def paths(self, directory):
+        '''Returns full paths of all plugin files in a directory. Lists the directory only if it changed since it was indexed.'''
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except FileNotFoundError as e:
+            return []
+        cached = self._index['dirs'].get(directory)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        found = sorted(fs.join(directory, x) for x in os.listdir(directory) if x.endswith(self._extension) and fs.isfile(directory, x))
+        self._index['dirs'][directory] = [mtime, found]
+        self._changed = True
+        return found
+
+
+    def metadata(self, path):
+        '''Returns the metadata of a plugin file (see `read_metadata()`). Reads the plugin only if it changed since it was indexed.'''
+        mtime = os.stat(path).st_mtime_ns
+        cached = self._index['plugins'].get(path)
+        if cached and cached['mtime'] == mtime:
+            return cached
+        entry = read_metadata(path)
+        entry['mtime'] = mtime
+        self._index['plugins'][path] = entry
+        self._changed = True
+        return entry
+
+
+    def save(self):
+        '''Stores the index, if it changed. Entries of plugins which no longer exist are dropped.'''
+        if not self._changed:
+            return
+        existing = set(path for _, found in self._index['dirs'].values() for path in found)
+        self._index['plugins'] = {k: v for k, v in self._index['plugins'].items() if k in existing}
+        try:
+            fs.mkdir(loc.cache_dir(), exist_ok=True)
+            with open(_index_path()+'.tmp', 'w') as f:
+                json.dump(self._index, f)
+            os.replace(_index_path()+'.tmp', _index_path())
+        except OSError as e: # The index is only a cache.
+            pass
+        self._changed = False
@@ -3,16 +3,18 @@ import data_deploy.internal.util.importer as importer
 from data_deploy.internal.util.printer import *
 
 class Plugin(object):
-    '''Container to hold a path reference to a plugin file. It can also load the plugin.'''
+    '''Container to hold a path reference to a plugin file. It can also load the plugin.
+    Plugins load lazily: only when they parse arguments or execute, or when their metadata was not given and cannot be read from the plugin index.'''
 
 
     # Extension to use for detecting plugin files.
     plugin_extension = '.deploy.plugin.py'
 
     
-    def __init__(self, path, name=None):
+    def __init__(self, path, name=None, metadata=None):
         self._path = path
         self._name = name if name else Plugin.basename(path)
+        self._metadata = metadata or dict()
         self._loaded = False
         self._module = None
 
@@ -37,6 +39,8 @@ class Plugin(object):
 
     @property
     def description(self):
+        if self._metadata.get('description') != None:
+            return self._metadata['description']
         try:
             return self.module.description()
         except AttributeError as e:
@@ -45,6 +49,8 @@ class Plugin(object):
 
     @property
     def origin(self):
+        if self._metadata.get('origin') != None:
+            return self._metadata['origin']
         try:
             return self.module.origin()
         except AttributeError as e:
@@ -56,7 +62,20 @@ class Plugin(object):
         return self.module.parse(args)
 
     def execute(self, reservation, key_path, paths, dest, silent, *args, **kwargs):
-        return self.module.execute(reservation, key_path, paths, dest, silent, *args, **kwargs)
+        '''Executes the plugin. Plugins may implement `execute()` as a coroutine function. These run on an event loop, and receive the orchestration engine to use as keyword argument "engine".'''
+        import inspect # Late import: the CLI must start fast.
+        if not inspect.iscoroutinefunction(self.module.execute):
+            return self.module.execute(reservation, key_path, paths, dest, silent, *args, **kwargs)
+        import data_deploy.internal.util.engine as engine
+        if kwargs.get('engine') == None:
+            kwargs['engine'] = engine.default()
+        return kwargs['engine'].run(self.module.execute(reservation, key_path, paths, dest, silent, *args, **kwargs))
+
+    def estimate(self, network, size, num_files, num_nodes, *args, **kwargs):
+        '''Returns the predicted completion time in seconds, or `None` if the plugin has no cost model (i.e. does not implement `estimate()`).'''
+        if not hasattr(self.module, 'estimate'):
+            return None
+        return self.module.estimate(network, size, num_files, num_nodes, *args, **kwargs)
 
 
     def change_name(self, newname):
@@ -67,6 +86,7 @@ class Plugin(object):
         if self._loaded:
             raise RuntimeError('Cannot load plugin "{}": Already loaded.'.format(self._name))
         self._module = importer.import_full_path(self._path)
+        self._loaded = True
         return self._module
 
 
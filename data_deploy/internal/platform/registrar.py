@@ -20,14 +20,21 @@ class Registrar(object):
         return self._register[name]
 
 
-    def register(self, path):
-        '''Registers given path as a module.'''
-        plugin = Plugin(path)
+    def register(self, path, metadata=None):
+        '''Registers given path as a module. The module is not imported.
+        Args:
+            path (str): Path to plugin file.
+            metadata (optional dict): Metadata of the plugin (keys "description", "origin"), e.g. from the plugin index.'''
+        plugin = Plugin(path, metadata=metadata)
         if plugin.name in self._register:
             print('Plugin "{}" already exists in registry. Registered as "{}"'.format(plugin.name, plugin.name+'0'))
             plugin.change_name(plugin.name+'0')
         self._register[plugin.name] = plugin
 
 
+    def __contains__(self, name):
+        return name in self._register
+
+
     def __len__(self):
         return len(self._register)
\ No newline at end of file
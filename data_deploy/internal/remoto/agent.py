@@ -0,0 +1,95 @@
+import os
+import threading
+import weakref
+
+from data_deploy.internal.remoto.modulegenerator import ModuleGenerator
+import data_deploy.internal.remoto.modules.agent as agent_module
+import data_deploy.internal.remoto.modules.printer as printer_module
+import data_deploy.internal.remoto.modules.remoto_base as remoto_base_module
+import data_deploy.internal.util.fs as fs
+import data_deploy.internal.util.importer as importer
+import data_deploy.internal.util.location as loc
+from data_deploy.internal.util.printer import *
+
+
+'''Local side of the remote agent. The agent module is generated once with the `ModuleGenerator`, and loaded once per connection.
+Afterwards, every call sends a whole batch of operations in a single round trip. See `data_deploy.internal.remoto.modules.agent` for available operations.'''
+
+
+_generate_lock = threading.Lock()
+_generated_module = None
+
+_agents_lock = threading.Lock()
+_agents = weakref.WeakKeyDictionary()
+
+
+def _sources():
+    return [printer_module, agent_module, remoto_base_module]
+
+
+def _generated_path():
+    return fs.join(loc.cache_dir(), 'remote_agent.py')
+
+
+def _load_module():
+    '''Generates the self-contained agent module (if the sources changed since the last generation), and imports it locally.
+    The local module object is needed by execnet to read the source to send.'''
+    global _generated_module
+    with _generate_lock:
+        if _generated_module:
+            return _generated_module
+        path = _generated_path()
+        newest_source = max(os.path.getmtime(x.__file__) for x in _sources())
+        if (not fs.isfile(path)) or os.path.getmtime(path) < newest_source:
+            ModuleGenerator().with_modules(*_sources()).generate(path, silent=True)
+        _generated_module = importer.import_full_path(path)
+        return _generated_module
+
+
+class RemoteAgent(object):
+    '''Handle to an agent running on a remote. Thread-safe: concurrent calls are serialized on the channel.'''
+    def __init__(self, connection, workers=None):
+        self._channel = connection.gateway.remote_exec(_load_module())
+        self._workers = workers
+        self._lock = threading.Lock()
+
+
+    def execute(self, *phases):
+        '''Executes phases of operations on the remote in one round trip. Phases are executed in order, operations within a phase in parallel.
+        Args:
+            phases (list(tuple)): Every phase is a list of operations. An operation is a tuple, e.g. `('mkdir', '/some/path')`.
+
+        Returns:
+            `list` with, for every executed phase, a list of `[success, value_or_error]` for every operation. Execution stops after the first phase with a failure.'''
+        phases = [list(x) for x in phases]
+        with self._lock:
+            self._channel.send('execute({}, {})'.format(repr(phases), self._workers))
+            return self._channel.receive()
+
+
+    def run(self, *phases, silent=False):
+        '''Executes phases of operations. Prints errors if not `silent`.
+        Returns:
+            `True` if all operations succeeded, `False` otherwise, and the results from `execute()`.'''
+        results = self.execute(*phases)
+        errors = [x[1] for phase_results in results for x in phase_results if not x[0]]
+        if len(results) < len(phases) or any(errors):
+            if not silent:
+                printe('Remote agent operations failed ({} errors). First errors:\n{}'.format(len(errors), '\n'.join(errors[:5])))
+            return False, results
+        return True, results
+
+
+    def check(self, *phases, silent=False):
+        '''Executes phases of operations. Returns `True` if all operations succeeded, `False` otherwise. Prints errors if not `silent`.'''
+        return self.run(*phases, silent=silent)[0]
+
+
+def get_agent(connection):
+    '''Returns the agent for given `remoto.Connection`, loading it on the remote if this is the first call for the connection.'''
+    with _agents_lock:
+        agent = _agents.get(connection)
+        if not agent:
+            agent = RemoteAgent(connection)
+            _agents[connection] = agent
+        return agent
\ No newline at end of file
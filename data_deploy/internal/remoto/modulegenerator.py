@@ -1,11 +1,11 @@
-import distutils.sysconfig as sysconfig
 import itertools
 import re
 import sys
+import sysconfig
 import types
 
-import utils.fs as fs
-from utils.printer import *
+import data_deploy.internal.util.fs as fs
+from data_deploy.internal.util.printer import *
 
 
 def _generate_stl_libs():
@@ -13,7 +13,7 @@ def _generate_stl_libs():
     Returns:
         `set(str)` containing all known standard-library files.'''
     ret_list = set()
-    std_lib = sysconfig.get_python_lib(standard_lib=True)
+    std_lib = sysconfig.get_paths()['stdlib']
     std_lib_len = len(std_lib)
 
     found = set()
@@ -30,6 +30,7 @@ def _generate_stl_libs():
         if any(True for x in files if x[-11:] == '__init__.py') and visit_now != std_lib: #If we found '/path/to/python_lib/oof/a/__init__.py', then assume library 'oof.a' exists.
             found.add('.'.join(visit_now[std_lib_len+1:].split(sep)))
     found.update(set(sys.builtin_module_names))
+    found.update(set(getattr(sys, 'stdlib_module_names', ()))) # Includes extension modules, e.g. 'fcntl', which are not '.py' files.
     return found
 
 
@@ -106,8 +107,6 @@ class ModuleGenerator(object):
                             found_stl_import_froms.add(matchtuple)
                         else:
                             found_stl_imports.add(matchtuple[0])
-        if not any(found_stl_import_froms):
-            raise ValueError('Empty from sequence.')
         return found_stl_imports, found_stl_import_froms
 
 
@@ -0,0 +1,583 @@
+import collections
+import concurrent.futures
+import ctypes
+import errno
+import fcntl
+import glob
+import hashlib
+import itertools
+import json
+import os
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+
+'''Remote agent. Loaded once per connection, it executes batches of filesystem operations using a pool of worker threads.
+Operations are tuples, with the operation name first:
+    ('mkdir', path): Creates a directory and all missing parents.
+    ('rm', path): Removes a file or directory tree. Wildcards in `path` are expanded. Missing paths are ignored.
+    ('trash', path, trash_dir, purger[, workers]): Moves a file or directory tree into `trash_dir` with an atomic rename, and starts program source `purger` in the background to delete the trash.
+                                                 Wildcards in `path` are expanded. Missing paths are ignored. Returns the amount of paths trashed.
+    ('copy', src, dst): Copies file `src` to `dst`. Returns the copy strategy used.
+    ('copies', path, num_copies[, workers]): Makes `num_copies` copies of file `path`, or of every file in directory tree `path`, using `workers` threads. Returns `{'strategies': {strategy: amount}, 'bytes': amount, 'files': amount}`.
+    ('link', src, dst): Creates hardlink `dst` pointing to `src`, replacing `dst` if it exists.
+    ('seed', src, dst[, workers]): Creates directory tree `dst` as a copy of `src` made of hardlinks, skipping files generated by the multipliers. Keeps `dst` if it exists. Returns the amount of links made.
+    ('swap', src, dst): Moves directory `src` to `dst`. If `dst` exists, the two are exchanged atomically where the kernel supports it, so `src` then holds the old `dst`.
+    ('links', path, num_links[, num_copies, workers]): Makes `num_links` hardlinks for file `path`, or for every file in directory tree `path`, and for their first `num_copies` copies. Returns the amount of links made.
+    ('stat', path): Returns `[size, mtime]` for `path`, or `None` if it does not exist.
+    ('space', path): Returns `[free, total]` bytes of the filesystem `path` would be stored on. `path` does not need to exist.
+    ('preallocate', path, size, mode): Creates file `path` with exactly `size` bytes of allocated space, and given mode.
+    ('utime', path, mtime): Sets the modification time of `path`.
+    ('hash', path): Returns the content hash of `path`.
+    ('materialize', store, dest, entries[, workers]): For every `[relative path, hash, size, mtime]` in `entries`, copies the object with that hash from content-addressed store `store` to the relative path in `dest`, as a reflink where supported.
+                                                     Returns the relative paths of which the store holds no intact object.
+    ('prune', path, num_copies, num_links): Removes files generated by the multipliers in `path` (a file or directory tree) of which the source file no longer exists, or of which the copy or link number is at least `num_copies` or `num_links`.
+                                            Returns the amount of files removed.
+    ('read_manifest', dest, name): Reads manifest file `name` in `dest`. Returns the entries of which the file still exists with the recorded size and modification time.
+    ('commit_manifest', dest, name): Replaces manifest file `name` in `dest` with the new manifest `name.new`. Removes all files listed only in the old manifest, with the files the multipliers generated for them.
+                                     Returns the amount of files removed.
+    ('rtts', hostnames[, port, samples, workers]): Measures round trip times to given hosts by timing TCP connection setup to `port`, taking the lowest of `samples` measurements.
+                                                Returns `{hostname: seconds}`, with `None` for unreachable hosts.
+    ('ingest', store, dest, entries[, workers]): For every `[relative path, hash]` in `entries`, adds a copy of the file at the relative path in `dest` to content-addressed store `store`, as a reflink where supported. Returns the amount of objects added.'''
+
+
+def _op_mkdir(path):
+    os.makedirs(path, exist_ok=True)
+
+
+def _ignore_missing(func, path, exc_info):
+    '''Error handler for `shutil.rmtree`, ignoring paths removed by someone else in the meantime. Other errors are raised.'''
+    if not isinstance(exc_info[1], FileNotFoundError):
+        raise exc_info[1]
+
+
+def _op_rm(path):
+    targets = glob.glob(path) if any(x in path for x in '*?[') else [path]
+    for target in targets:
+        if os.path.isdir(target) and not os.path.islink(target):
+            shutil.rmtree(target, onerror=_ignore_missing)
+        else:
+            try:
+                os.remove(target)
+            except FileNotFoundError as e:
+                pass
+
+
+# Name of trash directories next to trashed paths, for paths which cannot be renamed into the requested trash directory.
+_trash_name = '.data-deploy-trash'
+
+# Errors indicating a path cannot be renamed into a trash directory: it is on another filesystem, or we may not create the trash directory or rename into it.
+_trash_errors = (errno.EXDEV, errno.EACCES, errno.EPERM, errno.EROFS)
+
+
+def _trash_into(target, trash_dir):
+    '''Renames `target` into `trash_dir`. Returns `True` on success, `False` if `target` does not exist.'''
+    name = '{}.{}'.format(os.path.basename(os.path.normpath(target)), os.urandom(8).hex())
+    for attempt in range(3):
+        os.makedirs(trash_dir, exist_ok=True)
+        try:
+            os.rename(target, os.path.join(trash_dir, name))
+            return True
+        except FileNotFoundError as e:
+            if not os.path.lexists(target):
+                return False
+            # A finishing purger removed the trash directory after we made it.
+    raise OSError(errno.ENOENT, 'Trash directory keeps disappearing', trash_dir)
+
+
+def _start_purger(trash_dir, purger, workers):
+    '''Starts a detached process deleting everything in `trash_dir`, with low CPU and I/O priority. It keeps running after the connection closes.'''
+    cmd = [sys.executable or 'python3', '-c', purger, trash_dir, str(workers or 0)]
+    if shutil.which('ionice'):
+        cmd = ['ionice', '-c', '2', '-n', '7']+cmd
+    if shutil.which('nice'):
+        cmd = ['nice', '-n', '19']+cmd
+    subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True, close_fds=True)
+
+
+def _op_trash(path, trash_dir, purger, workers=None):
+    targets = glob.glob(path) if any(x in path for x in '*?[') else [path]
+    used = set()
+    trashed = 0
+    for target in targets:
+        if not os.path.lexists(target):
+            continue
+        try:
+            if _trash_into(target, trash_dir):
+                used.add(trash_dir)
+                trashed += 1
+            continue
+        except OSError as e:
+            if e.errno not in _trash_errors:
+                raise
+        # The trash directory is on another filesystem, or we may not write its parent. A trash directory next to the target avoids both, unless the target is a mount point.
+        local_trash = os.path.join(os.path.dirname(os.path.normpath(target)), _trash_name)
+        try:
+            if _trash_into(target, local_trash):
+                used.add(local_trash)
+                trashed += 1
+        except OSError as e:
+            if e.errno not in _trash_errors:
+                raise
+            _op_rm(target)
+    for directory in used:
+        _start_purger(directory, purger, workers)
+    return trashed
+
+
+# ioctl request number to make a reflink (copy-on-write clone) of a file, on filesystems supporting it (e.g. XFS, Btrfs).
+_FICLONE = 0x40049409
+
+# Errors indicating a copy strategy is not supported for a given pair of files.
+_unsupported_errors = (errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EBADF, errno.ETXTBSY)
+
+
+def _copy_reflink(src_fd, dst_fd, size):
+    fcntl.ioctl(dst_fd, _FICLONE, src_fd)
+
+
+def _copy_file_range(src_fd, dst_fd, size):
+    copied = 0
+    while copied < size:
+        amount = os.copy_file_range(src_fd, dst_fd, size-copied)
+        if amount == 0:
+            break
+        copied += amount
+
+
+def _copy_sendfile(src_fd, dst_fd, size):
+    copied = 0
+    while copied < size:
+        amount = os.sendfile(dst_fd, src_fd, copied, size-copied)
+        if amount == 0:
+            break
+        copied += amount
+
+
+def _copy_read_write(src_fd, dst_fd, size, blocksize=1024*1024):
+    while True:
+        block = os.read(src_fd, blocksize)
+        if not block:
+            break
+        os.write(dst_fd, block)
+
+
+# Copy strategies, fastest first.
+_copy_strategies = [('reflink', _copy_reflink), ('copy_file_range', _copy_file_range), ('sendfile', _copy_sendfile), ('read_write', _copy_read_write)]
+_copy_strategies = [x for x in _copy_strategies if x[0] != 'copy_file_range' or hasattr(os, 'copy_file_range')]
+
+# Maps (source device, destination device) to the index of the first strategy that may work. Strategies failing with an unsupported-error are skipped afterwards.
+_copy_cache = dict()
+_copy_cache_lock = threading.Lock()
+
+
+def _op_copy(src, dst):
+    src_fd = os.open(src, os.O_RDONLY)
+    try:
+        stat = os.fstat(src_fd)
+        dst_fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, stat.st_mode & 0o7777)
+        try:
+            key = (stat.st_dev, os.fstat(dst_fd).st_dev)
+            with _copy_cache_lock:
+                start = _copy_cache.get(key, 0)
+            for idx in range(start, len(_copy_strategies)):
+                name, strategy = _copy_strategies[idx]
+                try:
+                    strategy(src_fd, dst_fd, stat.st_size)
+                    if idx != start:
+                        with _copy_cache_lock:
+                            _copy_cache[key] = idx
+                    return name
+                except OSError as e:
+                    if e.errno not in _unsupported_errors or idx == len(_copy_strategies)-1:
+                        raise
+                    os.ftruncate(dst_fd, 0) # Discard partial output of the failed strategy.
+                    os.lseek(src_fd, 0, os.SEEK_SET)
+                    os.lseek(dst_fd, 0, os.SEEK_SET)
+        finally:
+            os.close(dst_fd)
+    finally:
+        os.close(src_fd)
+
+
+# Matches names of files generated by the multipliers.
+_generated_regex = re.compile(r'\.(?:copy|link)\.[0-9]+$')
+
+
+# Splits names of files generated by the multipliers in the name of the source file, the copy number and the link number.
+_generated_parts_regex = re.compile(r'^(.*?)(?:\.copy\.([0-9]+))?(?:\.link\.([0-9]+))?$')
+
+
+def _walk_files(path):
+    '''Generates all regular files in a directory tree, except files generated by the multipliers.'''
+    if not os.path.isdir(path):
+        yield path
+        return
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            if not _generated_regex.search(name):
+                yield os.path.join(root, name)
+
+
+def _default_workers():
+    return min(32, (os.cpu_count() or 1) + 4)
+
+
+def _parallel(func, argslist, workers=None):
+    '''Calls `func(*args)` for every `args` in iterable `argslist` using a pool of threads, and generates the results in order.
+    At most a few calls per worker are pending at any time, so memory stays bounded for arbitrarily long iterables.'''
+    workers = max(1, workers or _default_workers())
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = collections.deque()
+        for args in argslist:
+            pending.append(executor.submit(func, *args))
+            if len(pending) >= workers*4:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _copy_sized(src, dst):
+    return _op_copy(src, dst), os.path.getsize(dst)
+
+
+def _op_copies(path, num_copies, workers=None):
+    counts = dict()
+    total_bytes = 0
+    for name, size in _parallel(_copy_sized, ((src, '{}.copy.{}'.format(src, x)) for src in _walk_files(path) for x in range(num_copies)), workers):
+        counts[name] = counts.get(name, 0) + 1
+        total_bytes += size
+    return {'strategies': counts, 'bytes': total_bytes, 'files': sum(counts.values())}
+
+
+def _op_link(src, dst):
+    try:
+        os.remove(dst)
+    except FileNotFoundError as e:
+        pass
+    os.link(src, dst)
+
+
+def _link_args(path, num_links, num_copies):
+    for src in _walk_files(path):
+        for pointed in itertools.chain([src], ('{}.copy.{}'.format(src, x) for x in range(num_copies))):
+            for x in range(num_links):
+                yield pointed, '{}.link.{}'.format(pointed, x)
+
+
+def _op_links(path, num_links, num_copies=0, workers=None):
+    return sum(1 for _ in _parallel(_op_link, _link_args(path, num_links, num_copies), workers))
+
+
+def _link_seed(src, dst):
+    os.link(src, dst, follow_symlinks=False)
+
+
+def _seed_args(src, dst, dir_modes):
+    '''Generates `(src, dst)` pairs to link, and creates the directories they go in. Directory modes are collected in `dir_modes`, to apply after linking: read-only directories would block linking.'''
+    for root, dirs, files in os.walk(src):
+        dirs[:] = [x for x in dirs if x != _trash_name]
+        target = os.path.join(dst, os.path.relpath(root, src))
+        os.makedirs(target, exist_ok=True)
+        dir_modes.append((target, os.stat(root).st_mode & 0o7777))
+        for name in files:
+            if not _generated_regex.search(name):
+                yield os.path.join(root, name), os.path.join(target, name)
+
+
+def _op_seed(src, dst, workers=None):
+    if os.path.lexists(dst): # Kept from an interrupted deployment.
+        return 0
+    tmp = dst+'.seeding'
+    _op_rm(tmp)
+    os.makedirs(tmp)
+    dir_modes = []
+    linked = sum(1 for _ in _parallel(_link_seed, _seed_args(src, tmp, dir_modes), workers)) if os.path.isdir(src) else 0
+    for path, mode in sorted(dir_modes, key=lambda x: x[0].count(os.sep), reverse=True):
+        os.chmod(path, mode)
+    os.rename(tmp, dst) # A partially seeded tree is never mistaken for a complete one.
+    return linked
+
+
+# Flag for renameat2(), exchanging two paths atomically.
+_RENAME_EXCHANGE = 2
+
+# Special file descriptor value, making *at() system calls interpret relative paths relative to the working directory.
+_AT_FDCWD = -100
+
+
+def _exchange(path_a, path_b):
+    '''Atomically exchanges two paths. Raises `OSError` with `errno.ENOSYS` or `errno.EINVAL` if the C library, kernel or filesystem does not support it.'''
+    libc = ctypes.CDLL(None, use_errno=True)
+    try:
+        renameat2 = libc.renameat2
+    except AttributeError as e:
+        raise OSError(errno.ENOSYS, 'renameat2 is not available')
+    if renameat2(_AT_FDCWD, os.fsencode(path_a), _AT_FDCWD, os.fsencode(path_b), _RENAME_EXCHANGE) != 0:
+        error = ctypes.get_errno()
+        raise OSError(error, os.strerror(error), path_a)
+
+
+def _op_swap(src, dst):
+    if not os.path.lexists(dst):
+        os.rename(src, dst)
+        return
+    try:
+        _exchange(src, dst)
+        return
+    except OSError as e:
+        if e.errno not in (errno.ENOSYS, errno.EINVAL):
+            raise
+    # No atomic exchange: `dst` is missing between the first two renames.
+    aside = src+'.swap'
+    os.rename(dst, aside)
+    os.rename(src, dst)
+    os.rename(aside, src)
+
+
+def _op_stat(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError as e:
+        return None
+    return [stat.st_size, int(stat.st_mtime)]
+
+
+def _op_space(path):
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        path = os.path.dirname(path)
+    stat = os.statvfs(path)
+    return [stat.f_bavail*stat.f_frsize, stat.f_blocks*stat.f_frsize]
+
+
+def _op_preallocate(path, size, mode):
+    dirname = os.path.dirname(path)
+    if dirname:
+        os.makedirs(dirname, exist_ok=True)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT, mode)
+    try:
+        os.ftruncate(fd, size)
+        if size > 0 and hasattr(os, 'posix_fallocate'):
+            try:
+                os.posix_fallocate(fd, 0, size)
+            except OSError as e: # Filesystem does not support preallocation. Positional writes still work on the sparse file.
+                pass
+    finally:
+        os.close(fd)
+    os.chmod(path, mode)
+
+
+def _op_utime(path, mtime):
+    os.utime(path, (mtime, mtime))
+
+
+def _op_hash(path, blocksize=1024*1024):
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(blocksize)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+
+# Modification time of all store objects. Store objects are copies, so writes to deployed files never reach them. Objects with another modification time were modified, and are discarded.
+_object_mtime = 1
+
+
+def _object_path(store, digest):
+    return os.path.join(store, 'objects', digest[:2], digest)
+
+
+def _object_intact(obj, size=None):
+    '''Returns whether a store object is unmodified since it was added. Raises `FileNotFoundError` if it does not exist.'''
+    stat = os.stat(obj)
+    # Objects never share their inode with deployed files, and every write changes the modification time.
+    return stat.st_mtime == _object_mtime and stat.st_nlink == 1 and (size == None or stat.st_size == size)
+
+
+def _copy_replace(src, dst, mtime):
+    '''Copies file `src` to a temporary file, sets its modification time, and moves it to `dst`. Readers of `dst` never see a partial file.'''
+    tmp = os.path.join(os.path.dirname(dst), '.{}.{}.tmp'.format(os.path.basename(dst), os.urandom(8).hex()))
+    try:
+        _op_copy(src, tmp)
+        os.utime(tmp, (mtime, mtime))
+        os.replace(tmp, dst)
+    except BaseException as e:
+        _op_rm(tmp)
+        raise
+
+
+def _materialize_single(store, dest, rel, digest, size, mtime):
+    '''Copies a store object into `dest`. Returns `None` on success, `rel` if the store holds no intact object for `digest`.'''
+    obj = _object_path(store, digest)
+    try:
+        if not _object_intact(obj, size): # Modified outside of data-deploy, or added by an older version as a hardlink to a deployed file.
+            _op_rm(obj)
+            return rel
+    except FileNotFoundError as e:
+        return rel
+    target = os.path.join(dest, rel)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    _copy_replace(obj, target, mtime)
+    return None
+
+
+def _op_materialize(store, dest, entries, workers=None):
+    return [x for x in _parallel(_materialize_single, ((store, dest)+tuple(entry) for entry in entries), workers) if x != None]
+
+
+def _ingest_single(store, dest, rel, digest):
+    obj = _object_path(store, digest)
+    try:
+        if _object_intact(obj):
+            return 0
+    except FileNotFoundError as e:
+        pass
+    os.makedirs(os.path.dirname(obj), exist_ok=True)
+    _copy_replace(os.path.join(dest, rel), obj, _object_mtime)
+    return 1
+
+
+def _op_ingest(store, dest, entries, workers=None):
+    return sum(_parallel(_ingest_single, ((store, dest)+tuple(entry) for entry in entries), workers))
+
+
+def _rtt_single(hostname, port, samples):
+    best = None
+    for x in range(samples):
+        try:
+            start = time.perf_counter()
+            socket.create_connection((hostname, port), timeout=2).close()
+            took = time.perf_counter() - start
+            best = took if best == None else min(best, took)
+        except OSError as e:
+            pass
+    return best
+
+
+def _op_rtts(hostnames, port=22, samples=3, workers=None):
+    return dict(zip(hostnames, _parallel(_rtt_single, ((x, port, samples) for x in hostnames), workers)))
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError as e:
+        pass
+
+
+def _generated_for(directory, base):
+    '''Returns the names of the files in `directory` generated by the multipliers for file `base`.'''
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError as e:
+        return []
+    return [x for x in names if x.startswith(base+'.') and _generated_regex.search(x) and _generated_parts_regex.match(x).group(1) == base]
+
+
+def _op_prune(path, num_copies, num_links):
+    if os.path.isdir(path) and not os.path.islink(path):
+        listing = ((root, [x for x in files if _generated_regex.search(x)]) for root, dirs, files in os.walk(path))
+    else:
+        listing = [(os.path.dirname(path) or '.', _generated_for(os.path.dirname(path) or '.', os.path.basename(path)))]
+    removed = 0
+    for root, names in listing:
+        for name in names:
+            base, copy_idx, link_idx = _generated_parts_regex.match(name).groups()
+            if (copy_idx != None and int(copy_idx) >= num_copies) or (link_idx != None and int(link_idx) >= num_links) or not os.path.lexists(os.path.join(root, base)):
+                _remove_file(os.path.join(root, name))
+                removed += 1
+    return removed
+
+
+def _load_manifest(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError) as e: # A missing or corrupt manifest makes us send everything again.
+        return dict()
+
+
+def _op_read_manifest(dest, name):
+    verified = dict()
+    for rel, entry in _load_manifest(os.path.join(dest, name)).items():
+        try:
+            stat = os.stat(os.path.join(dest, rel))
+        except (FileNotFoundError, NotADirectoryError) as e:
+            continue
+        if stat.st_size == entry[0] and int(stat.st_mtime) == entry[1]:
+            verified[rel] = entry
+    return verified
+
+
+def _op_commit_manifest(dest, name):
+    path = os.path.join(dest, name)
+    old = _load_manifest(path)
+    with open(path+'.new', 'r') as f:
+        new = json.load(f)
+    removed = 0
+    for rel in old.keys():
+        if rel in new:
+            continue
+        target = os.path.join(dest, rel)
+        directory = os.path.dirname(target)
+        for stale in [target]+[os.path.join(directory, x) for x in _generated_for(directory, os.path.basename(target))]:
+            _remove_file(stale)
+            removed += 1
+    os.replace(path+'.new', path)
+    return removed
+
+
+_operations = {
+    'mkdir': _op_mkdir,
+    'rm': _op_rm,
+    'trash': _op_trash,
+    'copy': _op_copy,
+    'copies': _op_copies,
+    'link': _op_link,
+    'links': _op_links,
+    'seed': _op_seed,
+    'swap': _op_swap,
+    'stat': _op_stat,
+    'space': _op_space,
+    'hash': _op_hash,
+    'rtts': _op_rtts,
+    'prune': _op_prune,
+    'read_manifest': _op_read_manifest,
+    'commit_manifest': _op_commit_manifest,
+    'materialize': _op_materialize,
+    'ingest': _op_ingest,
+    'preallocate': _op_preallocate,
+    'utime': _op_utime,
+}
+
+
+def _execute_single(op):
+    try:
+        return [True, _operations[op[0]](*op[1:])]
+    except Exception as e:
+        return [False, '{} {}: {}: {}'.format(op[0], op[1] if len(op) > 1 else '', type(e).__name__, e)]
+
+
+def execute(phases, workers=None):
+    '''Executes phases of operations. Phases are executed in order, and operations within a phase are executed in parallel.
+    Stops after the first phase containing a failed operation.
+    If `workers` is not set, uses a worker amount fitting the remote machine.
+    Returns:
+        `list` with, for every executed phase, a list of `[success, value_or_error]` for every operation.'''
+    results = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers or _default_workers())) as executor:
+        for phase in phases:
+            phase_results = list(executor.map(_execute_single, phase))
+            results.append(phase_results)
+            if not all(x[0] for x in phase_results):
+                break
+    return results
\ No newline at end of file
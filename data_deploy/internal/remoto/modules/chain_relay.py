@@ -0,0 +1,66 @@
+import json
+import os
+import shlex
+import subprocess
+import sys
+
+
+'''Relay for chain replication. Reads a stream of files from stdin, stores every file and forwards the stream to the next node in the chain, one chunk at a time.
+Stream format: For every entry, a JSON header line, followed by the file contents for files.
+Header lines look like {"path": <relative path>, "size": <bytes>, "mode": <mode>, "mtime": <mtime>} for files, and {"dir": <relative path>, "mode": <mode>} for directories.
+Directory modes are applied after the stream ended, deepest first, so read-only directories do not block writing the files inside.
+Usage: python3 chain_relay.py <dest> <chunk_size> <ssh_options> [<next_hostname>,<next_hostname>,...]
+With `ssh_options` the options for the ssh connection to the next node, as a single argument, e.g. to share a master connection.'''
+
+
+def _safe_join(dest, rel):
+    if os.path.isabs(rel) or '..' in rel.split(os.sep):
+        raise ValueError('Refusing to write outside destination: {}'.format(rel))
+    return os.path.join(dest, rel)
+
+
+def relay(dest, chunk_size, ssh_options, hops):
+    child = None
+    if hops:
+        # ssh joins the remote command into one string, so the options must be quoted to arrive as one argument.
+        cmd = ['ssh', '-o', 'StrictHostKeyChecking=no']+shlex.split(ssh_options)+[hops[0], 'python3', sys.argv[0], dest, str(chunk_size), shlex.quote(ssh_options)]
+        if len(hops) > 1:
+            cmd.append(','.join(hops[1:]))
+        child = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+    stream = sys.stdin.buffer
+    dir_modes = []
+    while True:
+        line = stream.readline()
+        if not line:
+            break
+        if child:
+            child.stdin.write(line)
+        header = json.loads(line.decode())
+        if 'dir' in header:
+            os.makedirs(_safe_join(dest, header['dir']), exist_ok=True)
+            dir_modes.append((_safe_join(dest, header['dir']), header['mode']))
+            continue
+        path = _safe_join(dest, header['path'])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        remaining = header['size']
+        with open(path, 'wb') as f:
+            while remaining > 0:
+                chunk = stream.read(min(chunk_size, remaining))
+                if not chunk:
+                    raise EOFError('Stream ended while receiving {}'.format(header['path']))
+                if child: # Forward first, so the next node never waits on our disk.
+                    child.stdin.write(chunk)
+                f.write(chunk)
+                remaining -= len(chunk)
+        os.chmod(path, header['mode'])
+        os.utime(path, (header['mtime'], header['mtime']))
+    for path, mode in sorted(dir_modes, key=lambda x: x[0].count(os.sep), reverse=True):
+        os.chmod(path, mode)
+    if child:
+        child.stdin.close()
+        return child.wait()
+    return 0
+
+
+if __name__ == '__main__':
+    exit(relay(sys.argv[1], int(sys.argv[2]), sys.argv[3], sys.argv[4].split(',') if len(sys.argv) > 4 else []))
\ No newline at end of file
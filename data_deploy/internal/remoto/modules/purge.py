@@ -0,0 +1,74 @@
+import collections
+import concurrent.futures
+import fcntl
+import os
+import shutil
+import sys
+
+
+'''Background deletion of trash. Started detached by the remote agent after it moved data into a trash directory (see the agent's "trash" operation).
+Deletes everything in the trash directory, unlinking files with a pool of threads, because a single `rm -rf` of millions of inodes takes many minutes.
+One purger at a time works on a trash directory. Others wait for the lock, then delete whatever was trashed in the meantime.
+When the trash directory is empty, it is removed.
+Usage: python3 purge.py <trash_dir> [<workers>]'''
+
+lock_name = '.lock'
+
+
+def _unlink_all(directory, names):
+    for name in names:
+        try:
+            os.unlink(os.path.join(directory, name))
+        except FileNotFoundError as e:
+            pass
+
+
+def _purge_entry(executor, path, workers):
+    '''Deletes one trashed file or directory tree. Files are unlinked in parallel first, after which only empty directories remain to be removed.'''
+    if os.path.islink(path) or not os.path.isdir(path):
+        _unlink_all(os.path.dirname(path), [os.path.basename(path)])
+        return
+    pending = collections.deque()
+    for dirpath, dirs, files in os.walk(path):
+        links = [x for x in dirs if os.path.islink(os.path.join(dirpath, x))] # os.walk lists symlinks to directories as directories.
+        pending.append(executor.submit(_unlink_all, dirpath, files+links))
+        if len(pending) >= workers*4:
+            pending.popleft().result()
+    while pending:
+        pending.popleft().result()
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def purge(trash_dir, workers):
+    try:
+        fd = os.open(os.path.join(trash_dir, lock_name), os.O_RDWR | os.O_CREAT, 0o600)
+    except FileNotFoundError as e: # Another purger finished and removed the trash directory.
+        return
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            while True:
+                try:
+                    entries = [x for x in os.listdir(trash_dir) if x != lock_name]
+                except FileNotFoundError as e:
+                    return
+                if not entries:
+                    break
+                for name in entries:
+                    _purge_entry(executor, os.path.join(trash_dir, name), workers)
+        # New trash is moved in with a retry, in case we remove the directory right before.
+        _unlink_all(trash_dir, [lock_name])
+        try:
+            os.rmdir(trash_dir)
+        except OSError as e: # Not empty: new trash arrived, and its purger is waiting for the lock.
+            pass
+    finally:
+        os.close(fd)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('Usage: python3 {} <trash_dir> [<workers>]'.format(sys.argv[0]))
+        exit(1)
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 and int(sys.argv[2]) > 0 else min(32, (os.cpu_count() or 1) + 4)
+    purge(sys.argv[1], workers)
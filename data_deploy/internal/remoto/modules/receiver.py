@@ -0,0 +1,56 @@
+import os
+import zlib
+
+
+'''Receiver for native transfers over an execnet channel. Executed on the remote using `gateway.remote_exec()`.
+Every message gets exactly one reply: 'ok' on success, ('error', reason) on failure. Messages are:
+    ('dir', path, mode): Creates directory `path`.
+    ('file', path, size, mode, mtime[, level]): Opens `path` for writing. The next messages are `bytes` chunks, until `size` bytes are received.
+        If `level` is set and nonzero, chunks form a zlib stream, which decompresses to `size` bytes.
+    bytes: A chunk of data for the currently open file.
+    ('done',): Stops the receiver.'''
+
+
+def _finish(state):
+    state['file'].close()
+    os.chmod(state['path'], state['mode'])
+    os.utime(state['path'], (state['mtime'], state['mtime']))
+    state['file'] = None
+
+
+def receive(channel):
+    state = {'file': None}
+    for item in channel:
+        try:
+            if isinstance(item, bytes):
+                if not state['file']:
+                    raise RuntimeError('Received data while no file is open.')
+                if state['decompressor']:
+                    item = state['decompressor'].decompress(item)
+                state['file'].write(item)
+                state['remaining'] -= len(item)
+                if state['remaining'] <= 0:
+                    _finish(state)
+            elif item[0] == 'dir':
+                os.makedirs(item[1], exist_ok=True)
+                os.chmod(item[1], item[2])
+            elif item[0] == 'file':
+                _, path, size, mode, mtime = item[:5]
+                dirname = os.path.dirname(path)
+                if dirname:
+                    os.makedirs(dirname, exist_ok=True)
+                state.update({'file': open(path, 'wb'), 'path': path, 'remaining': size, 'mode': mode, 'mtime': mtime, 'decompressor': zlib.decompressobj() if len(item) > 5 and item[5] else None})
+                if size == 0:
+                    _finish(state)
+            elif item[0] == 'done':
+                channel.send('ok')
+                return
+            else:
+                raise ValueError('Unknown message: {}'.format(item[0]))
+            channel.send('ok')
+        except Exception as e:
+            channel.send(('error', '{}: {}'.format(type(e).__name__, e)))
+
+
+if __name__ == '__channelexec__':
+    receive(channel)
\ No newline at end of file
@@ -0,0 +1,87 @@
+import json
+import os
+import sys
+
+
+'''Peer for swarm deployments. Stores and serves fixed-size chunks of a dataset, so nodes can fetch chunks from each other.
+The spec file describes the dataset, as JSON: {"dirs": [[<relative path>, <mode>], ...], "files": [[<relative path>, <size>, <mode>, <mtime>], ...], "chunks": [<chunk>, ...]}.
+Every chunk is a list of segments [<file index>, <offset>, <length>]. A chunk may span many small files, and a large file may span many chunks.
+Commands:
+    init: Creates all directories and preallocates all files, so chunks can be written in any order.
+    send: Writes a chunk to stdout.
+    recv: Reads a chunk from stdin and writes it in place. Fails if the stream ends early.
+    finish: Sets modes and modification times of all files and directories.
+Usage: python3 swarm_peer.py init|send|recv|finish <dest> <spec> [<chunk>]'''
+
+
+def _safe_join(dest, rel):
+    if os.path.isabs(rel) or '..' in rel.split(os.sep):
+        raise ValueError('Refusing to write outside destination: {}'.format(rel))
+    return os.path.join(dest, rel)
+
+
+def init(dest, spec):
+    for rel, mode in spec['dirs']:
+        os.makedirs(_safe_join(dest, rel), exist_ok=True)
+    for rel, size, mode, mtime in spec['files']:
+        path = _safe_join(dest, rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'ab') as f: # Keeps data of an interrupted earlier attempt, which we overwrite anyway.
+            f.truncate(size)
+    return 0
+
+
+def send(dest, spec, chunk):
+    out = sys.stdout.buffer
+    for idx, offset, length in spec['chunks'][chunk]:
+        fd = os.open(_safe_join(dest, spec['files'][idx][0]), os.O_RDONLY)
+        try:
+            while length > 0:
+                data = os.pread(fd, min(length, 1024*1024), offset)
+                if not data:
+                    raise EOFError('File {} is shorter than expected.'.format(spec['files'][idx][0]))
+                out.write(data)
+                offset += len(data)
+                length -= len(data)
+        finally:
+            os.close(fd)
+    out.flush()
+    return 0
+
+
+def recv(dest, spec, chunk):
+    stream = sys.stdin.buffer
+    for idx, offset, length in spec['chunks'][chunk]:
+        fd = os.open(_safe_join(dest, spec['files'][idx][0]), os.O_WRONLY)
+        try:
+            while length > 0:
+                data = stream.read(min(length, 1024*1024))
+                if not data:
+                    raise EOFError('Stream ended while receiving chunk {}'.format(chunk))
+                os.pwrite(fd, data, offset)
+                offset += len(data)
+                length -= len(data)
+        finally:
+            os.close(fd)
+    return 0
+
+
+def finish(dest, spec):
+    for rel, size, mode, mtime in spec['files']:
+        path = _safe_join(dest, rel)
+        os.chmod(path, mode)
+        os.utime(path, (mtime, mtime))
+    for rel, mode in reversed(spec['dirs']):
+        os.chmod(_safe_join(dest, rel), mode)
+    return 0
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 4 or sys.argv[1] not in ('init', 'send', 'recv', 'finish') or (sys.argv[1] in ('send', 'recv') and len(sys.argv) < 5):
+        print('Usage: python3 {} init|send|recv|finish <dest> <spec> [<chunk>]'.format(sys.argv[0]))
+        exit(1)
+    with open(sys.argv[3], 'r') as f:
+        spec = json.load(f)
+    if sys.argv[1] in ('send', 'recv'):
+        exit(globals()[sys.argv[1]](sys.argv[2], spec, int(sys.argv[4])))
+    exit(globals()[sys.argv[1]](sys.argv[2], spec))
@@ -1,4 +1,5 @@
-import concurrent.futures
+import shutil
+import subprocess
 import tempfile
 import uuid
 
@@ -7,14 +8,23 @@ from data_deploy.thirdparty.sshconf import *
 import logging
 import remoto
 
+import data_deploy.internal.util.engine as _engine
 from data_deploy.internal.util.printer import *
 
 
+def multiplex_options(control_path='~/.ssh/data-deploy-%C', persist=60):
+    '''Returns ssh commandline options to share one master connection per remote host, for use in commands executed on remotes.'''
+    return '-o ControlMaster=auto -o ControlPath={} -o ControlPersist={}'.format(control_path, persist)
+
+
 class RemotoSSHWrapper(object):
-    '''Simple wrapper containing a remoto connection and the file it is using as ssh config.'''
-    def __init__(self, connection, ssh_config=None):
+    '''Simple wrapper containing a remoto connection and the file it is using as ssh config.
+    If a control directory is set, the wrapper also owns a ssh master connection, which all ssh traffic to the remote (remoto, rsync, ssh) reuses.'''
+    def __init__(self, connection, ssh_config=None, hostname=None, control_dir=None):
         self._connection = connection
         self._ssh_config = ssh_config
+        self._hostname = hostname
+        self._control_dir = control_dir
         self._open = True
 
     def __enter__(self):
@@ -32,6 +42,11 @@ class RemotoSSHWrapper(object):
     def ssh_config_path(self):
         return self._ssh_config.name
 
+    @property
+    def multiplexed(self):
+        '''If set, ssh traffic to the remote reuses a master connection.'''
+        return self._control_dir != None
+
     @property
     def open(self):
         '''If set, connection is open. Otherwise, Connection is closed'''
@@ -46,25 +61,31 @@ class RemotoSSHWrapper(object):
     def exit(self):
         if self._connection:
             self._connection.exit()
+        if self._control_dir:
+            _stop_master(self._ssh_config.name, self._hostname)
+            shutil.rmtree(self._control_dir, ignore_errors=True)
+            self._control_dir = None
         if self._ssh_config:
             self._ssh_config.close()
         self._open = False
 
 
 
-def _build_ssh_config(hostname, ssh_params):
+def _build_ssh_config(hostname, ssh_params, control_dir=None):
     '''Writes a temporary ssh config with provided parameters.
     Warning: Returned value must be closed properly.
     Args:
         hostname (str): Hostname to register.
         ssh_params (dict): Parameters to set for hostname. A valid dict would be e.g: {"IdentityFile": "/some/key.rsa", "IdentitiesOnly": "yes", "Port": 22}
+        control_dir (optional str): If set, configures connection multiplexing, with the control socket stored in given directory.
 
     Returns:
         TemporaryFile containing the ssh config.'''
-    if callable(ssh_params):
-        ssh_params = ssh_params(node)
     if not isinstance(ssh_params, dict):
         raise ValueError('ssh_params must be a dict, mapping ssh options to values. E.g: {{"IdentityFile": "/some/key.rsa", "IdentitiesOnly": "yes", "Port": 22}}')
+    if control_dir:
+        ssh_params = ssh_params.copy()
+        ssh_params.update({'ControlMaster': 'auto', 'ControlPath': '{}/master'.format(control_dir), 'ControlPersist': '600'})
     conf = empty_ssh_config_file()
     conf.add(hostname, **ssh_params)
     tmpfile = tempfile.NamedTemporaryFile()
@@ -72,6 +93,27 @@ def _build_ssh_config(hostname, ssh_params):
     return tmpfile
 
 
+def _start_master(ssh_configpath, hostname, timeout=30):
+    '''Starts a ssh master connection in the background. Never prompts for passwords or host keys, so unreachable hosts and interactive logins fail instead of hanging.
+    Args:
+        ssh_configpath (str): Path to the ssh config to use.
+        hostname (str): Remote host to connect to.
+        timeout (optional int): Maximal amount of seconds to wait for the master connection to be established.
+
+    Returns:
+        `True` on success, `False` on failure.'''
+    cmd = ['ssh', '-F', ssh_configpath, '-o', 'BatchMode=yes', '-o', 'ConnectTimeout={}'.format(max(1, timeout//2)), '-M', '-N', '-f', hostname]
+    try:
+        return subprocess.call(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, timeout=timeout) == 0
+    except subprocess.TimeoutExpired as e:
+        return False
+
+
+def _stop_master(ssh_configpath, hostname):
+    '''Stops a ssh master connection.'''
+    return subprocess.call(['ssh', '-F', ssh_configpath, '-O', 'exit', hostname], stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) == 0
+
+
 def _build_conn(hostname, loggername, silent, ssh_configpath=None):
     '''Returns a remoto-wrapped execnet connection.
     Warning: The `remoto.Connection` objects created here must be properly closed.
@@ -98,7 +140,7 @@ def _build_conn(hostname, loggername, silent, ssh_configpath=None):
         return None
 
 
-def get_wrapper(node, hostname, ssh_params=None, loggername=None, silent=False):
+def get_wrapper(node, hostname, ssh_params=None, loggername=None, multiplex=True, silent=False):
     '''Gets a connection wrapper.
     Warning: The `RemotoSSHWrapper` objects created here must be properly closed. A "with" clause is supported to close all wrappers on function exit.
     Args:
@@ -107,6 +149,8 @@ def get_wrapper(node, hostname, ssh_params=None, loggername=None, silent=False):
         ssh_params (optional dict, callable): If set, builds a temporary ssh config file with provided options to open connection with.
                                                        Can be a callable (i.e. function/lambda), which takes 1 node as argument, and outputs the dict with ssh config options (or `None`) for that node.
         loggername (optional str, callable): Name for logger. Can be either a `str` or a callable. Callables must take 1 node as argument, and output the logger name (`str`) to use for that node. If not set, uses random logger name.
+        multiplex (optional bool): If set, opens one ssh master connection, which is reused by the remoto connection and all rsync/ssh calls using the wrapper's ssh config.
+                                   This saves a TCP connection, key exchange and authentication for every call.
         silent (optional bool): If set, connection is silent (except when reporting errors).
 
     Returns:
@@ -122,12 +166,20 @@ def get_wrapper(node, hostname, ssh_params=None, loggername=None, silent=False):
     if callable(ssh_params):
         ssh_params = ssh_params(node)
 
-    ssh_config = _build_ssh_config(hostname, ssh_params) if ssh_params else None
+    control_dir = tempfile.mkdtemp(prefix='data-deploy-') if multiplex else None
+    ssh_config = _build_ssh_config(hostname, ssh_params or {}, control_dir=control_dir) if (ssh_params or multiplex) else None
+    if control_dir and not _start_master(ssh_config.name, hostname):
+        if not silent:
+            printw('Could not start ssh master connection for {}. Continuing without connection multiplexing.'.format(hostname))
+        shutil.rmtree(control_dir, ignore_errors=True)
+        ssh_config.close()
+        control_dir = None
+        ssh_config = _build_ssh_config(hostname, ssh_params) if ssh_params else None
     conn = _build_conn(hostname, loggername, silent, ssh_configpath=ssh_config.name if ssh_config else None)
-    return RemotoSSHWrapper(conn, ssh_config=ssh_config)
+    return RemotoSSHWrapper(conn, ssh_config=ssh_config, hostname=hostname, control_dir=control_dir)
 
 
-def get_wrappers(nodes, hostnames, ssh_params=None, loggername=None, parallel=True, silent=False):
+def get_wrappers(nodes, hostnames, ssh_params=None, loggername=None, parallel=True, multiplex=True, silent=False, report=None):
     '''Gets multiple wrappers at once.
     Warning: The `RemotoSSHWrapper` objects created here must be properly closed.
     Args:
@@ -136,43 +188,69 @@ def get_wrappers(nodes, hostnames, ssh_params=None, loggername=None, parallel=Tr
         ssh_params (optional dict or callable): If set, builds a temporary ssh config file with provided options to open connection with.
                                                        Can be a callable (i.e. function/lambda), which takes 1 node as argument, and outputs the dict with ssh config options (or `None`) for that node.
         loggername (optional callable): Callable must take 1 node as argument, and output the logger name (`str`) to use for that node. If not set, uses random logger names.
-        parallel (optional bool): If set, creates wrappers in parallel. Otherwise, creates sequentially.
+        parallel (optional bool): If set, creates wrappers in parallel, with concurrency bounded by the shared engine (see `get_wrappers_async()`). Otherwise, creates sequentially.
+        multiplex (optional bool): If set, every wrapper opens one ssh master connection, which all ssh traffic to that node reuses.
         silent (optional bool): If set, connections are silent (except when reporting errors).
+        report (optional Report): If set, records the time needed to connect to every node.
 
     Returns:
         `dict(metareserve.Node, RemotoSSHWrapper)`, Maps metareserve.Node to open remoto connection wrapper. Wrapper can be `None`, indicating failure to connect to key node'''
-    hostnames = hostnames if isinstance(hostnames, dict) else {x: hostnames(x) for x in nodes}
     if parallel:
-        with concurrent.futures.ThreadPoolExecutor(max_workers=len(nodes)) as executor:
-            futures_get_wrappers = {x: executor.submit(get_wrapper, x, hostnames[x], ssh_params=ssh_params, loggername=loggername, silent=silent) for x in nodes}
-            return {k: v.result() for k,v in futures_get_wrappers.items()}
-    else:
-        return {x: get_wrapper(x, hostnames[x], ssh_params=ssh_params, loggername=loggername, silent=silent) for x in nodes}
+        engine = _engine.default()
+        return engine.run(get_wrappers_async(engine, nodes, hostnames, ssh_params=ssh_params, loggername=loggername, multiplex=multiplex, silent=silent, report=report))
+    nodes = list(nodes)
+    hostnames = hostnames if isinstance(hostnames, dict) else {x: hostnames(x) for x in nodes}
+    getter = get_wrapper if report == None else lambda node, *args, **kwargs: report.timed('connect', node, get_wrapper, node, *args, **kwargs)
+    return {x: getter(x, hostnames[x], ssh_params=ssh_params, loggername=loggername, multiplex=multiplex, silent=silent) for x in nodes}
 
 
-def close_wrappers(wrappers, parallel=True):
-    '''Closes an iterable of wrappers.
+async def get_wrappers_async(engine, nodes, hostnames, ssh_params=None, loggername=None, multiplex=True, silent=False, report=None):
+    '''Gets multiple wrappers at once, as a coroutine. At most `engine` connection setups run at the same time, so very large reservations do not need a thread per node.
     Args:
-        wrappers (RemotoSSHWrapper, list(RemotoSSHWrapper), dict(RemotoSSHWrapper)): Wrappers to close.
-        parallel (optional bool): If set, closes connections in parallel. Otherwise, closes connections sequentially.'''
+        engine (Engine): Engine bounding the amount of concurrent connection setups.
+        others: See `get_wrappers()`.
+
+    Returns:
+        `dict(metareserve.Node, RemotoSSHWrapper)`, see `get_wrappers()`.'''
+    nodes = list(nodes)
+    hostnames = hostnames if isinstance(hostnames, dict) else {x: hostnames(x) for x in nodes}
+    getter = get_wrapper if report == None else lambda node, *args, **kwargs: report.timed('connect', node, get_wrapper, node, *args, **kwargs)
+    wrappers = await engine.map(lambda x: engine.connect(getter, x, hostnames[x], ssh_params=ssh_params, loggername=loggername, multiplex=multiplex, silent=silent), nodes)
+    return dict(zip(nodes, wrappers))
+
+
+def _closables(wrappers):
     if isinstance(wrappers, RemotoSSHWrapper):
-        closables = [wrappers]
+        return [wrappers]
     elif isinstance(wrappers, dict):
         if isinstance(list(wrappers.keys())[0], RemotoSSHWrapper):
-            closables = wrappers.keys()
+            return list(wrappers.keys())
         elif isinstance(wrappers[list(wrappers.keys())[0]], RemotoSSHWrapper):
-            closables = wrappers.values()
+            return list(wrappers.values())
         else:
             raise ValueError('Provided dict has no RemotoSSHWrapper keys(={}) or values(={})'.format(type(list(wrappers.keys())[0]), type(wrappers[list(wrappers.keys())[0]])))
     elif isinstance(wrappers, list):
-        closables = wrappers
+        return wrappers
     else:
         raise ValueError('Cannot close given wrappers: No dict, list, or single wrapper passed: {}'.format(wrappers))
+
+
+def close_wrappers(wrappers, parallel=True):
+    '''Closes an iterable of wrappers.
+    Args:
+        wrappers (RemotoSSHWrapper, list(RemotoSSHWrapper), dict(RemotoSSHWrapper)): Wrappers to close.
+        parallel (optional bool): If set, closes connections in parallel, with concurrency bounded by the shared engine. Otherwise, closes connections sequentially.'''
     if parallel:
-        with concurrent.futures.ThreadPoolExecutor(max_workers=len(closables)) as executor:
-            futures_close = [executor.submit(x.exit) for x in closables]
-            for x in futures_close:
-                x.result()
+        engine = _engine.default()
+        engine.run(close_wrappers_async(engine, wrappers))
     else:
-        for x in closables:
-            x.exit()
\ No newline at end of file
+        for x in _closables(wrappers):
+            x.exit()
+
+
+async def close_wrappers_async(engine, wrappers):
+    '''Closes an iterable of wrappers, as a coroutine.
+    Args:
+        engine (Engine): Engine bounding the amount of concurrent closes.
+        wrappers (RemotoSSHWrapper, list(RemotoSSHWrapper), dict(RemotoSSHWrapper)): Wrappers to close.'''
+    await engine.map(lambda x: engine.call(x.exit), _closables(wrappers))
@@ -0,0 +1,149 @@
+import json
+import os
+import threading
+import time
+import zlib
+
+import data_deploy.internal.util.fs as fs
+import data_deploy.internal.util.location as loc
+
+
+'''Adaptive compression. Before a file is sent, we sample its compressibility and pick between no compression and zlib at several levels.
+The choice weighs the time to send the (compressed) bytes over the link against the CPU time to compress them.
+Achieved ratios, compression speeds and link speeds are recorded per file type and stored in the local cache, so choices improve on later deploys.'''
+
+# Compression levels to choose from. Level 0 means no compression.
+levels = [0, 1, 3, 6]
+
+# Link speed (bytes/s) assumed when we have never measured it: 1 Gbit/s.
+_default_link_speed = 125*1000*1000
+
+# Weight of new measurements in the exponential moving averages we store.
+_alpha = 0.3
+
+
+def _history_path():
+    return fs.join(loc.cache_dir(), 'compression.json')
+
+
+def _filetype(path):
+    return os.path.splitext(path)[1].lower()
+
+
+def _ewma(old, new):
+    return new if old == None else (1-_alpha)*old + _alpha*new
+
+
+class CompressionPolicy(object):
+    '''Picks compression levels per file. Thread-safe, so one policy can be shared by all transfers of a deployment.'''
+    def __init__(self, link_speed=None, sample_size=64*1024, num_samples=3, min_size=16*1024):
+        '''Args:
+            link_speed (optional int): Link speed to assume, in bytes/s. If not set, uses measured link speeds from earlier transfers.
+            sample_size (optional int): Size of every sample, in bytes.
+            num_samples (optional int): Amount of samples to take, spread over the file.
+            min_size (optional int): Files smaller than this are never compressed.'''
+        self._link_speed = link_speed
+        self._sample_size = sample_size
+        self._num_samples = num_samples
+        self._min_size = min_size
+        self._lock = threading.Lock()
+        try:
+            with open(_history_path(), 'r') as f:
+                self._history = json.load(f)
+        except (OSError, ValueError) as e:
+            self._history = dict()
+        self._history.setdefault('types', dict())
+
+
+    @property
+    def link_speed(self):
+        '''Link speed used for decisions, in bytes/s.'''
+        return self._link_speed or self._history.get('link_speed') or _default_link_speed
+
+
+    def _read_samples(self, path, size):
+        with open(path, 'rb') as f:
+            if size <= self._sample_size*self._num_samples:
+                return [f.read()]
+            samples = []
+            for idx in range(self._num_samples):
+                f.seek((size-self._sample_size)*idx//max(1, self._num_samples-1))
+                samples.append(f.read(self._sample_size))
+            return samples
+
+
+    def _measure(self, samples, level):
+        '''Returns `(ratio, speed)` for compressing samples at given level. Speed is in bytes/s.'''
+        raw = sum(len(x) for x in samples)
+        t0 = time.perf_counter()
+        compressed = sum(len(zlib.compress(x, level)) for x in samples)
+        seconds = max(time.perf_counter()-t0, 1e-6)
+        return compressed/max(1, raw), raw/seconds
+
+
+    def choose(self, path, size=None):
+        '''Picks a compression level for a file.
+        Args:
+            path (str): Local path to file.
+            size (optional int): Size of the file, if known.
+
+        Returns:
+            `(int, float)`: the compression level (0 for none), and the expected ratio of compressed size to original size.'''
+        size = os.path.getsize(path) if size == None else size
+        if size < self._min_size:
+            return 0, 1.0
+        samples = self._read_samples(path, size)
+        measured = {level: self._measure(samples, level) for level in levels[1:]}
+
+        with self._lock:
+            known = self._history['types'].get(_filetype(path), dict())
+        link_speed = self.link_speed
+        best_level, best_ratio, best_time = 0, 1.0, size/link_speed
+        for level, (ratio, speed) in measured.items():
+            if str(level) in known: # Blend in results achieved earlier on full files of this type, which are more accurate than results on small samples.
+                known_ratio, known_speed = known[str(level)]
+                ratio = (ratio+known_ratio)/2
+                speed = known_speed or speed
+            expected_time = max(size/speed, size*ratio/link_speed) # Compression and sending overlap.
+            if expected_time < best_time:
+                best_level, best_ratio, best_time = level, ratio, expected_time
+        return best_level, best_ratio
+
+
+    def record(self, path, level, raw_bytes, sent_bytes, seconds, compress_seconds=None):
+        '''Records results of a transfer, to improve later decisions.
+        Args:
+            path (str): Local path of the sent file.
+            level (int): Compression level used.
+            raw_bytes (int): Size of the file.
+            sent_bytes (int): Amount of bytes sent over the link.
+            seconds (float): Duration of the transfer.
+            compress_seconds (optional float): Time spent compressing, if known.'''
+        if raw_bytes <= 0 or seconds <= 0:
+            return
+        link_seconds = seconds - (compress_seconds or 0)
+        if raw_bytes >= self._min_size and link_seconds > 0:
+            self.record_link(sent_bytes, link_seconds)
+        with self._lock:
+            if level > 0:
+                entry = self._history['types'].setdefault(_filetype(path), dict())
+                old_ratio, old_speed = entry.get(str(level), [None, None])
+                speed = raw_bytes/compress_seconds if compress_seconds else None
+                entry[str(level)] = [_ewma(old_ratio, sent_bytes/raw_bytes), _ewma(old_speed, speed) if speed else old_speed]
+
+
+    def record_link(self, sent_bytes, seconds):
+        '''Records a measured link speed, for transports which cannot report results per file.'''
+        if sent_bytes > 0 and seconds > 0:
+            with self._lock:
+                self._history['link_speed'] = _ewma(self._history.get('link_speed'), sent_bytes/seconds)
+
+
+    def save(self):
+        '''Stores recorded history in the local cache.'''
+        path = _history_path()
+        fs.mkdir(loc.cache_dir(), exist_ok=True)
+        with self._lock:
+            with open(path+'.tmp', 'w') as f:
+                json.dump(self._history, f)
+            os.replace(path+'.tmp', path)
@@ -0,0 +1,91 @@
+import hashlib
+import json
+import os
+import threading
+
+import data_deploy.internal.util.fs as fs
+import data_deploy.internal.util.location as loc
+
+
+'''Deployment journals. A journal records which units of work (e.g. sending a path to a node) completed, so an interrupted or failed deployment can be resumed.
+A journal is identified by the plugin, nodes, source paths and destination of a deployment. It is stored as an append-only file of JSON lines in the local journal directory.
+On success, the journal is removed.'''
+
+
+def _journal_path(name, nodes, paths, dest):
+    key = json.dumps([name, sorted(str(x) for x in nodes), sorted(os.path.abspath(x) for x in paths), dest])
+    return fs.join(loc.journal_dir(), '{}.{}.journal'.format(name, hashlib.blake2b(key.encode(), digest_size=10).hexdigest()))
+
+
+class Journal(object):
+    '''Records completed units of work for one deployment. Thread-safe.'''
+    def __init__(self, name, nodes, paths, dest, resume=False):
+        '''Args:
+            name (str): Name of the deploying plugin.
+            nodes (iterable(str)): Identifiers of all nodes we deploy to, e.g. ip addresses.
+            paths (iterable(str)): Local source paths.
+            dest (str): Remote destination directory.
+            resume (optional bool): If set, loads the journal of an earlier run of the same deployment. Otherwise, discards it.'''
+        self.path = _journal_path(name, nodes, paths, dest)
+        self._done = set()
+        self._lock = threading.Lock()
+        self._file = None
+        if resume:
+            try:
+                with open(self.path, 'r') as f:
+                    for line in f:
+                        try:
+                            self._done.add(tuple(json.loads(line)))
+                        except ValueError as e: # Last line may be incomplete, if we crashed while writing it.
+                            pass
+            except FileNotFoundError as e:
+                pass
+        elif fs.isfile(self.path):
+            fs.rm(self.path)
+
+
+    def __len__(self):
+        return len(self._done)
+
+
+    def done(self, node, unit):
+        '''Returns `True` if given unit of work completed for given node in this or an earlier run.'''
+        with self._lock:
+            return (str(node), str(unit)) in self._done
+
+
+    def mark(self, node, unit):
+        '''Records a completed unit of work. The record is on disk when this function returns.'''
+        entry = (str(node), str(unit))
+        with self._lock:
+            if entry in self._done:
+                return
+            if not self._file:
+                fs.mkdir(loc.journal_dir(), exist_ok=True)
+                self._file = open(self.path, 'a')
+            self._file.write(json.dumps(entry)+'\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._done.add(entry)
+
+
+    def run(self, node, unit, func, *args, **kwargs):
+        '''Executes `func(*args, **kwargs)`, unless given unit already completed. Marks the unit as completed if `func` returns a value evaluating to `True`.
+        Returns:
+            `True` if the unit completed earlier, the return value of `func` otherwise.'''
+        if self.done(node, unit):
+            return True
+        result = func(*args, **kwargs)
+        if result:
+            self.mark(node, unit)
+        return result
+
+
+    def close(self, success):
+        '''Closes the journal. If `success` is set, the deployment completed, and the journal is removed.'''
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+            if success and fs.isfile(self.path):
+                fs.rm(self.path)
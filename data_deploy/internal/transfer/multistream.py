@@ -0,0 +1,139 @@
+import concurrent.futures
+import os
+import shlex
+import subprocess
+
+from data_deploy.internal.remoto.agent import get_agent
+import data_deploy.internal.transfer.rsync as rsync
+import data_deploy.internal.util.fs as fs
+from data_deploy.internal.util.printer import *
+
+
+'''Transfers large files over multiple parallel streams. A file is split in byte ranges, and every range is sent over its own ssh session (and thus its own TCP connection).
+On the remote, the file is preallocated first, after which every stream writes its range in place using positional writes.
+A single TCP stream is limited by its window size and by single-core encryption speed. With multiple streams, throughput scales with the stream count up to line rate.
+Files smaller than `min_size`, and everything else in directories, are sent using rsync.'''
+
+# Files smaller than this amount of bytes are not split.
+default_min_size = 64*1024*1024
+
+# Default amount of parallel streams per file.
+default_streams = 4
+
+# Program writing one range of a file on the remote. Arguments: path, offset, length. Data is read from stdin.
+_writer = '''import os, sys
+fd = os.open(sys.argv[1], os.O_WRONLY)
+offset, end = int(sys.argv[2]), int(sys.argv[2])+int(sys.argv[3])
+while offset < end:
+    block = sys.stdin.buffer.read(min(4*1024*1024, end-offset))
+    if not block:
+        sys.exit(1)
+    offset += os.pwrite(fd, block, offset)
+os.close(fd)'''
+
+
+def _ranges(size, streams):
+    '''Splits `size` bytes into at most `streams` contiguous `(offset, length)` ranges.'''
+    streams = max(1, min(streams, size))
+    step, remainder = divmod(size, streams)
+    ranges = []
+    offset = 0
+    for idx in range(streams):
+        length = step + (1 if idx < remainder else 0)
+        ranges.append((offset, length))
+        offset += length
+    return ranges
+
+
+def _send_range(wrapper, hostname, path, remote_path, offset, length, blocksize=4*1024*1024):
+    # Every stream needs its own TCP connection, so we must bypass the multiplexed master connection.
+    remote_cmd = 'python3 -c {} {} {} {}'.format(shlex.quote(_writer), shlex.quote(remote_path), offset, length)
+    process = subprocess.Popen(['ssh', '-F', wrapper.ssh_config_path, '-o', 'ControlMaster=no', '-o', 'ControlPath=none', hostname, remote_cmd], stdin=subprocess.PIPE)
+    try:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            end = offset+length
+            while offset < end:
+                block = os.pread(fd, min(blocksize, end-offset), offset)
+                if not block:
+                    raise EOFError('File {} shrunk while sending.'.format(path))
+                process.stdin.write(block)
+                offset += len(block)
+        finally:
+            os.close(fd)
+        process.stdin.close()
+    except (BrokenPipeError, EOFError) as e:
+        process.kill()
+    return process.wait() == 0
+
+
+def transfer_file(wrapper, hostname, path, remote_path, streams=default_streams, silent=False):
+    '''Sends a single file over `streams` parallel streams.
+    Args:
+        wrapper (RemotoSSHWrapper): Wrapper for the remote, of which we use the connection and ssh config.
+        hostname (str): Hostname to send data to.
+        path (str): Local file to send.
+        remote_path (str): Full destination path on the remote.
+        streams (optional int): Amount of parallel streams to use.
+        silent (optional bool): If set, never prints. Otherwise, prints on error.
+
+    Returns:
+        `True` on success, `False` on failure.'''
+    stat = os.stat(path)
+    agent = get_agent(wrapper.connection)
+    if not agent.check([('preallocate', remote_path, stat.st_size, stat.st_mode & 0o7777)], silent=silent):
+        return False
+    ranges = _ranges(stat.st_size, streams)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(ranges) or 1) as executor:
+        futures_send = [executor.submit(_send_range, wrapper, hostname, path, remote_path, offset, length) for offset, length in ranges]
+        if not all(x.result() for x in futures_send):
+            if not silent:
+                printe('Could not send all byte ranges of {} to {}'.format(path, hostname))
+            return False
+    return agent.check([('utime', remote_path, stat.st_mtime)], silent=silent)
+
+
+def _is_large(path, min_size):
+    return os.path.isfile(path) and os.path.getsize(path) >= min_size
+
+
+def transfer(wrapper, hostname, path, dest, compression=None, streams=default_streams, min_size=default_min_size, silent=False):
+    '''Sends a local file or directory to `dest` on the remote. Large files are split over parallel streams.
+    Args:
+        wrapper (RemotoSSHWrapper): Wrapper for the remote.
+        hostname (str): Hostname to send data to.
+        path (str): Local file or directory to send. It is stored as `dest/basename(path)`.
+        dest (str): Remote destination directory.
+        compression (optional CompressionPolicy): Used for files sent with rsync. Split files are never compressed.
+        streams (optional int): Amount of parallel streams per large file.
+        min_size (optional int): Files of at least this amount of bytes are split.
+        silent (optional bool): If set, never prints. Otherwise, prints on error.
+
+    Returns:
+        `True` on success, `False` on failure.'''
+    path = os.path.abspath(path)
+    if fs.isfile(path):
+        if _is_large(path, min_size):
+            return transfer_file(wrapper, hostname, path, fs.join(dest, fs.basename(path)), streams=streams, silent=silent)
+        return rsync.transfer(wrapper, hostname, path, dest, compression=compression, silent=silent)
+    sources = rsync.walk(path)
+    return transfer_files(wrapper, hostname, sources, sources.keys(), dest, compression=compression, streams=streams, min_size=min_size, silent=silent)
+
+
+def transfer_files(wrapper, hostname, sources, rels, dest, compression=None, streams=default_streams, min_size=default_min_size, silent=False):
+    '''Sends a subset of files to a remote. Each relative path keeps its place under `dest`. Large files are split over parallel streams, one file at a time.
+    Args:
+        wrapper (RemotoSSHWrapper): Wrapper for the remote.
+        hostname (str): Hostname to send data to.
+        sources (dict(str, str)): Maps relative paths to absolute local paths.
+        rels (iterable(str)): Relative paths to send.
+        dest (str): Remote destination directory.
+
+    Returns:
+        `True` on success, `False` on failure.'''
+    rels = list(rels)
+    large = set(rel for rel in rels if _is_large(sources[rel], min_size))
+    small = [rel for rel in rels if not rel in large]
+    if any(small) and not rsync.transfer_files(wrapper, hostname, sources, small, dest, compression=compression, silent=silent):
+        return False
+    return all(transfer_file(wrapper, hostname, sources[rel], fs.join(dest, rel), streams=streams, silent=silent) for rel in large)
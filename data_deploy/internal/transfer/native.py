@@ -0,0 +1,153 @@
+import os
+import time
+import zlib
+
+import data_deploy.internal.remoto.modules.receiver as receiver
+import data_deploy.internal.util.fs as fs
+from data_deploy.internal.util.printer import *
+
+
+'''Native transfers: Streams file chunks over the existing execnet channel of a `RemotoSSHWrapper` to a receiver on the remote.
+Unlike rsync, this does not fork a process or open a new ssh session per transfer.
+Follows symlinks and preserves file modes and modification times. Hardlinks, ACLs and extended attributes are not preserved.
+If a `CompressionPolicy` is given, every file is compressed with the level the policy picks for it.'''
+
+
+def _entries(path, dest):
+    '''Generates `(message, absolute_path)` for a local path and everything below it. For directories, `absolute_path` is `None`.'''
+    path = os.path.abspath(path)
+    base = fs.join(dest, fs.basename(path))
+    if not fs.exists(path):
+        raise FileNotFoundError('No such file or directory: {}'.format(path))
+    if fs.isfile(path):
+        stat = os.stat(path)
+        yield ('file', base, stat.st_size, stat.st_mode & 0o7777, stat.st_mtime), path
+        return
+    for root, dirs, files in os.walk(path, followlinks=True):
+        rel_root = base if root == path else fs.join(base, os.path.relpath(root, path))
+        yield ('dir', rel_root, os.stat(root).st_mode & 0o7777), None
+        for name in files:
+            full = fs.join(root, name)
+            try:
+                stat = os.stat(full)
+            except FileNotFoundError as e: # Dangling symlink.
+                continue
+            yield ('file', fs.join(rel_root, name), stat.st_size, stat.st_mode & 0o7777, stat.st_mtime), full
+
+
+class _Stream(object):
+    '''Sends messages over a channel, with at most `window` messages awaiting a reply.'''
+    def __init__(self, channel, window):
+        self._channel = channel
+        self._window = window
+        self._inflight = 0
+        self.error = None
+
+    def _receive(self):
+        reply = self._channel.receive()
+        self._inflight -= 1
+        if reply != 'ok' and not self.error:
+            self.error = reply[1]
+
+    def send(self, message):
+        self._channel.send(message)
+        self._inflight += 1
+        while self._inflight >= self._window:
+            self._receive()
+        return not self.error
+
+    def drain(self):
+        while self._inflight > 0:
+            self._receive()
+        return not self.error
+
+
+def _send_file(stream, message, full, chunk_size, compression=None):
+    size = message[2]
+    level, _ = compression.choose(full, size) if compression else (0, 1.0)
+    if level > 0:
+        message = message+(level,)
+        compressor = zlib.compressobj(level)
+    if not stream.send(message):
+        return False
+    remaining = size
+    sent = 0
+    compress_seconds = 0.0
+    t0 = time.perf_counter()
+    with open(full, 'rb') as f:
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                raise EOFError('File {} shrunk while sending.'.format(full))
+            remaining -= len(chunk)
+            if level > 0:
+                t1 = time.perf_counter()
+                chunk = compressor.compress(chunk)
+                if remaining == 0:
+                    chunk += compressor.flush()
+                compress_seconds += time.perf_counter()-t1
+                if not chunk:
+                    continue
+            if not stream.send(chunk):
+                return False
+            sent += len(chunk)
+    if compression:
+        compression.record(full, level, size, sent, time.perf_counter()-t0, compress_seconds=compress_seconds)
+    return True
+
+
+def _run(wrapper, messages, chunk_size, window, silent, compression=None):
+    '''Opens a receiver channel and sends all given `(message, absolute_path)` pairs.'''
+    channel = wrapper.connection.gateway.remote_exec(receiver)
+    stream = _Stream(channel, window)
+    try:
+        for message, full in messages:
+            ok = _send_file(stream, message, full, chunk_size, compression=compression) if message[0] == 'file' else stream.send(message)
+            if not ok:
+                break
+        stream.send(('done',))
+        ok = stream.drain()
+    except (EOFError, OSError) as e:
+        stream.error = str(e)
+        ok = False
+    finally:
+        channel.close()
+    if not ok and not silent:
+        printe('Native transfer failed: {}'.format(stream.error))
+    return ok
+
+
+def transfer(wrapper, hostname, path, dest, chunk_size=1024*1024, window=16, compression=None, silent=False):
+    '''Sends a local file or directory to `dest` on the remote, over the existing connection of given wrapper.
+    Args:
+        wrapper (RemotoSSHWrapper): Wrapper for the remote.
+        hostname (str): Hostname of the remote. Unused, kept for compatibility with other transports.
+        path (str): Local file or directory to send. It is stored as `dest/basename(path)`.
+        dest (str): Remote destination directory.
+        chunk_size (optional int): Size of data messages in bytes.
+        window (optional int): Maximal amount of messages in flight before we wait for the receiver.
+        compression (optional CompressionPolicy): If set, compresses files using levels picked by this policy.
+        silent (optional bool): If set, never prints. Otherwise, prints on error.
+
+    Returns:
+        `True` on success, `False` on failure.'''
+    return _run(wrapper, _entries(path, dest), chunk_size, window, silent, compression=compression)
+
+
+def transfer_files(wrapper, hostname, sources, rels, dest, chunk_size=1024*1024, window=16, compression=None, silent=False):
+    '''Sends a subset of files to a remote. Each relative path keeps its place under `dest`.
+    Args:
+        wrapper (RemotoSSHWrapper): Wrapper for the remote.
+        hostname (str): Hostname of the remote. Unused, kept for compatibility with other transports.
+        sources (dict(str, str)): Maps relative paths to absolute local paths.
+        rels (iterable(str)): Relative paths to send.
+        dest (str): Remote destination directory.
+        compression (optional CompressionPolicy): If set, compresses files using levels picked by this policy.
+
+    Returns:
+        `True` on success, `False` on failure.'''
+    def messages():
+        for rel in rels:
+            stat = os.stat(sources[rel])
+            yield ('file', fs.join(dest, rel), stat.st_size, stat.st_mode & 0o7777, stat.st_mtime), sources[rel]
+    return _run(wrapper, messages(), chunk_size, window, silent, compression=compression)
\ No newline at end of file
@@ -0,0 +1,78 @@
+import os
+import subprocess
+import tempfile
+import time
+
+
+'''Transfers using rsync over ssh, using the ssh config of a `RemotoSSHWrapper`.
+If a `CompressionPolicy` is given, files are grouped by the compression level the policy picks for them, and every group is sent with its own rsync invocation.'''
+
+
+def walk(path):
+    '''Maps relative paths (starting with the basename of `path`) to absolute paths, for `path` and everything below it. Symlinks are followed.'''
+    path = os.path.abspath(path)
+    parent = os.path.dirname(path)
+    if not os.path.isdir(path):
+        return {os.path.basename(path): path}
+    found = dict()
+    for root, dirs, files in os.walk(path, followlinks=True):
+        for name in dirs+files:
+            full = os.path.join(root, name)
+            found[os.path.relpath(full, parent)] = full
+    found[os.path.basename(path)] = path
+    return found
+
+
+def transfer(wrapper, hostname, path, dest, compression=None, silent=False):
+    '''Sends a local file or directory to `dest` on the remote.
+    Args:
+        wrapper (RemotoSSHWrapper): Wrapper for the remote, of which we use the ssh config.
+        hostname (str): Hostname to send data to.
+        path (str): Local file or directory to send. It is stored as `dest/basename(path)`.
+        dest (str): Remote destination directory.
+        compression (optional CompressionPolicy): If set, compresses files using levels picked by this policy. Hardlinks within `path` are then not preserved.
+        silent (optional bool): Unused, kept for compatibility with other transports. rsync always runs quietly.
+
+    Returns:
+        `True` on success, `False` on failure.'''
+    if compression:
+        sources = walk(path)
+        return transfer_files(wrapper, hostname, sources, sources.keys(), dest, compression=compression, silent=silent)
+    return subprocess.call('rsync -e "ssh -F {}" -q -aHAXL --inplace {} {}:{}/'.format(wrapper.ssh_config_path, path, hostname, dest), shell=True) == 0
+
+
+def transfer_files(wrapper, hostname, sources, rels, dest, compression=None, silent=False):
+    '''Sends a subset of files to a remote. Each relative path keeps its place under `dest`.
+    Args:
+        wrapper (RemotoSSHWrapper): Wrapper for the remote, of which we use the ssh config.
+        hostname (str): Hostname to send data to.
+        sources (dict(str, str)): Maps relative paths to absolute local paths.
+        rels (iterable(str)): Relative paths to send.
+        dest (str): Remote destination directory.
+        compression (optional CompressionPolicy): If set, compresses files using levels picked by this policy.
+
+    Returns:
+        `True` on success, `False` on failure.'''
+    groups = dict() # Maps (parent directory, compression level) to [relative paths, raw bytes, expected bytes on the link].
+    for rel in rels:
+        parent = sources[rel][:len(sources[rel])-len(rel)].rstrip(os.sep)
+        level, ratio, size = 0, 1.0, 0
+        if compression and os.path.isfile(sources[rel]):
+            size = os.path.getsize(sources[rel])
+            level, ratio = compression.choose(sources[rel], size)
+        group = groups.setdefault((parent, level), [[], 0, 0])
+        group[0].append(rel)
+        group[1] += size
+        group[2] += size*ratio
+
+    for (parent, level), (subset, raw_bytes, sent_bytes) in groups.items():
+        compress_opts = ' -z --compress-level={}'.format(level) if level > 0 else ''
+        with tempfile.NamedTemporaryFile('w') as listfile:
+            listfile.write('\n'.join(subset))
+            listfile.flush()
+            t0 = time.perf_counter()
+            if subprocess.call('rsync -e "ssh -F {}" -q -aHAXL --inplace{} --files-from={} {}/ {}:{}/'.format(wrapper.ssh_config_path, compress_opts, listfile.name, parent, hostname, dest), shell=True) != 0:
+                return False
+            if compression:
+                compression.record_link(sent_bytes, time.perf_counter()-t0)
+    return True
\ No newline at end of file
@@ -0,0 +1,171 @@
+import os
+import random
+import threading
+import time
+
+from data_deploy.internal.util.printer import *
+
+
+class _Task(object):
+    '''Container for a single unit of transfer work.'''
+    def __init__(self, idx, func, node, size, disk, args, kwargs):
+        self.idx = idx
+        self.func = func
+        self.node = node
+        self.size = size
+        self.disk = disk
+        self.args = args
+        self.kwargs = kwargs
+        self.attempt = 0
+        self.not_before = 0
+
+
+def backoff_delay(attempt, backoff=1.0, max_backoff=60.0):
+    '''Returns the amount of seconds to wait before retry number `attempt` (starting at 1). Delays grow exponentially, with random jitter so failed tasks do not retry in lockstep.'''
+    return min(max_backoff, backoff*(2**(attempt-1))) * random.uniform(0.5, 1.5)
+
+
+def retry(func, *args, retries=0, backoff=1.0, max_backoff=60.0, **kwargs):
+    '''Calls `func(*args, **kwargs)` until it returns a value evaluating to `True`, at most `retries`+1 times, waiting with exponential backoff between attempts.
+    Returns:
+        Return value of the last call. Exceptions count as failures, with result `False`.'''
+    for attempt in range(retries+1):
+        if attempt > 0:
+            delay = backoff_delay(attempt, backoff, max_backoff)
+            printw('Retry {}/{} in {:.1f} seconds.'.format(attempt, retries, delay))
+            time.sleep(delay)
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            printe('Task raised an exception: {}'.format(e))
+            result = False
+        if result:
+            return result
+    return result
+
+
+def disk_of(path):
+    '''Returns an identifier for the local disk (device) containing given path.'''
+    return os.stat(path).st_dev
+
+
+class TransferScheduler(object):
+    '''Runs transfer tasks with bounded concurrency. We have 3 caps:
+     1. A global cap on the amount of concurrently running tasks, to keep the local link saturated without thrashing it.
+     2. A per-node cap, so no remote receives too many streams at once.
+     3. A per-source-disk cap, so local disks are not overwhelmed with concurrent reads.
+    Tasks are started largest-first, so the last long transfer does not start late. Tasks of equal size keep their insertion order.
+    Failed tasks are retried up to `retries` times, with exponential backoff. A task waiting for its retry does not count towards any cap.'''
+    def __init__(self, max_total=16, max_per_node=2, max_per_disk=8, retries=0, backoff=1.0, max_backoff=60.0):
+        if max_total < 1 or max_per_node < 1 or max_per_disk < 1:
+            raise ValueError('Scheduler caps must be at least 1 (got max_total={}, max_per_node={}, max_per_disk={}).'.format(max_total, max_per_node, max_per_disk))
+        self._max_total = max_total
+        self._max_per_node = max_per_node
+        self._max_per_disk = max_per_disk
+        self._retries = max(0, retries)
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        self._tasks = []
+
+
+    def add(self, func, node, size=0, disk=None, *args, **kwargs):
+        '''Adds a task. The task succeeds when `func(*args, **kwargs)` returns a value evaluating to `True`.
+        Args:
+            func (callable): Function to execute.
+            node (any hashable): Destination of the task, used for the per-node cap.
+            size (optional int): Size of the task in bytes, used for ordering.
+            disk (optional any hashable): Source disk of the task, used for the per-disk cap. `None` means no cap applies.
+
+        Returns:
+            Index of the task. The result of the task is stored in the list returned by `run()` at this index.'''
+        self._tasks.append(_Task(len(self._tasks), func, node, size, disk, args, kwargs))
+        return len(self._tasks) - 1
+
+
+    def __len__(self):
+        return len(self._tasks)
+
+
+    def _pick(self, pending, node_counts, disk_counts):
+        '''Picks the first pending task for which no cap is reached, and which is not waiting for a retry. Returns `None` if no such task exists.'''
+        now = time.monotonic()
+        for pos, task in enumerate(pending):
+            if task.not_before > now:
+                continue
+            if node_counts.get(task.node, 0) >= self._max_per_node:
+                continue
+            if task.disk != None and disk_counts.get(task.disk, 0) >= self._max_per_disk:
+                continue
+            return pending.pop(pos)
+        return None
+
+
+    def _requeue(self, pending, task):
+        '''Schedules a failed task for a retry, keeping `pending` ordered largest-first.'''
+        task.attempt += 1
+        delay = backoff_delay(task.attempt, self._backoff, self._max_backoff)
+        task.not_before = time.monotonic() + delay
+        printw('Transfer task for node {} failed. Retry {}/{} in {:.1f} seconds.'.format(task.node, task.attempt, self._retries, delay))
+        pos = next((idx for idx, x in enumerate(pending) if x.size < task.size), len(pending))
+        pending.insert(pos, task)
+
+
+    def _wait_time(self, pending):
+        '''Returns the amount of seconds until the first retry becomes due, or `None` if no task waits for a retry.'''
+        waiting = [x.not_before for x in pending if x.not_before > 0]
+        return max(0, min(waiting)-time.monotonic()) if any(waiting) else None
+
+
+    def run(self, stop_on_error=True):
+        '''Runs all tasks.
+        Args:
+            stop_on_error (optional bool): If set, does not start any new tasks after a task fails (and has no retries left). Tasks which never started get result `None`.
+
+        Returns:
+            `list` of task results, in order of task addition. Tasks raising an exception have result `False`.'''
+        results = [None for x in self._tasks]
+        if not any(self._tasks):
+            return results
+
+        pending = sorted(self._tasks, key=lambda x: -x.size)
+        node_counts = dict()
+        disk_counts = dict()
+        state = {'failed': False}
+        condition = threading.Condition()
+
+        def worker():
+            while True:
+                with condition:
+                    while True:
+                        if (not any(pending)) or (stop_on_error and state['failed']):
+                            return
+                        task = self._pick(pending, node_counts, disk_counts)
+                        if task:
+                            break
+                        condition.wait(timeout=self._wait_time(pending))
+                    node_counts[task.node] = node_counts.get(task.node, 0) + 1
+                    if task.disk != None:
+                        disk_counts[task.disk] = disk_counts.get(task.disk, 0) + 1
+                try:
+                    result = task.func(*task.args, **task.kwargs)
+                except Exception as e:
+                    printe('Transfer task for node {} raised an exception: {}'.format(task.node, e))
+                    result = False
+                with condition:
+                    if (not result) and task.attempt < self._retries:
+                        self._requeue(pending, task)
+                    else:
+                        results[task.idx] = result
+                        if not result:
+                            state['failed'] = True
+                    node_counts[task.node] -= 1
+                    if task.disk != None:
+                        disk_counts[task.disk] -= 1
+                    condition.notify_all()
+
+        threads = [threading.Thread(target=worker) for x in range(min(self._max_total, len(self._tasks)))]
+        for x in threads:
+            x.start()
+        for x in threads:
+            x.join()
+        return results
\ No newline at end of file
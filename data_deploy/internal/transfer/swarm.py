@@ -0,0 +1,183 @@
+import asyncio
+import random
+import time
+
+from data_deploy.internal.util.printer import *
+
+
+# Source value meaning the local machine.
+LOCAL = None
+
+# Weight of new measurements in the moving averages of upload durations.
+_alpha = 0.3
+
+
+class SwarmScheduler(object):
+    '''Schedules chunk transfers in a swarm. Every node keeps a bitmap of the chunks it holds, and fetches missing chunks from any node holding them.
+    The local machine only seeds: it sends every chunk to at most `seeds` nodes, after which nodes exchange the chunk among each other.
+    Nodes fetch the rarest chunk first (held by the fewest nodes), so new chunks spread quickly and no chunk depends on a single holder for long.
+    Every node has a cap on concurrent downloads and uploads. Among holders with a free upload slot, we pick the one expected to finish first, using measured upload durations.
+    This way, a slow node only slows down its own downloads, and is avoided as a source.'''
+    def __init__(self, nodes, num_chunks, seeds=1, max_local=4, max_uploads=2, max_downloads=2, retries=3):
+        '''Args:
+            nodes (iterable(metareserve.Node)): Nodes to distribute chunks to.
+            num_chunks (int): Amount of chunks to distribute.
+            seeds (optional int): Amount of nodes the local machine sends every chunk to.
+            max_local (optional int): Maximal amount of concurrent transfers from the local machine.
+            max_uploads (optional int): Maximal amount of concurrent transfers from a single node.
+            max_downloads (optional int): Maximal amount of concurrent transfers to a single node.
+            retries (optional int): Amount of times to retry a failed chunk transfer to a node, from any source.'''
+        if seeds < 1 or max_local < 1 or max_uploads < 1 or max_downloads < 1:
+            raise ValueError('Seeds and transfer caps must be at least 1.')
+        self._nodes = list(nodes)
+        self._num_chunks = num_chunks
+        self._seeds = seeds
+        self._max_local = max_local
+        self._max_uploads = max_uploads
+        self._max_downloads = max_downloads
+        self._retries = retries
+
+        self._bitmaps = {node: bytearray(num_chunks) for node in self._nodes}
+        self._missing = {node: set(range(num_chunks)) for node in self._nodes} # Chunks not held and not being fetched.
+        self._holders = [[] for x in range(num_chunks)]
+        self._buckets = {0: set(range(num_chunks))} # Maps amount of holders to chunks.
+        self._seeding = [0 for x in range(num_chunks)] # Amount of running transfers of every chunk from the local machine.
+        self._uploads = {node: 0 for node in self._nodes}
+        self._downloads = {node: 0 for node in self._nodes}
+        self._local = 0
+        self._durations = dict() # Maps sources to moving averages of their upload durations.
+        self._failures = dict()
+        self._held = {node: 0 for node in self._nodes}
+        self.started = dict()
+        self.finished = dict()
+
+
+    def bitmap(self, node):
+        '''Returns the chunk bitmap of a node, as `bytes` with one byte per chunk (1 if held, 0 otherwise).'''
+        return bytes(self._bitmaps[node])
+
+
+    def complete(self, node):
+        return self._held[node] == self._num_chunks
+
+
+    def _source(self, receiver, chunk):
+        '''Returns the best source for a chunk, `LOCAL` for the local machine, or `False` if no source is available now.'''
+        best, best_cost = False, None
+        for holder in self._holders[chunk]:
+            if self._uploads[holder] >= self._max_uploads:
+                continue
+            cost = (self._uploads[holder]+1) * self._durations.get(holder, 0.0)
+            if best_cost == None or cost < best_cost or (cost == best_cost and random.random() < 0.5):
+                best, best_cost = holder, cost
+        if best != False:
+            return best
+        if self._local < self._max_local and len(self._holders[chunk]) + self._seeding[chunk] < self._seeds:
+            return LOCAL
+        return False
+
+
+    def _next(self, receiver):
+        '''Returns the rarest chunk `receiver` misses which has an available source, and that source. Returns `None` if there is none.'''
+        missing = self._missing[receiver]
+        for amount in sorted(self._buckets):
+            for chunk in self._buckets[amount]:
+                if chunk in missing:
+                    source = self._source(receiver, chunk)
+                    if source != False:
+                        return chunk, source
+        return None
+
+
+    def _acquire(self, receiver, chunk, source):
+        self._missing[receiver].discard(chunk)
+        self._downloads[receiver] += 1
+        if source == LOCAL:
+            self._local += 1
+            self._seeding[chunk] += 1
+        else:
+            self._uploads[source] += 1
+        if not receiver in self.started:
+            self.started[receiver] = time.time()
+
+
+    def _release(self, receiver, chunk, source, success, seconds):
+        self._downloads[receiver] -= 1
+        if source == LOCAL:
+            self._local -= 1
+            self._seeding[chunk] -= 1
+        else:
+            self._uploads[source] -= 1
+            if success:
+                old = self._durations.get(source)
+                self._durations[source] = seconds if old == None else (1-_alpha)*old + _alpha*seconds
+        if not success:
+            self._missing[receiver].add(chunk)
+            return
+        amount = len(self._holders[chunk])
+        self._buckets[amount].discard(chunk)
+        if len(self._buckets[amount]) == 0:
+            del self._buckets[amount]
+        self._buckets.setdefault(amount+1, set()).add(chunk)
+        self._holders[chunk].append(receiver)
+        self._bitmaps[receiver][chunk] = 1
+        self._held[receiver] += 1
+        if self.complete(receiver):
+            self.finished[receiver] = time.time()
+
+
+    async def run(self, seed, fetch, silent=False):
+        '''Distributes all chunks to all nodes.
+        Args:
+            seed (callable): Coroutine function `seed(receiver, chunk)`, sending a chunk from the local machine. Must return `True` on success.
+            fetch (callable): Coroutine function `fetch(receiver, source, chunk)`, making `receiver` fetch a chunk from node `source`. Must return `True` on success.
+            silent (optional bool): If set, does not print so much.
+
+        Returns:
+            `True` if all nodes received all chunks, `False` otherwise.'''
+        tasks = dict()
+
+        async def _attempt(coroutine):
+            try:
+                return bool(await coroutine)
+            except Exception as e:
+                printe('Chunk transfer raised an exception: {}'.format(e))
+                return False
+
+        def _start():
+            for receiver in sorted(self._nodes, key=lambda x: self._held[x]): # Nodes lagging behind pick first.
+                while self._downloads[receiver] < self._max_downloads:
+                    picked = self._next(receiver)
+                    if picked == None:
+                        break
+                    chunk, source = picked
+                    self._acquire(receiver, chunk, source)
+                    coroutine = seed(receiver, chunk) if source == LOCAL else fetch(receiver, source, chunk)
+                    tasks[asyncio.ensure_future(_attempt(coroutine))] = (receiver, chunk, source, time.time())
+
+        try:
+            _start()
+            while tasks:
+                done, _ = await asyncio.wait(tasks.keys(), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    receiver, chunk, source, start = tasks.pop(task)
+                    success = task.result()
+                    self._release(receiver, chunk, source, success, time.time()-start)
+                    if not success:
+                        failures = self._failures.get((receiver, chunk), 0) + 1
+                        self._failures[(receiver, chunk)] = failures
+                        if failures > self._retries:
+                            printe('Could not transfer chunk {} to node {} after {} attempts.'.format(chunk, receiver, failures))
+                            return False
+                    elif self.complete(receiver) and not silent:
+                        print('Node {} has all {} chunks ({}/{} nodes done).'.format(receiver, self._num_chunks, len(self.finished), len(self._nodes)))
+                _start()
+        finally:
+            for task in tasks:
+                task.cancel()
+            if any(tasks):
+                await asyncio.gather(*tasks.keys(), return_exceptions=True)
+        if not all(self.complete(x) for x in self._nodes):
+            printe('Swarm stalled: no node can fetch its missing chunks from any source.')
+            return False
+        return True
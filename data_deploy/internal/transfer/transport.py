@@ -0,0 +1,67 @@
+import data_deploy.internal.transfer.multistream as multistream
+import data_deploy.internal.transfer.native as native
+import data_deploy.internal.transfer.rsync as rsync
+import data_deploy.internal.transfer.tarstream as tarstream
+
+
+'''Registry of transports. Every transport module provides:
+    transfer(wrapper, hostname, path, dest, compression=None, silent=False): Sends a local file or directory to `dest/basename(path)` on the remote.
+    transfer_files(wrapper, hostname, sources, rels, dest, compression=None, silent=False): Sends a subset of files, keeping their relative paths under `dest`.
+Both return `True` on success, `False` on failure. If `compression` is set to a `CompressionPolicy`, files are compressed adaptively.
+Next to the transports, there is the "auto" name, which picks "tar" for data with small average file sizes, "multistream" for data with large average file sizes, and "rsync" otherwise.'''
+
+# Data with an average file size below this amount of bytes is sent using tar streams by the "auto" transport.
+default_tar_threshold = 256*1024
+
+# Data with an average file size of at least this amount of bytes is sent over multiple streams per file by the "auto" transport.
+default_split_threshold = 1024*1024*1024
+
+_transports = {
+    'rsync': rsync,
+    'native': native,
+    'tar': tarstream,
+    'multistream': multistream,
+}
+
+
+def names():
+    '''Returns names of all available transports, including "auto".'''
+    return list(_transports.keys())+['auto']
+
+
+def default():
+    return 'auto'
+
+
+def get(name):
+    '''Returns the transport module with given name.'''
+    if not name in _transports:
+        raise ValueError('Unknown transport "{}". Available transports: {}'.format(name, ', '.join(_transports.keys())))
+    return _transports[name]
+
+
+def resolve(name, size, num_files, tar_threshold=default_tar_threshold, split_threshold=default_split_threshold):
+    '''Returns the transport module to send data with.
+    Args:
+        name (str): Transport name. For "auto", picks a transport based on the data to send.
+        size (int): Total size of the data to send, in bytes.
+        num_files (int): Amount of files to send.
+        tar_threshold (optional int): "auto" picks tar streams if the average file size is below this amount of bytes.
+        split_threshold (optional int): "auto" picks multiple streams per file if the average file size is at least this amount of bytes.
+
+    Returns:
+        transport module.'''
+    if name != 'auto':
+        return get(name)
+    if num_files > 1 and size/num_files < tar_threshold:
+        return tarstream
+    if num_files > 0 and size/num_files >= split_threshold:
+        return multistream
+    return rsync
+
+
+def options(transporter, streams=multistream.default_streams):
+    '''Returns keyword arguments for transport-specific options, to pass to `transfer()` and `transfer_files()` of given transport module.'''
+    if transporter == multistream:
+        return {'streams': streams}
+    return dict()
\ No newline at end of file
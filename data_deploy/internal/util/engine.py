@@ -0,0 +1,142 @@
+import asyncio
+import functools
+import os
+import subprocess
+import threading
+import weakref
+
+
+'''Asyncio orchestration engine. Drives connection setup, remote commands and local transfer subprocesses as coroutines.
+Every kind of work is bounded by its own semaphore, so the amount of OS threads and subprocesses stays flat, no matter how many nodes a reservation has.
+Blocking calls (e.g. execnet round trips) run on one shared, bounded thread pool. Local subprocesses are awaited by the event loop, without a thread per subprocess.'''
+
+# Maximal amount of connections we set up at the same time. Every setup starts a ssh master and an execnet gateway.
+default_max_connections = 64
+
+# Maximal amount of blocking calls (remote commands) running at the same time. This is also the size of the shared thread pool.
+default_max_calls = 128
+
+# Maximal amount of local subprocesses (transfers) running at the same time.
+default_max_processes = 4*(os.cpu_count() or 1)
+
+
+class Engine(object):
+    '''Runs coroutines with bounded concurrency. Semaphores are created for every event loop we run in, so one engine can be shared by subsequent `run()` calls and by multiple threads.'''
+    def __init__(self, max_connections=default_max_connections, max_calls=default_max_calls, max_processes=default_max_processes):
+        '''Args:
+            max_connections (optional int): Maximal amount of connection setups at the same time.
+            max_calls (optional int): Maximal amount of blocking calls at the same time.
+            max_processes (optional int): Maximal amount of local subprocesses at the same time.'''
+        self._max_connections = max(1, max_connections)
+        self._max_calls = max(1, max_calls)
+        self._max_processes = max(1, max_processes)
+        self._executor = None
+        self._lock = threading.Lock()
+        self._semaphores = weakref.WeakKeyDictionary()
+
+
+    @property
+    def max_calls(self):
+        return self._max_calls
+
+    @property
+    def executor(self):
+        '''Shared, bounded `concurrent.futures.ThreadPoolExecutor` for blocking calls. Can also be passed to synchronous helpers which expect an executor.
+        Warning: Work submitted to this executor must not wait for other work submitted to it.'''
+        with self._lock:
+            if self._executor == None:
+                import concurrent.futures # Late import: the CLI must start fast.
+                self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self._max_calls, thread_name_prefix='data-deploy-engine')
+            return self._executor
+
+
+    def threads(self, amount):
+        '''Returns the amount of threads to use for `amount` parallel blocking tasks, bounded by the engine's limits.'''
+        return max(1, min(amount, self._max_calls))
+
+
+    def _semaphore(self, kind):
+        '''Returns the semaphore for a kind of work ("connections", "calls", "processes") in the running event loop.'''
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            semaphores = self._semaphores.get(loop)
+            if semaphores == None:
+                semaphores = {'connections': asyncio.Semaphore(self._max_connections), 'calls': asyncio.Semaphore(self._max_calls), 'processes': asyncio.Semaphore(self._max_processes)}
+                self._semaphores[loop] = semaphores
+        return semaphores[kind]
+
+
+    async def _blocking(self, kind, func, *args, **kwargs):
+        async with self._semaphore(kind):
+            return await asyncio.get_running_loop().run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+
+    async def connect(self, func, *args, **kwargs):
+        '''Runs a blocking connection setup function, e.g. `ssh_wrapper.get_wrapper`. Returns its result.'''
+        return await self._blocking('connections', func, *args, **kwargs)
+
+
+    async def call(self, func, *args, **kwargs):
+        '''Runs a blocking function, e.g. a remote command over an execnet connection. Returns its result.'''
+        return await self._blocking('calls', func, *args, **kwargs)
+
+
+    async def process(self, cmd, shell=True, stdin=subprocess.DEVNULL, stdout=None, stderr=None):
+        '''Runs a local subprocess.
+        Args:
+            cmd (str or list(str)): Command to run. Must be a `str` if `shell` is set, a list of arguments otherwise.
+            shell (optional bool): If set, runs command in a shell.
+            stdin, stdout, stderr (optional): Streams for the subprocess, as for `subprocess.Popen`.
+
+        Returns:
+            Exit code of the subprocess.'''
+        async with self._semaphore('processes'):
+            if shell:
+                process = await asyncio.create_subprocess_shell(cmd, stdin=stdin, stdout=stdout, stderr=stderr)
+            else:
+                process = await asyncio.create_subprocess_exec(*cmd, stdin=stdin, stdout=stdout, stderr=stderr)
+            try:
+                return await process.wait()
+            except asyncio.CancelledError:
+                process.kill()
+                raise
+
+
+    async def map(self, func, iterable):
+        '''Awaits `func(x)` for every element of `iterable` concurrently. Concurrency is bounded by the semaphores used inside `func`, not by the amount of elements.
+        Returns:
+            list of results, in order of `iterable`.'''
+        return await asyncio.gather(*[func(x) for x in iterable])
+
+
+    def run(self, coroutine):
+        '''Runs a coroutine to completion in a new event loop, and returns its result.
+        When called from a running event loop (e.g. in Jupyter, or in an async application), the new event loop runs in a separate thread, and this call blocks until it finishes, like any synchronous call.
+        Coroutines should await the async variants of functions instead, which do not block the running loop.'''
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError as e: # No running event loop in this thread.
+            return asyncio.run(coroutine)
+        import concurrent.futures # Late import: the CLI must start fast.
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as runner:
+            return runner.submit(asyncio.run, coroutine).result()
+
+
+    def close(self):
+        '''Stops the shared thread pool. The engine can still be used afterwards: it makes a new pool when needed.'''
+        with self._lock:
+            if self._executor != None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+
+_default = None
+_default_lock = threading.Lock()
+
+def default():
+    '''Returns the engine shared by the whole process.'''
+    global _default
+    with _default_lock:
+        if _default == None:
+            _default = Engine()
+        return _default
@@ -5,10 +5,8 @@
 # Quite a few handy tricks are stored here.
 
 import os
-from pathlib import Path
 import shutil
 import sys
-from zipfile import ZipFile, ZipInfo
 
 
 def abspath(path=os.path.dirname(sys.argv[0])):
@@ -33,6 +31,22 @@ def cwd():
 def dirname(path):
     return os.path.dirname(path)
 
+# Return total size in bytes and amount of files for a file or directory.
+# Symlinks are followed.
+def du(directory, *args):
+    path = join(directory, *args)
+    if not isdir(path):
+        return os.path.getsize(path), 1
+    total_size, total_files = 0, 0
+    for root, dirs, files in os.walk(path, followlinks=True):
+        for name in files:
+            try:
+                total_size += os.path.getsize(join(root, name))
+                total_files += 1
+            except FileNotFoundError as e: # Dangling symlink
+                pass
+    return total_size, total_files
+
 def exists(path, *args):
     return os.path.exists(join(path,*args))
 
@@ -57,6 +71,7 @@ def issymlink(path, *args):
 # Resolve a symlink. With full_resolve, 
 # we keep following links until we find end destination
 def resolvelink(path, *args, full_resolve=True):
+    from pathlib import Path # Late import: importing pathlib costs startup time, and is rarely needed.
     return str(Path(join(path, *args)).resolve().absolute()) if full_resolve else os.readlink(join(path, *args))
 
 def join(directory, *args):
@@ -137,7 +152,7 @@ def unpack(filename, extract_dir):
     import zipfile  # late import for breaking circular dependency
     if not zipfile.is_zipfile(filename):
         raise shutil.ReadError("%s is not a zip file" % filename)
-    zip = _ZipFileWithpermissions(filename)
+    zip = _zipfile_with_permissions()(filename)
     try:
         for info in zip.infolist():
             name = info.filename
@@ -164,28 +179,32 @@ def unpack(filename, extract_dir):
         zip.close()
 
 
-class _ZipFileWithpermissions(ZipFile):
-    '''Zipfile implementation that fixes https://bugs.python.org/issue15795. No one knows why this fix is not merged into the ZipFile project.'''
-    if sys.version_info <= (3, 5):
-        def extract(self, member, path=None, pwd=None):
-            if not isinstance(member, ZipInfo):
-                member = self.getinfo(member)
+def _zipfile_with_permissions():
+    '''Returns a zipfile class that maintains file permissions. Built on first use, because importing zipfile costs startup time.'''
+    import zipfile
+    class _ZipFileWithpermissions(zipfile.ZipFile):
+        '''Zipfile implementation that fixes https://bugs.python.org/issue15795. No one knows why this fix is not merged into the ZipFile project.'''
+        if sys.version_info <= (3, 5):
+            def extract(self, member, path=None, pwd=None):
+                if not isinstance(member, zipfile.ZipInfo):
+                    member = self.getinfo(member)
 
-            if path is None:
-                path = os.getcwd()
+                if path is None:
+                    path = os.getcwd()
 
-            ret_val = self._extract_member(member, path, pwd)
-            attr = member.external_attr >> 16
-            os.chmod(ret_val, attr)
-            return ret_val
-    else:
-        def _extract_member(self, member, targetpath, pwd):
-            if not isinstance(member, ZipInfo):
-                member = self.getinfo(member)
+                ret_val = self._extract_member(member, path, pwd)
+                attr = member.external_attr >> 16
+                os.chmod(ret_val, attr)
+                return ret_val
+        else:
+            def _extract_member(self, member, targetpath, pwd):
+                if not isinstance(member, zipfile.ZipInfo):
+                    member = self.getinfo(member)
 
-            targetpath = super()._extract_member(member, targetpath, pwd)
+                targetpath = super()._extract_member(member, targetpath, pwd)
 
-            attr = member.external_attr >> 16
-            if attr != 0:
-                os.chmod(targetpath, attr)
-            return targetpath
+                attr = member.external_attr >> 16
+                if attr != 0:
+                    os.chmod(targetpath, attr)
+                return targetpath
+    return _ZipFileWithpermissions
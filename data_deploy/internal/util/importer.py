@@ -2,8 +2,6 @@ import importlib
 import os
 import subprocess
 import sys
-import tempfile
-import urllib.request
 
 
 '''Functions to interact with Python's import libraries. As the import libraries change a lot between versions, this file is essential to work with importlib.'''
@@ -56,6 +54,8 @@ def __pip_install1(py):
     return subprocess.call('sudo apt install -y {}-pip'.format(py), shell=True) == 0 #, stderr=subprocess.DEVNULL, stdout=subprocess.DEVNULL
 
 def __pip_install2(py, silent=False):
+    import tempfile
+    import urllib.request # Late import: urllib pulls in http and ssl, which cost startup time.
     url = 'https://bootstrap.pypa.io/get-pip.py'
     with tempfile.TemporaryDirectory() as tmpdir: # We use a tempfile to store the downloaded archive.
         archiveloc = os.path.join(tmpdir, 'get-pip.py')
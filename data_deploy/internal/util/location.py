@@ -10,4 +10,16 @@ def implementation_dir():
 
 def ud_plugin_dir():
     '''Path to the user-defined plugin directory.'''
-    return os.path.join(os.path.expanduser('~'), '.data-deploy')
\ No newline at end of file
+    return os.path.join(os.path.expanduser('~'), '.data-deploy')
+
+def cache_dir():
+    '''Path to the directory where we store local caches (e.g. file hashes).'''
+    return os.path.join(ud_plugin_dir(), 'cache')
+
+def journal_dir():
+    '''Path to the directory where we store deployment journals, used to resume deployments.'''
+    return os.path.join(ud_plugin_dir(), 'journals')
+
+def benchmark_dir():
+    '''Path to the directory where we store benchmark datasets, local clusters and results.'''
+    return os.path.join(ud_plugin_dir(), 'benchmarks')
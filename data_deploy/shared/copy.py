@@ -1,4 +1,4 @@
-import remoto
+from data_deploy.internal.remoto.agent import get_agent
 from data_deploy.internal.util.printer import *
 
 
@@ -6,7 +6,42 @@ def copy_expression(sourcefile, num_copies):
     '''Returns a generator expression for the sourcefile and all copies.'''
     return '''import itertools
 files = itertools.chain(['{0}'], ('{0}.copy.{{}}'.format(x) for x in range({1})))'''.format(sourcefile, num_copies)
-        
+
+
+def copy_names(sourcefile, num_copies):
+    '''Returns the names of all copies for a file. For a file named "X", copies are named "X.copy.0", "X.copy.1", ....'''
+    return ['{}.copy.{}'.format(sourcefile, x) for x in range(num_copies)]
+
+
+def copy_ops(paths, num_copies):
+    '''Returns remote agent operations to make `num_copies` copies for every given file, and for every file in given directories.
+    Copies are made using the fastest strategy the remote filesystem supports: reflinks, `copy_file_range`, `sendfile`, or plain read/write.'''
+    return [('copies', path, num_copies) for path in paths]
+
+
+def copy_strategies(results):
+    '''Sums the copy strategies used, from the results of executing `copy_ops()` operations.
+    Returns:
+        `dict(str, int)` mapping strategy name to amount of copies made with it.'''
+    counts = dict()
+    for success, value in results:
+        if success and isinstance(value, dict):
+            for name, amount in value['strategies'].items():
+                counts[name] = counts.get(name, 0) + amount
+    return counts
+
+
+def copy_totals(results):
+    '''Sums the bytes and files written, from the results of executing `copy_ops()` operations.
+    Returns:
+        `(int, int)`: amount of bytes and amount of files written.'''
+    values = [value for success, value in results if success and isinstance(value, dict)]
+    return sum(x['bytes'] for x in values), sum(x['files'] for x in values)
+
+
+def format_strategies(counts):
+    '''Returns a human-readable summary for output of `copy_strategies()`.'''
+    return ', '.join('{} ({} copies)'.format(name, amount) for name, amount in sorted(counts.items(), key=lambda x: -x[1])) or 'no copies made'
 
 
 def copy_single(connection, sourcefile, num_copies, silent=False):
@@ -16,19 +51,20 @@ def copy_single(connection, sourcefile, num_copies, silent=False):
         sourcefile (str): Path to file to copy.
         num_copies (int): Amount of copies to generate.
         silent (optional bool): If set, never prints. Otherwise, prints on error.'''
+    return copy_multiple(connection, [sourcefile], num_copies, silent=silent)
+
+
+def copy_multiple(connection, sourcefiles, num_copies, silent=False):
+    '''Copies multiple files `num_copies` times each, in a single round trip. Copies are made in parallel on the remote.
+    Args:
+        connection (remoto.Connection): Connection to remote to execute on.
+        sourcefiles (iterable(str)): Paths to files to copy. Directories are walked, and every file inside is copied.
+        num_copies (int): Amount of copies to generate for every file.
+        silent (optional bool): If set, never prints. Otherwise, prints on error.'''
     if num_copies > 0:
-        cmd = '''python3 -c "
-import shutil
-srcloc = '{0}'
-for x in range({1}):
-    dstloc = '{0}.copy.{{}}'.format(x)
-    shutil.copyfile(srcloc, dstloc)
-exit(0)
-"
-'''.format(sourcefile, num_copies)
-        out, error, exitcode = remoto.process.check(connection, cmd, shell=True)
-        if exitcode != 0:
+        sourcefiles = list(sourcefiles)
+        if not get_agent(connection).check(copy_ops(sourcefiles, num_copies), silent=silent):
             if not silent:
-                printe('Could not add copies for file: {}.\nReason: Out: {}\n\nError: {}'.format(sourcefile, '\n'.join(out), '\n'.join(error)))
+                printe('Could not add copies for {} files.'.format(len(sourcefiles)))
             return False
-    return True
\ No newline at end of file
+    return True
@@ -0,0 +1,63 @@
+import data_deploy.shared.manifest as manifest
+import data_deploy.shared.trash as trash
+from data_deploy.internal.remoto.agent import get_agent
+import data_deploy.internal.util.fs as fs
+from data_deploy.internal.util.printer import *
+
+
+def prepare_ops(dest, clean=True):
+    '''Returns remote agent phases to create `dest`, and to remove all old data in it if `clean` is set.
+    Old data is moved to the trash and deleted in the background (see `trash`), so removing it does not stall the deployment.'''
+    phases = [[('mkdir', dest)]]
+    if clean:
+        phases.append(trash.trash_ops([fs.join(dest, '*'), fs.join(dest, manifest.manifest_name)], directory=trash.trash_dir(dest)))
+    return phases
+
+
+def _prepare_single(wrapper, phases, silent):
+    return get_agent(wrapper.connection).check(*phases, silent=silent)
+
+
+def prepare(executor, wrappers, dest, clean=True, silent=False, report=None):
+    '''Creates the destination directory on all given nodes, and removes all old data in it. Needs a single round trip per node.
+    Args:
+        executor (concurrent.futures.Executor): Executor to submit work to.
+        wrappers (dict(metareserve.Node, RemotoSSHWrapper)): Connections to nodes to prepare.
+        dest (str): Remote destination directory.
+        clean (optional bool): If set, removes all old data from the destination directory.
+        silent (optional bool): If set, does not print so much.
+        report (optional Report): If set, records the time needed per node.
+
+    Returns:
+        `True` on success, `False` on failure.'''
+    phases = prepare_ops(dest, clean=clean)
+    if report == None:
+        futures_prepare = {node: executor.submit(_prepare_single, wrapper, phases, silent) for node, wrapper in wrappers.items()}
+    else:
+        futures_prepare = {node: executor.submit(report.timed, 'prepare', node, _prepare_single, wrapper, phases, silent) for node, wrapper in wrappers.items()}
+    return _check_results(((node, future.result()) for node, future in futures_prepare.items()), silent)
+
+
+async def prepare_async(engine, wrappers, dest, clean=True, silent=False, report=None):
+    '''Creates the destination directory on all given nodes, and removes all old data in it, as a coroutine.
+    Args:
+        engine (Engine): Engine bounding the amount of concurrent remote calls.
+        others: See `prepare()`.
+
+    Returns:
+        `True` on success, `False` on failure.'''
+    phases = prepare_ops(dest, clean=clean)
+    if report == None:
+        results = await engine.map(lambda wrapper: engine.call(_prepare_single, wrapper, phases, silent), wrappers.values())
+    else:
+        results = await engine.map(lambda item: engine.call(report.timed, 'prepare', item[0], _prepare_single, item[1], phases, silent), wrappers.items())
+    return _check_results(zip(wrappers.keys(), results), silent)
+
+
+def _check_results(results, silent):
+    for node, success in results:
+        if not success:
+            if not silent:
+                printe('Could not prepare destination directory on node: {}'.format(node))
+            return False
+    return True
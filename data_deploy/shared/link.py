@@ -1,38 +1,54 @@
+import itertools
+
 import remoto
+
+from data_deploy.internal.remoto.agent import get_agent
 from data_deploy.internal.util.printer import *
 
 
+def link_names(pointedfile, num_links):
+    '''Returns the names of all hardlinks for a file. For a file named "X", hardlinks are named "X.link.0", "X.link.1", ....'''
+    return ['{}.link.{}'.format(pointedfile, x) for x in range(num_links)]
+
+
+def link_ops(files, num_links):
+    '''Returns remote agent operations to make `num_links` hardlinks for every given file.'''
+    return [('link', pointedfile, name) for pointedfile in files for name in link_names(pointedfile, num_links)]
+
+
+def links_ops(paths, num_links, num_copies=0):
+    '''Returns remote agent operations to make `num_links` hardlinks for every given file, and for every file in given directories.
+    Directories are walked on the remote, so no file list is ever sent. If `num_copies` is set, also makes hardlinks for the first `num_copies` copies of every file.'''
+    return [('links', path, num_links, num_copies) for path in paths]
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
 def link_single(connection, source_file, num_links=1, silent=False):
     '''Makes a hardlink to a file `num_links` times. For a file named "X", we generate hardlinks named "X.link.0", "X.link.1", ....
     Args:
         connection (remoto.Connection): Connection to remote to execute on.
-        source_file (str): Path to file to make hardlinks for.
+        source_file (str): Path to file to make hardlinks for. If this is a directory, makes hardlinks for every file inside.
         num_links (int): Amount of hardlinks to generate.
         silent (optional bool): If set, never prints. Otherwise, prints on error.'''
     if num_links > 0:
-        cmd = '''python3 -c "
-import itertools
-import os
-pointedloc = '{0}'
-for x in range({1}):
-    pointerloc = '{{}}.link.{{}}'.format(pointedloc, x)
-    if os.path.exists(pointerloc):
-        os.remove(pointerloc)
-    os.link(pointedloc, pointerloc)
-exit(0)
-"
-'''.format(source_file, num_links)
-        out, error, exitcode = remoto.process.check(connection, cmd, shell=True)
-        if exitcode != 0:
+        if not get_agent(connection).check(links_ops([source_file], num_links), silent=silent):
             if not silent:
-                printe('Could not add hardlinks for file: {}.\nReason: Out: {}\n\nError: {}'.format(source_file, '\n'.join(out), '\n'.join(error)))
+                printe('Could not add hardlinks for file: {}'.format(source_file))
             return False
     return True
 
 
-def link(connection, files=None, expression=None, num_links=1, silent=True):
+def link(connection, files=None, expression=None, num_links=1, silent=True, batch_size=10000):
     '''Provide hardlinks for multiple files. There are 2 ways to do this:
-     1. Specify the files to link for. If using hundredthousands of files, the command here will become quite inflated in size.
+     1. Specify the files to link for. Files are streamed to the remote agent in batches of `batch_size`, so memory use stays bounded. Directories are walked on the remote.
      2. Use an expression. The filenames are then generated at the side of the destination, which means no inflation here.
      Args:
         connection (remoto.Connection): Connection to remote to execute on.
@@ -40,6 +56,7 @@ def link(connection, files=None, expression=None, num_links=1, silent=True):
         expression (optional str): If set, uses provided expression as file sources. Expression must set a 'files' variable to an iterable.
         num_links (optional int): Amount of links to generate.
         silent (optional bool): If set, never prints. Otherwise, prints on error.
+        batch_size (optional int): Amount of files to send to the remote agent per round trip.
 
     Returns:
         `True` on success, `False` on failure.'''
@@ -48,7 +65,13 @@ def link(connection, files=None, expression=None, num_links=1, silent=True):
 
     if num_links > 0:
         if files:
-            expression = 'files = ['+ ','.join("'{}'".format(file) for file in files) + ']'
+            agent = get_agent(connection)
+            for batch in _batches(files, batch_size):
+                if not agent.check(links_ops(batch, num_links), silent=silent):
+                    if not silent:
+                        printe('Could not add hardlinks for batch of {} files, starting at: {}'.format(len(batch), batch[0]))
+                    return False
+            return True
         cmd = '''python3 -c "
 import itertools
 import os
@@ -0,0 +1,212 @@
+import concurrent.futures
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+from data_deploy.internal.remoto.agent import get_agent
+import data_deploy.shared.store as _store
+import data_deploy.internal.transfer.rsync as rsync
+import data_deploy.internal.util.fs as fs
+import data_deploy.internal.util.location as loc
+from data_deploy.internal.util.printer import *
+
+
+'''Manifest-based incremental deployment.
+A manifest maps every deployed file (relative to the destination directory) to its size, modification time and content hash.
+We keep one manifest per node, stored next to the deployed data. By comparing the local dataset with it, we only send missing or changed files, and remove stale ones.'''
+
+
+# Name of the manifest file, stored in the remote destination directory.
+manifest_name = '.data-deploy.manifest'
+
+
+def _hash_cache_path():
+    return fs.join(loc.cache_dir(), 'hashes.json')
+
+
+def _load_hash_cache():
+    try:
+        with open(_hash_cache_path(), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        return dict()
+
+
+def _store_hash_cache(cache):
+    fs.mkdir(loc.cache_dir(), exist_ok=True)
+    tmp = _hash_cache_path()+'.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(cache, f)
+    os.replace(tmp, _hash_cache_path())
+
+
+def hash_file(path, blocksize=1024*1024):
+    '''Computes the content hash for a local file.'''
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(blocksize)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+
+def _walk(path):
+    '''Generates `(relative_path, absolute_path, os.stat_result)` for every file found in given path. Relative paths start with the basename of `path`. Symlinks are followed, like `rsync -L` does.'''
+    path = os.path.abspath(path)
+    base = fs.basename(path)
+    if fs.isfile(path):
+        yield base, path, os.stat(path)
+        return
+    for root, dirs, files in os.walk(path, followlinks=True):
+        rel_root = base if root == path else fs.join(base, os.path.relpath(root, path))
+        for name in files:
+            full = fs.join(root, name)
+            try:
+                yield fs.join(rel_root, name), full, os.stat(full)
+            except FileNotFoundError as e: # Dangling symlink.
+                continue
+
+
+def scan(paths, threads=None, silent=False):
+    '''Builds a manifest for given local paths. File hashes are cached locally, keyed by path, size and modification time, so rescanning an unchanged dataset is cheap.
+    Args:
+        paths (iterable(str)): Local files or directories to scan.
+        threads (optional int): Number of threads to use for hashing. Defaults to the number of cpus.
+        silent (optional bool): If set, does not print so much.
+
+    Returns:
+        `dict(str, list)`, mapping relative paths to `[size, mtime, hash]`. Also returns the mapping of relative paths to absolute local paths.'''
+    cache = _load_hash_cache()
+    cache_lock = threading.Lock()
+    entries = dict()
+    sources = dict()
+    to_hash = []
+    for path in paths:
+        for rel, full, stat in _walk(path):
+            sources[rel] = full
+            cached = cache.get(full)
+            if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+                entries[rel] = [stat.st_size, int(stat.st_mtime), cached[2]]
+            else:
+                to_hash.append((rel, full, stat))
+
+    if any(to_hash):
+        if not silent:
+            print('Hashing {} new or changed local files...'.format(len(to_hash)))
+        def _hash(rel, full, stat):
+            digest = hash_file(full)
+            with cache_lock:
+                cache[full] = [stat.st_size, stat.st_mtime_ns, digest]
+            entries[rel] = [stat.st_size, int(stat.st_mtime), digest]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=threads or os.cpu_count() or 1) as executor:
+            for x in [executor.submit(_hash, *item) for item in to_hash]:
+                x.result()
+        _store_hash_cache(cache)
+    return entries, sources
+
+
+def fetch(connection, dest, silent=False):
+    '''Fetches the manifest of a remote node. Only entries of which the remote file still exists with the recorded size and modification time are returned.
+    Args:
+        connection (remoto.Connection): Connection to remote to execute on.
+        dest (str): Remote destination directory.
+        silent (optional bool): If set, never prints. Otherwise, prints on error.
+
+    Returns:
+        `dict(str, list)` manifest on success (empty if the remote has no manifest), `None` on failure.'''
+    success, results = get_agent(connection).run([('read_manifest', dest, manifest_name)], silent=silent)
+    if not success:
+        if not silent:
+            printe('Could not fetch remote manifest.')
+        return None
+    return results[0][0][1]
+
+
+def diff(local, remote):
+    '''Compares a local manifest with a remote manifest.
+    Returns:
+        `(list(str), list(str))`: relative paths that must be sent (missing or changed on the remote), and relative paths that are stale on the remote.'''
+    send = [rel for rel, entry in local.items() if remote.get(rel) != entry]
+    stale = [rel for rel in remote.keys() if not rel in local]
+    return send, stale
+
+
+def commit(wrapper, hostname, dest, local, transport=rsync, silent=False):
+    '''Stores given manifest on a remote, and removes all files listed in the previous remote manifest which are not in given manifest, with the files the multipliers generated for them.
+    Args:
+        wrapper (RemotoSSHWrapper): Wrapper for the remote.
+        hostname (str): Hostname of the remote.
+        dest (str): Remote destination directory.
+        local (dict(str, list)): Manifest describing the deployed data.
+        transport (optional module): Transport to send the manifest with. See `data_deploy.internal.transfer.transport`.
+        silent (optional bool): If set, never prints. Otherwise, prints on error.
+
+    Returns:
+        `True` on success, `False` on failure.'''
+    with tempfile.TemporaryDirectory() as tmpdir:
+        rel = manifest_name+'.new'
+        with open(fs.join(tmpdir, rel), 'w') as f:
+            json.dump(local, f)
+        if not transport.transfer_files(wrapper, hostname, {rel: fs.join(tmpdir, rel)}, [rel], dest, silent=silent):
+            if not silent:
+                printe('Could not send manifest to {}'.format(hostname))
+            return False
+
+    if not get_agent(wrapper.connection).check([('commit_manifest', dest, manifest_name)], silent=silent):
+        if not silent:
+            printe('Could not commit manifest on {}'.format(hostname))
+        return False
+    return True
+
+
+def deploy(wrapper, hostname, local, sources, dest, transport=rsync, compression=None, options=None, unlink=False, store=None, silent=False, report=None, node=None):
+    '''Incrementally deploys data to a remote: Sends only missing or changed files, and removes stale ones.
+    Args:
+        wrapper (RemotoSSHWrapper): Wrapper for the remote.
+        hostname (str): Hostname of the remote.
+        local (dict(str, list)): Local manifest, as generated by `scan()`.
+        sources (dict(str, str)): Maps relative paths to absolute local paths, as generated by `scan()`.
+        dest (str): Remote destination directory.
+        transport (optional module): Transport to send files with. See `data_deploy.internal.transfer.transport`.
+        compression (optional CompressionPolicy): If set, compresses changed files adaptively while sending.
+        options (optional dict): Extra keyword arguments for the transport, when sending changed files.
+        unlink (optional bool): If set, removes changed files on the remote before sending them, instead of letting the transport overwrite them. Needed when remote files may be hardlinks to data which must not change.
+        store (optional str): If set, uses the content-addressed store in this remote directory: files the store holds are copied from it instead of sent, and sent files are added to it.
+        silent (optional bool): If set, does not print so much.
+        report (optional Report): If set, records time, bytes and files of sending changed files.
+        node (optional metareserve.Node): Node to record measurements for. Defaults to `hostname`.
+
+    Returns:
+        `True` on success, `False` on failure.'''
+    remote = fetch(wrapper.connection, dest, silent=silent)
+    if remote == None:
+        return False
+    send, stale = diff(local, remote)
+    changed = len(send)
+    if store and any(send):
+        send = _store.materialize(wrapper.connection, store, dest, local, send, silent=silent)
+        if send == None:
+            return False
+    if not silent:
+        print('{}: {} files to send{}, {} stale files to remove, {} files unchanged.'.format(hostname, len(send), ', {} files copied from store'.format(changed-len(send)) if store else '', len(stale), len(local)-changed))
+    if unlink and any(send) and not get_agent(wrapper.connection).check([('rm', fs.join(dest, rel)) for rel in send], silent=silent):
+        if not silent:
+            printe('Could not remove changed files on {}'.format(hostname))
+        return False
+    sent = True
+    if any(send):
+        if report != None:
+            sent = report.timed('transfer', node or hostname, transport.transfer_files, wrapper, hostname, sources, send, dest, compression=compression, silent=silent, bytes=sum(local[rel][0] for rel in send), files=len(send), **(options or dict()))
+        else:
+            sent = transport.transfer_files(wrapper, hostname, sources, send, dest, compression=compression, silent=silent, **(options or dict()))
+    if not sent:
+        if not silent:
+            printe('Could not transfer changed files to {}'.format(hostname))
+        return False
+    if store and not _store.ingest(wrapper.connection, store, dest, local, send, silent=silent):
+        return False
+    return commit(wrapper, hostname, dest, local, transport=transport, silent=silent)
\ No newline at end of file
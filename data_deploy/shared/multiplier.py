@@ -0,0 +1,87 @@
+import data_deploy.shared.copy
+import data_deploy.shared.link
+from data_deploy.internal.remoto.agent import get_agent
+from data_deploy.internal.util.printer import *
+
+
+def _apply_single(node, connection, paths_remote, copies_amount, links_amount, silent, report=None, prune=False):
+    '''Applies both multipliers on one node. Without `report`, needs a single round trip to the remote agent.
+    With `report`, every multiplier gets its own round trip, so we can measure them separately.
+    Returns:
+        `True` on success, `False` on failure, and a `dict` mapping every copy strategy used to the amount of copies made with it.'''
+    agent = get_agent(connection)
+    prune_phase = [('prune', path, copies_amount, links_amount) for path in paths_remote] if prune else None
+    copy_phase = data_deploy.shared.copy.copy_ops(paths_remote, copies_amount) if copies_amount > 0 else None
+    link_phase = data_deploy.shared.link.links_ops(paths_remote, links_amount, num_copies=copies_amount) if links_amount > 0 else None
+    if report == None:
+        success, results = agent.run(*[x for x in (prune_phase, copy_phase, link_phase) if x], silent=silent)
+        copy_idx = 1 if prune_phase else 0
+        copy_results = results[copy_idx] if copy_phase and len(results) > copy_idx else []
+        return success, data_deploy.shared.copy.copy_strategies(copy_results)
+
+    success, copy_results = True, []
+    if prune_phase:
+        success = agent.check(prune_phase, silent=silent)
+    if success and copy_phase:
+        with report.measure('copy_multiplier', node) as values:
+            success, results = agent.run(copy_phase, silent=silent)
+            copy_results = results[0] if any(results) else []
+            values['bytes'], values['files'] = data_deploy.shared.copy.copy_totals(copy_results)
+            values['success'] = success
+    if success and link_phase:
+        with report.measure('link_multiplier', node) as values:
+            success, results = agent.run(link_phase, silent=silent)
+            values['files'] = sum(x[1] for x in results[0] if x[0]) if any(results) else 0
+            values['success'] = success
+    return success, data_deploy.shared.copy.copy_strategies(copy_results)
+
+
+def apply(executor, wrappers, paths_remote, copy_multiplier, link_multiplier, silent=False, report=None, prune=False):
+    '''Applies the copy multiplier and then the link multiplier on all given nodes.
+    Args:
+        executor (concurrent.futures.Executor): Executor to submit work to.
+        wrappers (dict(metareserve.Node, RemotoSSHWrapper)): Connections to nodes to inflate data on.
+        paths_remote (list(str)): Remote paths to inflate. Directories are walked on the remote, inflating every file inside.
+        copy_multiplier (int): If set to a value X, makes the dataset X times larger by adding X-1 copies for every file.
+        link_multiplier (int): If set to a value X, makes the dataset X times larger by adding X-1 hardlinks for every file (including copies).
+        silent (optional bool): If set, does not print so much.
+        report (optional Report): If set, records time, bytes and files for both multipliers on every node.
+        prune (optional bool): If set, first removes files generated by the multipliers in earlier deployments, of which the source file no longer exists or which exceed the current multipliers.
+                               Needed for incremental deployments, which keep earlier data.
+
+    Returns:
+        `True` on success, `False` on failure.'''
+    copies_amount = max(1, copy_multiplier) - 1
+    links_amount = max(1, link_multiplier) - 1
+    if copies_amount == 0 and links_amount == 0 and not prune:
+        return True
+    futures_multiply = {node: executor.submit(_apply_single, node, wrapper.connection, paths_remote, copies_amount, links_amount, silent, report=report, prune=prune) for node, wrapper in wrappers.items()}
+    return _check_results(((node, future.result()) for node, future in futures_multiply.items()), copies_amount, silent)
+
+
+async def apply_async(engine, wrappers, paths_remote, copy_multiplier, link_multiplier, silent=False, report=None, prune=False):
+    '''Applies the copy multiplier and then the link multiplier on all given nodes, as a coroutine.
+    Args:
+        engine (Engine): Engine bounding the amount of concurrent remote calls.
+        others: See `apply()`.
+
+    Returns:
+        `True` on success, `False` on failure.'''
+    copies_amount = max(1, copy_multiplier) - 1
+    links_amount = max(1, link_multiplier) - 1
+    if copies_amount == 0 and links_amount == 0 and not prune:
+        return True
+    results = await engine.map(lambda item: engine.call(_apply_single, item[0], item[1].connection, paths_remote, copies_amount, links_amount, silent, report=report, prune=prune), wrappers.items())
+    return _check_results(zip(wrappers.keys(), results), copies_amount, silent)
+
+
+def _check_results(results, copies_amount, silent):
+    '''Checks results of `_apply_single()`, given as iterable of `(node, result)`, printing the copy strategies used. Returns `True` if all nodes succeeded, `False` otherwise.'''
+    for node, (success, strategies) in results:
+        if not success:
+            if not silent:
+                printe('Could not apply multipliers on node: {}'.format(node))
+            return False
+        if copies_amount > 0 and not silent:
+            print('Copy multiplier on node {}: {}'.format(node, data_deploy.shared.copy.format_strategies(strategies)))
+    return True
\ No newline at end of file
@@ -0,0 +1,144 @@
+import contextlib
+import json
+import threading
+import time
+
+
+'''Deployment reports. Plugins record wall time, bytes and files per stage (e.g. connecting, preparing destinations, transferring, applying multipliers) and per node.
+A `Report` evaluates to `True` if the deployment succeeded, so it can be used wherever a deployment result used to be a `bool`.'''
+
+
+def _node_key(node):
+    '''Returns a readable, stable name for a node.'''
+    if node == None:
+        return '*'
+    return str(getattr(node, 'ip_public', None) or node)
+
+
+def _mbps(num_bytes, seconds):
+    return round(num_bytes/seconds/(1000*1000), 3) if seconds > 0 else None
+
+
+class _Entry(object):
+    '''Aggregate of all measurements for one (stage, node) pair. Wall time runs from the first start to the last end, so parallel work is not counted twice.'''
+    def __init__(self):
+        self.start = None
+        self.end = None
+        self.bytes = 0
+        self.files = 0
+        self.failures = 0
+
+    def add(self, start, end, num_bytes, num_files, success):
+        self.start = start if self.start == None else min(self.start, start)
+        self.end = end if self.end == None else max(self.end, end)
+        self.bytes += num_bytes
+        self.files += num_files
+        self.failures += 0 if success else 1
+
+    @property
+    def seconds(self):
+        return (self.end - self.start) if self.start != None else 0
+
+    def to_dict(self):
+        return {'seconds': round(self.seconds, 6), 'bytes': self.bytes, 'files': self.files, 'mbps': _mbps(self.bytes, self.seconds), 'failures': self.failures}
+
+
+class Report(object):
+    '''Thread-safe collection of measurements for one deployment.'''
+    def __init__(self, plugin=None):
+        self.plugin = plugin
+        self.success = None
+        self._start = time.time()
+        self._end = None
+        self._lock = threading.Lock()
+        self._stages = dict() # Maps stage name to dict(node key, _Entry), in order of first use.
+
+
+    def __bool__(self):
+        return bool(self.success)
+
+
+    def record(self, stage, node, start, end, bytes=0, files=0, success=True):
+        '''Records a measurement.
+        Args:
+            stage (str): Name of the stage, e.g. "transfer".
+            node (any): Node the work was done for, or `None` for work not bound to a node.
+            start (float): Start time, as returned by `time.time()`.
+            end (float): End time, as returned by `time.time()`.
+            bytes (optional int): Amount of bytes moved.
+            files (optional int): Amount of files moved.
+            success (optional bool): Whether the work succeeded.'''
+        with self._lock:
+            self._stages.setdefault(stage, dict()).setdefault(_node_key(node), _Entry()).add(start, end, bytes, files, success)
+
+
+    @contextlib.contextmanager
+    def measure(self, stage, node=None, bytes=0, files=0):
+        '''Context manager measuring the wall time of its body. The yielded `dict` can be updated with keys "bytes", "files" and "success" inside the body.'''
+        values = {'bytes': bytes, 'files': files, 'success': True}
+        start = time.time()
+        try:
+            yield values
+        except Exception as e:
+            values['success'] = False
+            raise
+        finally:
+            self.record(stage, node, start, time.time(), bytes=values['bytes'], files=values['files'], success=values['success'])
+
+
+    def timed(self, stage, node, func, *args, bytes=0, files=0, **kwargs):
+        '''Calls `func(*args, **kwargs)` and records its wall time. The call counts as failed if it returns a value evaluating to `False`.
+        Returns:
+            Return value of `func`.'''
+        with self.measure(stage, node, bytes=bytes, files=files) as values:
+            result = func(*args, **kwargs)
+            values['success'] = bool(result)
+        return result
+
+
+    async def timed_async(self, stage, node, awaitable, bytes=0, files=0):
+        '''Awaits `awaitable` and records its wall time, like `timed()`.
+        Returns:
+            Result of `awaitable`.'''
+        with self.measure(stage, node, bytes=bytes, files=files) as values:
+            result = await awaitable
+            values['success'] = bool(result)
+        return result
+
+
+    def finish(self, success):
+        '''Marks the deployment as done.'''
+        self.success = bool(success)
+        self._end = time.time()
+
+
+    def to_dict(self):
+        '''Returns the report as a JSON-serializable `dict`.'''
+        with self._lock:
+            stages = dict()
+            for name, entries in self._stages.items():
+                total = _Entry()
+                for entry in entries.values():
+                    if entry.start != None:
+                        total.add(entry.start, entry.end, entry.bytes, entry.files, True)
+                    total.failures += entry.failures
+                stage = total.to_dict()
+                stage['nodes'] = {key: entry.to_dict() for key, entry in entries.items()}
+                stages[name] = stage
+        end = self._end or time.time()
+        return {'plugin': self.plugin, 'success': self.success, 'seconds': round(end-self._start, 6), 'stages': stages}
+
+
+    def write(self, path):
+        '''Writes the report as JSON to given path.'''
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=4)
+
+
+    def summary(self):
+        '''Returns a human-readable summary, with one line per stage and the slowest node of every stage.'''
+        lines = []
+        for name, stage in self.to_dict()['stages'].items():
+            slowest = max(stage['nodes'].items(), key=lambda x: x[1]['seconds'])
+            lines.append('{}: {:.2f}s, {} files, {} bytes{}. Slowest node: {} ({:.2f}s).'.format(name, stage['seconds'], stage['files'], stage['bytes'], ', {} MB/s'.format(stage['mbps']) if stage['mbps'] else '', slowest[0], slowest[1]['seconds']))
+        return '\n'.join(lines)
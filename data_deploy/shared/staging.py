@@ -0,0 +1,90 @@
+import data_deploy.shared.trash as trash
+from data_deploy.internal.remoto.agent import get_agent
+import data_deploy.internal.util.fs as fs
+from data_deploy.internal.util.printer import *
+
+
+'''Staged deployments. Data is deployed into a staging directory next to the destination, instead of into the destination itself.
+The staging directory is seeded with hardlinks to the previous version, so files which did not change are not sent again.
+Files which did change must be unlinked before writing them, because writing into a seeded hardlink would modify the previous version.
+When all nodes have received all data, every node swaps the staging directory into place with an atomic rename, and the previous version is deleted in the background.
+Until the swap, consumers keep reading the complete previous version. A failed deployment leaves the previous version untouched.'''
+
+
+def staging_dir(dest):
+    '''Returns the remote staging directory for a destination directory. It is placed next to the destination, so both are on the same filesystem.'''
+    return fs.join(fs.dirname(dest), '.{}.data-deploy-staging'.format(fs.basename(dest)))
+
+
+def prepare_ops(dest, fresh=True):
+    '''Returns remote agent phases to create a staging directory for `dest`, seeded from the current contents of `dest`.
+    Args:
+        dest (str): Remote destination directory.
+        fresh (optional bool): If set, discards a staging directory left by an earlier, interrupted deployment. Otherwise, continues with it.'''
+    staging = staging_dir(dest)
+    phases = [[('mkdir', dest)]]
+    if fresh:
+        phases.append(trash.trash_ops([staging]))
+    phases.append([('seed', dest, staging)])
+    return phases
+
+
+def swap_ops(dest):
+    '''Returns remote agent phases to swap the staging directory of `dest` into place, and to delete the previous version in the background.'''
+    staging = staging_dir(dest)
+    return [[('swap', staging, dest)], trash.trash_ops([staging])]
+
+
+def _run_phases(wrapper, phases, silent, report, stage, node):
+    '''Executes phases on a remote. Returns `True` if all phases succeeded, `False` otherwise, and whether the first phase succeeded.'''
+    if report == None:
+        success, results = get_agent(wrapper.connection).run(*phases, silent=silent)
+    else:
+        with report.measure(stage, node) as values:
+            success, results = get_agent(wrapper.connection).run(*phases, silent=silent)
+            values['success'] = success
+    return success, any(results) and all(x[0] for x in results[0])
+
+
+def _run(executor, wrappers, phases, stage, message, silent, report, done=None):
+    futures = {node: executor.submit(_run_phases, wrapper, phases, silent, report, stage, node) for node, wrapper in wrappers.items()}
+    success = True
+    for node, future in futures.items():
+        node_success, first_success = future.result()
+        if first_success and done:
+            done(node)
+        if not node_success:
+            if not silent:
+                printe('{}: {}'.format(message, node))
+            success = False
+    return success
+
+
+def prepare(executor, wrappers, dest, fresh=True, silent=False, report=None):
+    '''Creates a staging directory on all given nodes, seeded with hardlinks to the current contents of `dest`. Needs a single round trip per node.
+    Args:
+        executor (concurrent.futures.Executor): Executor to submit work to.
+        wrappers (dict(metareserve.Node, RemotoSSHWrapper)): Connections to nodes to prepare.
+        dest (str): Remote destination directory.
+        fresh (optional bool): If set, discards staging directories left by an earlier, interrupted deployment. Otherwise, continues with them.
+        silent (optional bool): If set, does not print so much.
+        report (optional Report): If set, records the time needed per node.
+
+    Returns:
+        `True` on success, `False` on failure.'''
+    return _run(executor, wrappers, prepare_ops(dest, fresh=fresh), 'prepare', 'Could not prepare staging directory on node', silent, report)
+
+
+def swap(executor, wrappers, dest, silent=False, report=None, done=None):
+    '''Swaps the staging directory into place on all given nodes. Call this only after all nodes received all data. Needs a single round trip per node.
+    Args:
+        executor (concurrent.futures.Executor): Executor to submit work to.
+        wrappers (dict(metareserve.Node, RemotoSSHWrapper)): Connections to nodes to swap on.
+        dest (str): Remote destination directory.
+        silent (optional bool): If set, does not print so much.
+        report (optional Report): If set, records the time needed per node.
+        done (optional callable): If set, called with every node on which the swap succeeded, even if removing the previous version failed. Swapping again on such a node would swap back to the previous version.
+
+    Returns:
+        `True` on success, `False` on failure.'''
+    return _run(executor, wrappers, swap_ops(dest), 'swap', 'Could not swap staged data into place on node', silent, report, done=done)
@@ -0,0 +1,58 @@
+from data_deploy.internal.remoto.agent import get_agent
+from data_deploy.internal.util.printer import *
+
+
+'''Node-local content-addressed stores. A store keeps a copy of every file deployed to a node, by content hash.
+Before sending files, we ask every node to materialize all files it already holds in its store, in one batched call. Only the remaining files are sent, and added to the store afterwards.
+Deploying the same files to another destination, or under another name, then costs no network traffic.
+Store objects and deployed files are separate files, made as reflinks on filesystems supporting them (e.g. XFS, Btrfs), so they share no disk space until either is written.
+Writing deployed files in place, and giving them other modification times, never affects the store. Objects modified outside of data-deploy are detected and discarded.
+Removing the store directory (e.g. with `data-deploy clean`) drops all objects. Deployed files stay intact.'''
+
+# Default remote store directory. Relative paths are relative to the remote home directory.
+default_dir = '.data-deploy-store'
+
+
+def materialize(connection, store, dest, local, rels, silent=False):
+    '''Copies files from a node's store into the destination directory.
+    Args:
+        connection (remoto.Connection): Connection to the node.
+        store (str): Remote store directory.
+        dest (str): Remote destination directory.
+        local (dict(str, list)): Local manifest, as generated by `manifest.scan()`.
+        rels (iterable(str)): Relative paths to materialize.
+        silent (optional bool): If set, does not print so much.
+
+    Returns:
+        list of relative paths the store does not hold, which must be sent. `None` on failure.'''
+    entries = [[rel, local[rel][2], local[rel][0], local[rel][1]] for rel in rels]
+    if not any(entries):
+        return []
+    success, results = get_agent(connection).run([('materialize', store, dest, entries)], silent=silent)
+    if not success:
+        if not silent:
+            printe('Could not materialize files from store {}'.format(store))
+        return None
+    return results[0][0][1]
+
+
+def ingest(connection, store, dest, local, rels, silent=False):
+    '''Adds deployed files to a node's store.
+    Args:
+        connection (remoto.Connection): Connection to the node.
+        store (str): Remote store directory.
+        dest (str): Remote destination directory.
+        local (dict(str, list)): Local manifest, as generated by `manifest.scan()`.
+        rels (iterable(str)): Relative paths of deployed files to add.
+        silent (optional bool): If set, does not print so much.
+
+    Returns:
+        `True` on success, `False` on failure.'''
+    entries = [[rel, local[rel][2]] for rel in rels]
+    if not any(entries):
+        return True
+    if not get_agent(connection).check([('ingest', store, dest, entries)], silent=silent):
+        if not silent:
+            printe('Could not add files to store {}'.format(store))
+        return False
+    return True
@@ -0,0 +1,131 @@
+import ipaddress
+
+from data_deploy.internal.remoto.agent import get_agent
+from data_deploy.internal.util.printer import *
+
+
+'''Topology-aware relay planning. Nodes are grouped by location (e.g. rack or subnet), and every group gets one relay.
+Data crosses the link between groups once, to the relay, after which the relay sends it to all other nodes in its group.
+Groups can be formed from reservation metadata (a key in `node.extra_info`), from subnet prefixes, or from round trip times measured from a probe node.
+Grouping by metadata or subnet is exact. Grouping by round trip time only tells apart nodes at clearly different distances from the probe, so it is a fallback for reservations without metadata.'''
+
+# Ways to group nodes.
+methods = ['none', 'key', 'subnet', 'rtt']
+
+# Smallest difference in round trip time between groups, in seconds. Smaller differences are measurement noise.
+_rtt_slack = 0.0002
+
+
+def _ip(node):
+    '''Returns the ip nodes use to reach each other, which is the local ip if the node has one.'''
+    return node.ip_local or node.ip_public
+
+
+def _sorted_groups(groups):
+    groups = [sorted(x, key=lambda node: node.ip_public) for x in groups if any(x)]
+    return sorted(groups, key=lambda x: x[0].ip_public)
+
+
+def group_by_key(nodes, key):
+    '''Groups nodes by the value of `node.extra_info[key]`. Nodes without the key form one group together.'''
+    groups = dict()
+    for node in nodes:
+        groups.setdefault(node.extra_info.get(key), []).append(node)
+    return _sorted_groups(groups.values())
+
+
+def group_by_subnet(nodes, prefix=24):
+    '''Groups nodes by subnet, using the first `prefix` bits of their ips.'''
+    groups = dict()
+    for node in nodes:
+        address = ipaddress.ip_address(_ip(node))
+        groups.setdefault(ipaddress.ip_network('{}/{}'.format(address, min(prefix, address.max_prefixlen)), strict=False), []).append(node)
+    return _sorted_groups(groups.values())
+
+
+def measure_rtts(connection, hostnames, port=22, samples=3):
+    '''Measures round trip times from a remote to other hosts, by timing TCP connection setup. Uses the remote agent, so it needs a single round trip to the remote.
+    Args:
+        connection (remoto.Connection): Connection to the remote to measure from.
+        hostnames (iterable(str)): Hosts to measure to.
+        port (optional int): Port to connect to on every host.
+        samples (optional int): Amount of measurements per host. The lowest is used.
+
+    Returns:
+        dict mapping hostnames to round trip times in seconds, or `None` for unreachable hosts. `None` on failure.'''
+    success, results = get_agent(connection).run([('rtts', list(hostnames), port, samples)])
+    if not success:
+        printe('Could not measure round trip times.')
+        return None
+    return results[0][0][1]
+
+
+def group_by_rtt(nodes, rtts, ratio=1.5):
+    '''Groups nodes by round trip time. Nodes are sorted by round trip time, and a new group starts wherever it grows by more than `ratio` times.
+    Args:
+        nodes (iterable(metareserve.Node)): Nodes to group.
+        rtts (dict(str, float)): Round trip times per hostname, as returned by `measure_rtts()`. Unreachable nodes form one group together.
+        ratio (optional float): Minimal growth factor between groups.
+
+    Returns:
+        list of groups.'''
+    measured = sorted((x for x in nodes if rtts.get(x.hostname) != None), key=lambda x: rtts[x.hostname])
+    groups, previous = [], None
+    for node in measured:
+        rtt = rtts[node.hostname]
+        if previous == None or rtt > previous*ratio + _rtt_slack:
+            groups.append([])
+        groups[-1].append(node)
+        previous = rtt
+    groups.append([x for x in nodes if rtts.get(x.hostname) == None])
+    return _sorted_groups(groups)
+
+
+def group(nodes, method='none', key=None, prefix=24, probe=None, silent=False):
+    '''Groups nodes by topology.
+    Args:
+        nodes (iterable(metareserve.Node)): Nodes to group.
+        method (optional str): One of `methods`. With "none", all nodes form one group.
+        key (optional str): `node.extra_info` key to group by, for method "key".
+        prefix (optional int): Subnet prefix length, for method "subnet".
+        probe (optional remoto.Connection): Connection to the node to measure round trip times from, for method "rtt".
+        silent (optional bool): If set, does not print so much.
+
+    Returns:
+        list of groups, every group a list of nodes. Groups and nodes are sorted by public ip. `None` on failure.'''
+    nodes = list(nodes)
+    if method == 'none':
+        groups = _sorted_groups([nodes])
+    elif method == 'key':
+        groups = group_by_key(nodes, key)
+    elif method == 'subnet':
+        groups = group_by_subnet(nodes, prefix=prefix)
+    elif method == 'rtt':
+        rtts = measure_rtts(probe, [x.hostname for x in nodes])
+        if rtts == None:
+            return None
+        groups = group_by_rtt(nodes, rtts)
+    else:
+        raise ValueError('Unknown grouping method "{}". Options: {}'.format(method, ', '.join(methods)))
+    if not silent and method != 'none':
+        print('Grouped {} nodes by {} into {} group(s) of sizes {}.'.format(len(nodes), method, len(groups), ', '.join(str(len(x)) for x in groups)))
+    return groups
+
+
+def pick_relays(groups, admin):
+    '''Picks one relay per group. The admin relays for its own group, and the node with the lowest public ip relays for every other group.
+    Args:
+        groups (list(list(metareserve.Node))): Groups, as returned by `group()`.
+        admin (metareserve.Node): Node receiving data from the local machine.
+
+    Returns:
+        list of `(relay, members)`, with `members` the other nodes of the relay's group. The admin's group comes first.'''
+    plan = []
+    for nodes in groups:
+        relay = admin if admin in nodes else nodes[0]
+        entry = (relay, [x for x in nodes if x != relay])
+        if relay == admin:
+            plan.insert(0, entry)
+        else:
+            plan.append(entry)
+    return plan
@@ -0,0 +1,43 @@
+import data_deploy.internal.remoto.modules.purge as purge
+import data_deploy.internal.util.fs as fs
+
+
+'''Instant removal of remote data. Paths are renamed into a trash directory on the same filesystem, which takes a single metadata operation per path, no matter how many files they hold.
+A detached purger on the remote then deletes the trash in parallel, with low CPU and I/O priority, so removing old data never blocks the next deployment.
+Paths which cannot be renamed into their trash directory (e.g. because we may not write its parent directory) are moved into a trash directory right next to them instead, or removed in place as a last resort.'''
+
+# Name of trash directories. Trash directories are created next to the removed paths.
+trash_name = '.data-deploy-trash'
+
+_purger_source = None
+
+
+def _purger():
+    global _purger_source
+    if _purger_source == None:
+        with open(purge.__file__, 'r') as f:
+            _purger_source = f.read()
+    return _purger_source
+
+
+def trash_dir(path):
+    '''Returns the trash directory for a remote path. For paths with wildcards, it is placed next to the deepest directory without wildcards, otherwise next to the path itself.
+    This way, it is on the same filesystem as the removed data in most cases, and never inside a directory being emptied.'''
+    static = []
+    for part in path.rstrip('/').split('/'):
+        if any(x in part for x in '*?['):
+            break
+        static.append(part)
+    return fs.join(fs.dirname('/'.join(static) or '/'), trash_name)
+
+
+def trash_ops(paths, directory=None, workers=None):
+    '''Returns remote agent operations to trash given paths and delete them in the background. All operations may execute in one phase.
+    Args:
+        paths (iterable(str)): Remote paths to remove. Wildcards are expanded on the remote.
+        directory (optional str): Trash directory to use for all paths. Defaults to the trash directory of every path (see `trash_dir()`).
+        workers (optional int): Amount of threads the purgers delete with. Defaults to a value fitting the remote machine.
+
+    Returns:
+        list of operations.'''
+    return [('trash', path, directory or trash_dir(path), _purger(), workers) for path in paths]
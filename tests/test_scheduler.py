@@ -0,0 +1,97 @@
+import threading
+import time
+
+import pytest
+
+from data_deploy.internal.transfer.scheduler import TransferScheduler
+
+
+class _Tracker(object):
+    '''Records the highest amount of concurrently running tasks, globally and per key.'''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.running = dict()
+        self.peaks = dict()
+
+    def task(self, keys, result=True, duration=0.02):
+        with self._lock:
+            for key in keys:
+                self.running[key] = self.running.get(key, 0) + 1
+                self.peaks[key] = max(self.peaks.get(key, 0), self.running[key])
+        time.sleep(duration)
+        with self._lock:
+            for key in keys:
+                self.running[key] -= 1
+        return result
+
+
+def test_invalid_caps():
+    with pytest.raises(ValueError):
+        TransferScheduler(max_total=0)
+    with pytest.raises(ValueError):
+        TransferScheduler(max_per_node=0)
+
+
+def test_empty():
+    assert TransferScheduler().run() == []
+
+
+def test_caps_enforced():
+    tracker = _Tracker()
+    scheduler = TransferScheduler(max_total=5, max_per_node=2, max_per_disk=3)
+    for x in range(40):
+        node, disk = 'node{}'.format(x % 4), 'disk{}'.format(x % 2)
+        scheduler.add(tracker.task, node, 0, disk, ['total', node, disk])
+    assert scheduler.run() == [True]*40
+    assert tracker.peaks['total'] <= 5
+    assert all(tracker.peaks['node{}'.format(x)] <= 2 for x in range(4))
+    assert all(tracker.peaks['disk{}'.format(x)] <= 3 for x in range(2))
+
+
+def test_largest_first():
+    order = []
+    scheduler = TransferScheduler(max_total=1)
+    for size in [1, 5, 3, 5]:
+        scheduler.add(lambda size, idx: order.append((size, idx)) or True, 'node', size, None, size, len(scheduler))
+    assert scheduler.run() == [True]*4
+    assert order == [(5, 1), (5, 3), (3, 2), (1, 0)]
+
+
+def test_retry_succeeds():
+    attempts = []
+    def flaky():
+        attempts.append(1)
+        return len(attempts) >= 3
+    scheduler = TransferScheduler(retries=2, backoff=0.0)
+    scheduler.add(flaky, 'node')
+    assert scheduler.run() == [True]
+    assert len(attempts) == 3
+
+
+def test_retry_exhausted():
+    attempts = []
+    def failing():
+        attempts.append(1)
+        raise RuntimeError('connection reset')
+    scheduler = TransferScheduler(retries=2, backoff=0.0)
+    scheduler.add(failing, 'node')
+    assert scheduler.run() == [False]
+    assert len(attempts) == 3
+
+
+def test_stop_on_error():
+    started = []
+    scheduler = TransferScheduler(max_total=1)
+    scheduler.add(lambda: started.append(0) or False, 'node', 10)
+    for x in range(1, 4):
+        scheduler.add(lambda x: started.append(x) or True, 'node', 0, None, x)
+    assert scheduler.run(stop_on_error=True) == [False, None, None, None]
+    assert started == [0]
+
+
+def test_continue_on_error():
+    scheduler = TransferScheduler(max_total=1)
+    scheduler.add(lambda: False, 'node', 10)
+    for x in range(3):
+        scheduler.add(lambda: True, 'node')
+    assert scheduler.run(stop_on_error=False) == [False, True, True, True]
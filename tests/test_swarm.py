@@ -0,0 +1,64 @@
+import asyncio
+
+from data_deploy.internal.transfer.swarm import SwarmScheduler
+
+
+class _Stub(object):
+    '''Stub transfers, recording concurrency and failing the first `fail` attempts of every (receiver, chunk) pair fetched from a node.'''
+    def __init__(self, fail=0, fail_seeds=False):
+        self.fail = fail
+        self.fail_seeds = fail_seeds
+        self.attempts = dict()
+        self.seeded = []
+        self.uploads = dict()
+        self.peak_uploads = dict()
+
+    async def seed(self, receiver, chunk):
+        await asyncio.sleep(0.001)
+        self.seeded.append(chunk)
+        return not self.fail_seeds
+
+    async def fetch(self, receiver, source, chunk):
+        self.uploads[source] = self.uploads.get(source, 0) + 1
+        self.peak_uploads[source] = max(self.peak_uploads.get(source, 0), self.uploads[source])
+        await asyncio.sleep(0.001)
+        self.uploads[source] -= 1
+        key = (receiver, chunk)
+        self.attempts[key] = self.attempts.get(key, 0) + 1
+        if self.attempts[key] <= self.fail:
+            raise ConnectionError('connection reset')
+        return True
+
+
+def test_complete():
+    stub = _Stub()
+    nodes = ['node{}'.format(x) for x in range(5)]
+    scheduler = SwarmScheduler(nodes, 8, seeds=1, max_uploads=2)
+    assert asyncio.run(scheduler.run(stub.seed, stub.fetch, silent=True))
+    assert all(scheduler.complete(x) and scheduler.bitmap(x) == b'\x01'*8 for x in nodes)
+    assert sorted(stub.seeded) == list(range(8)) # Every chunk seeded exactly once.
+    assert all(x <= 2 for x in stub.peak_uploads.values())
+
+
+def test_complete_with_failing_fetches():
+    stub = _Stub(fail=2)
+    nodes = ['node{}'.format(x) for x in range(4)]
+    scheduler = SwarmScheduler(nodes, 4, retries=2)
+    assert asyncio.run(scheduler.run(stub.seed, stub.fetch, silent=True))
+    assert all(scheduler.complete(x) for x in nodes)
+    assert all(x == 3 for x in stub.attempts.values())
+
+
+def test_retries_exhausted():
+    stub = _Stub(fail=3)
+    scheduler = SwarmScheduler(['node0', 'node1'], 2, retries=2)
+    assert not asyncio.run(scheduler.run(stub.seed, stub.fetch, silent=True))
+    assert not all(scheduler.complete(x) for x in ['node0', 'node1'])
+    assert max(stub.attempts.values()) == 3
+
+
+def test_seed_failures_exhausted():
+    stub = _Stub(fail_seeds=True)
+    scheduler = SwarmScheduler(['node0'], 1, retries=1)
+    assert not asyncio.run(scheduler.run(stub.seed, stub.fetch, silent=True))
+    assert stub.seeded == [0, 0]